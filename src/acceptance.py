@@ -0,0 +1,132 @@
+import json
+import os
+from typing import Any, Dict, List, Tuple
+import libcst as cst
+
+from candidates import normalize_type_annotation, remove_quotes
+from constants import TypeSlot, Predictions
+from evaluation import gather_all_type_slots
+
+
+def slot_name_pattern(slot: TypeSlot) -> str:
+    """
+    Returns the name pattern of a type slot that is shared between functions and files: the
+    parameter name, or the first word of the function name for return types (e.g. `return:get`).
+    """
+    name = slot[-1] if slot[-1] != "return" else slot[-2]
+    name = name.strip("_").lower()
+    if slot[-1] == "return":
+        return f"return:{name.split('_')[0]}"
+    return name
+
+
+class AcceptanceStatistics:
+    """
+    Keeps track of how often a candidate type annotation is accepted for a slot name pattern over a
+    project, so that candidates that are routinely rejected (e.g. `str` for `path` parameters) are
+    tried later in the next files.
+
+    The outcome of a finished search counts the accepted candidate of a slot as accepted and the
+    candidates ranked above it as rejected, as the search tried those first without finding a
+    combination with them. A slot that is left without a type annotation counts all of its
+    candidates as rejected.
+    """
+
+    def __init__(self) -> None:
+        # (slot name pattern, normalized candidate) -> [number of acceptances, number of tries]
+        self.statistics: Dict[Tuple[str, str], List[int]] = {}
+
+    def acceptance_rate(self, slot: TypeSlot, type_annotation: str) -> float:
+        key = (slot_name_pattern(slot), normalize_type_annotation(type_annotation))
+        accepted, tried = self.statistics.get(key, [0, 0])
+        # Laplace smoothing, so candidates without statistics get a neutral rate of 0.5
+        return (accepted + 1) / (tried + 2)
+
+    def _record(self, slot: TypeSlot, type_annotation: str, accepted: bool) -> None:
+        key = (slot_name_pattern(slot), normalize_type_annotation(type_annotation))
+        counts = self.statistics.setdefault(key, [0, 0])
+        counts[0] += int(accepted)
+        counts[1] += 1
+
+    def record_search_outcome(
+        self,
+        search_tree_layers: Dict[TypeSlot, Predictions],
+        source_code_tree: cst.Module,
+    ) -> None:
+        type_slots = gather_all_type_slots(source_code_tree)
+        for slot, predictions in search_tree_layers.items():
+            annotation = type_slots.get(slot)
+            # The empty candidate of the search tree leaves the slot unannotated
+            candidates = [
+                remove_quotes(prediction[0])
+                for prediction in predictions
+                if prediction[0] != ""
+            ]
+            if annotation is None:
+                for candidate in candidates:
+                    self._record(slot, candidate, False)
+                continue
+            normalized_annotation = normalize_type_annotation(annotation)
+            normalized_candidates = [
+                normalize_type_annotation(candidate) for candidate in candidates
+            ]
+            if normalized_annotation not in normalized_candidates:
+                continue
+
+            accepted_index = normalized_candidates.index(normalized_annotation)
+            for candidate in candidates[:accepted_index]:
+                self._record(slot, candidate, False)
+            self._record(slot, candidates[accepted_index], True)
+
+    def reorder_predictions(
+        self, search_tree_layers: Dict[TypeSlot, Predictions]
+    ) -> Dict[TypeSlot, Predictions]:
+        """
+        Weighs the probability of each prediction by its acceptance rate relative to the neutral
+        rate, rescaled so that the probabilities of a slot keep their sum, and sorts them again.
+        """
+        reordered_search_tree_layers = {}
+        for slot, predictions in search_tree_layers.items():
+            weighted_predictions = [
+                [
+                    type_annotation,
+                    probability * 2 * self.acceptance_rate(slot, type_annotation),
+                ]
+                for type_annotation, probability in predictions
+            ]
+            total_probability = sum(probability for _, probability in predictions)
+            total_weighted_probability = sum(
+                probability for _, probability in weighted_predictions
+            )
+            if total_weighted_probability > 0:
+                for prediction in weighted_predictions:
+                    prediction[1] *= total_probability / total_weighted_probability
+            reordered_search_tree_layers[slot] = sorted(
+                weighted_predictions, key=lambda prediction: -prediction[1]
+            )
+        return reordered_search_tree_layers
+
+    def to_json(self) -> List[List[Any]]:
+        return [
+            [pattern, candidate, accepted, tried]
+            for (pattern, candidate), (accepted, tried) in self.statistics.items()
+        ]
+
+    def load_json(self, statistics: List[List[Any]]) -> None:
+        for pattern, candidate, accepted, tried in statistics:
+            self.statistics[(pattern, candidate)] = [accepted, tried]
+
+
+def load_acceptance_statistics(statistics_file: str) -> AcceptanceStatistics:
+    acceptance_statistics = AcceptanceStatistics()
+    if os.path.exists(statistics_file):
+        with open(statistics_file, "r", encoding="utf-8") as f:
+            acceptance_statistics.load_json(json.load(f))
+    return acceptance_statistics
+
+
+def save_acceptance_statistics(
+    statistics_file: str, acceptance_statistics: AcceptanceStatistics
+) -> None:
+    with open(statistics_file, "w", encoding="utf-8") as f:
+        json.dump(acceptance_statistics.to_json(), f)
@@ -130,6 +130,19 @@ def insert_return_annotation(
     return modified_tree, transformer.updated_function_location
 
 
+def insert_annotations(
+    tree: cst.Module, annotations: Dict[Tuple[str, ...], str]
+) -> cst.Module:
+    for slot, annotation in annotations.items():
+        function, parameter_name = slot[:-1], slot[-1]
+        tree, _ = (
+            insert_return_annotation(tree, annotation, function)
+            if parameter_name == "return"
+            else insert_parameter_annotation(tree, annotation, function, parameter_name)
+        )
+    return tree
+
+
 class PyrightTypeAnnotationCollector(cst.CSTVisitor):
     def __init__(self) -> None:
         self.stack: List[Tuple[str, ...]] = []
@@ -357,3 +370,175 @@ class TypeSlotsVisitor(cst.CSTVisitor):
 
     def leave_FunctionDef(self, node: cst.FunctionDef) -> None:
         self.stack.pop()
+
+
+class CallGraphVisitor(cst.CSTVisitor):
+    """
+    Collects the names called inside each function. Calls inside inner functions are attributed to
+    the enclosing function, as inner functions are not searched.
+    """
+
+    def __init__(self) -> None:
+        self.stack: List[Tuple[str, ...]] = []
+        self.function_depth = 0
+        self.called_names: Dict[Tuple[str, ...], Set[str]] = {}
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> Optional[bool]:
+        if self.function_depth == 0:
+            self.stack.append(node.name.value)
+        return True
+
+    def leave_ClassDef(self, node: cst.ClassDef) -> None:
+        if self.function_depth == 0:
+            self.stack.pop()
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> Optional[bool]:
+        if self.function_depth == 0:
+            self.stack.append(node.name.value)
+            self.called_names.setdefault(tuple(self.stack), set())
+        self.function_depth += 1
+        return True
+
+    def leave_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.function_depth -= 1
+        if self.function_depth == 0:
+            self.stack.pop()
+
+    def visit_Call(self, node: cst.Call) -> Optional[bool]:
+        if self.function_depth == 0:
+            return True
+        if m.matches(node.func, m.Name()):
+            self.called_names[tuple(self.stack)].add(node.func.value)
+        elif m.matches(node.func, m.Attribute()):
+            self.called_names[tuple(self.stack)].add(node.func.attr.value)
+        return True
+
+
+class ReturnStatementsVisitor(cst.CSTVisitor):
+    """Checks whether a function body returns a value or yields, ignoring inner functions and classes."""
+
+    def __init__(self) -> None:
+        self.returns_value = False
+        self.yields = False
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> Optional[bool]:
+        return False
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> Optional[bool]:
+        return False
+
+    def visit_Lambda(self, node: cst.Lambda) -> Optional[bool]:
+        return False
+
+    def visit_Return(self, node: cst.Return) -> Optional[bool]:
+        if node.value is not None:
+            self.returns_value = True
+        return False
+
+    def visit_Yield(self, node: cst.Yield) -> Optional[bool]:
+        self.yields = True
+        return False
+
+
+class RuleBasedTypeSlotsVisitor(cst.CSTVisitor):
+    """
+    Collects the type annotations of available type slots that follow from the source code alone:
+    `__init__` methods and functions without a `return` statement return `None`, and parameters with
+    a literal default value have the type of that literal.
+    """
+
+    LITERAL_DEFAULT_TYPES = {
+        cst.Integer: "int",
+        cst.Float: "float",
+        cst.Imaginary: "complex",
+        cst.FormattedString: "str",
+    }
+
+    def __init__(self) -> None:
+        self.stack: List[Tuple[str, ...]] = []
+        self.annotations: Dict[Tuple[str, ...], str] = {}
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> Optional[bool]:
+        self.stack.append(node.name.value)
+        return True
+
+    def leave_ClassDef(self, node: cst.ClassDef) -> None:
+        self.stack.pop()
+
+    def _literal_default_type(self, default: cst.BaseExpression) -> str | None:
+        if m.matches(default, m.UnaryOperation(operator=m.Minus() | m.Plus())):
+            default = default.expression
+        if m.matches(default, m.Name("True") | m.Name("False")):
+            return "bool"
+        if isinstance(default, (cst.SimpleString, cst.ConcatenatedString)):
+            prefix = (
+                default.prefix
+                if isinstance(default, cst.SimpleString)
+                else default.left.prefix
+            )
+            return "bytes" if "b" in prefix.lower() else "str"
+        return self.LITERAL_DEFAULT_TYPES.get(type(default))
+
+    def _has_placeholder_body(self, node: cst.FunctionDef) -> bool:
+        # Bodies with only a docstring, `pass`, `...` or `raise` are meant to be overridden
+        statements = node.body.body
+        if isinstance(node.body, cst.IndentedBlock):
+            statements = [
+                small_statement
+                for statement in statements
+                for small_statement in (
+                    statement.body
+                    if isinstance(statement, cst.SimpleStatementLine)
+                    else [statement]
+                )
+            ]
+        return all(
+            m.matches(
+                statement,
+                m.Pass()
+                | m.Raise()
+                | m.Expr(
+                    value=m.Ellipsis() | m.SimpleString() | m.ConcatenatedString()
+                ),
+            )
+            for statement in statements
+        )
+
+    def _has_decorator(self, node: cst.FunctionDef, names: Set[str]) -> bool:
+        for decorator in node.decorators:
+            decorator_name = decorator.decorator
+            if isinstance(decorator_name, cst.Call):
+                decorator_name = decorator_name.func
+            if isinstance(decorator_name, cst.Attribute):
+                decorator_name = decorator_name.attr
+            if isinstance(decorator_name, cst.Name) and decorator_name.value in names:
+                return True
+        return False
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> Optional[bool]:
+        self.stack.append(node.name.value)
+        for param in node.params.params:
+            if param.name.value in ("self", "cls") or param.annotation is not None:
+                continue
+            if param.default is None:
+                continue
+            literal_type = self._literal_default_type(param.default)
+            if literal_type is not None:
+                self.annotations[tuple(self.stack) + (param.name.value,)] = literal_type
+
+        if node.returns is None and not self._has_decorator(
+            node, {"abstractmethod", "overload"}
+        ):
+            visitor = ReturnStatementsVisitor()
+            node.body.visit(visitor)
+            is_init_method = node.name.value == "__init__" and len(self.stack) > 1
+            if is_init_method or (
+                not visitor.returns_value
+                and not visitor.yields
+                and not self._has_placeholder_body(node)
+            ):
+                self.annotations[tuple(self.stack) + ("return",)] = "None"
+        return False
+
+    def leave_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.stack.pop()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+from colorama import Fore
+from libcst.metadata import CodeRange
+
+from client.async_lsp_client import AsyncLspClient
+from diagnostics import has_error_in_diagnostics
+from fake_editor import SHADOW_DOCUMENT_PREFIX, get_pyright_langserver_command
+from server_monitor import (
+    DIAGNOSTICS_TIMEOUT_SECONDS,
+    MAX_RESTART_ATTEMPTS,
+    PyrightTimeoutException,
+    kill_process_tree,
+)
+
+
+class AsyncBatchVerifier:
+    """
+    Verifies many versions of a file concurrently with its own pyright-langserver, driven by an asyncio
+    event loop in a background thread. Every version is checked in one of a pool of virtual documents;
+    a check waits for a free document, which bounds the number of checks in flight. Used like the
+    PyrightBatchVerifier, the verdicts follow the same rules as the editor. A server that does not send
+    diagnostics in time is restarted and the batch is checked again, like the editor does.
+    """
+
+    def __init__(
+        self,
+        root_uri: str,
+        batch_size: int = 4,
+        diagnostics_timeout: float = DIAGNOSTICS_TIMEOUT_SECONDS,
+        workspace_configuration: Dict[str, Any] | None = None,
+    ) -> None:
+        self.root_uri = root_uri
+        self.batch_size = batch_size
+        self.diagnostics_timeout = diagnostics_timeout
+        self.start_errors = set()
+        self.number_of_checks = 0
+        self.document_versions: Dict[str, int] = {}
+        self.free_documents: asyncio.Queue | None = None
+        # The pool of the current file, to reopen it after a restart
+        self.uris: List[str] = []
+        self.python_code = ""
+        self.number_of_restarts = 0
+        # Pyright requests the configuration right after it is initialized, before a caller could set it
+        self.workspace_configuration: Dict[str, Any] = (
+            workspace_configuration if workspace_configuration is not None else {}
+        )
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="async-batch", daemon=True
+        )
+        self.thread.start()
+        self.client = self._create_client()
+        self._run(self._start())
+
+    def _run(self, coroutine: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _create_client(self) -> AsyncLspClient:
+        return AsyncLspClient(
+            request_callbacks={
+                "workspace/configuration": self._handle_configuration_request
+            }
+        )
+
+    def _handle_configuration_request(self, params: Dict[str, Any]) -> List[Any]:
+        return [
+            self.workspace_configuration.get(item.get("section"))
+            for item in params["items"]
+        ]
+
+    async def _start(self) -> None:
+        await self.client.start(
+            get_pyright_langserver_command(),
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+        )
+        try:
+            await asyncio.wait_for(
+                self.client.initialize(
+                    {
+                        "processId": os.getpid(),
+                        "rootUri": self.root_uri,
+                        "capabilities": {
+                            "textDocument": {
+                                "synchronization": {"dynamicRegistration": True},
+                                "publishDiagnostics": {
+                                    "relatedInformation": True,
+                                    "versionSupport": True,
+                                },
+                            }
+                        },
+                        "workspaceFolders": [
+                            {"name": "py-hint-search", "uri": self.root_uri}
+                        ],
+                    },
+                ),
+                self.diagnostics_timeout,
+            )
+        except (asyncio.TimeoutError, ConnectionError):
+            raise PyrightTimeoutException(
+                f"No response to the initialize request within {self.diagnostics_timeout:.0f} seconds"
+            )
+
+    def open_file(self, file_path: str, python_code: str) -> None:
+        uri_file_path = (
+            file_path.lstrip("/") if file_path.startswith("/") else file_path
+        )
+        directory, file_name = f"file:///{uri_file_path}".rsplit("/", 1)
+        self.uris = [
+            f"{directory}/{SHADOW_DOCUMENT_PREFIX}{i}__{file_name}"
+            for i in range(self.batch_size)
+        ]
+        self.python_code = python_code
+        try:
+            self._run(self._open_documents(self.uris, python_code))
+        except PyrightTimeoutException as e:
+            # The restarted server reopens the documents
+            self.restart_server(e.message)
+
+    async def _close_documents(self) -> None:
+        for uri in self.document_versions:
+            await self.client.did_close(uri)
+        self.document_versions = {}
+
+    async def _open_documents(self, uris: List[str], python_code: str) -> None:
+        await self._close_documents()
+        self.free_documents = asyncio.Queue()
+        try:
+            all_diagnostics = await asyncio.gather(
+                *(
+                    self.client.did_open(uri, python_code, 1, self.diagnostics_timeout)
+                    for uri in uris
+                )
+            )
+        except (asyncio.TimeoutError, ConnectionError):
+            raise PyrightTimeoutException(
+                f"No diagnostics received within {self.diagnostics_timeout:.0f} seconds"
+            )
+        self.start_errors = set()
+        has_error_in_diagnostics(all_diagnostics[0], None, self.start_errors, True)
+        for uri in uris:
+            self.document_versions[uri] = 1
+            self.free_documents.put_nowait(uri)
+
+    async def _check(
+        self, python_code: str, modified_location: CodeRange | None
+    ) -> bool:
+        uri = await self.free_documents.get()
+        try:
+            self.document_versions[uri] += 1
+            diagnostics = await self.client.did_change(
+                uri,
+                self.document_versions[uri],
+                python_code,
+                self.diagnostics_timeout,
+            )
+        except (asyncio.TimeoutError, ConnectionError):
+            raise PyrightTimeoutException(
+                f"No diagnostics received within {self.diagnostics_timeout:.0f} seconds"
+            )
+        finally:
+            self.free_documents.put_nowait(uri)
+        return has_error_in_diagnostics(
+            diagnostics, modified_location, self.start_errors
+        )
+
+    async def _check_all(
+        self, changes: List[Tuple[str, CodeRange | None]]
+    ) -> List[bool]:
+        tasks = [
+            asyncio.create_task(self._check(python_code, modified_location))
+            for python_code, modified_location in changes
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            # The other checks of a failed batch must not return their documents to the pool later
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def check_in_parallel(
+        self, changes: List[Tuple[str, CodeRange | None]]
+    ) -> List[bool]:
+        self.number_of_checks += len(changes)
+        try:
+            return self._run(self._check_all(changes))
+        except PyrightTimeoutException as e:
+            self.restart_server(e.message)
+            return self._run(self._check_all(changes))
+
+    async def _restart(self) -> None:
+        if self.client.process is not None:
+            kill_process_tree(self.client.process.pid)
+            await self.client.process.wait()
+        if self.client.reader_task is not None:
+            await asyncio.gather(self.client.reader_task, return_exceptions=True)
+        self.client = self._create_client()
+        self.document_versions = {}
+        await self._start()
+        if len(self.uris) > 0:
+            await self._open_documents(self.uris, self.python_code)
+
+    def restart_server(self, reason: str) -> None:
+        """
+        Replaces the server by a new one and reopens the documents of the pool with the code of the
+        current file. A replacement that does not respond either is replaced again, up to
+        MAX_RESTART_ATTEMPTS times.
+        """
+        for _ in range(MAX_RESTART_ATTEMPTS):
+            print(f"{Fore.YELLOW}Restarting the async batch Pyright: {reason}")
+            logger = logging.getLogger("main")
+            logger.warning(f"Restarting the async batch Pyright: {reason}")
+            self.number_of_restarts += 1
+            try:
+                self._run(self._restart())
+                return
+            except PyrightTimeoutException as e:
+                reason = e.message
+        raise PyrightTimeoutException(
+            f"Pyright did not respond after {MAX_RESTART_ATTEMPTS} restarts: {reason}"
+        )
+
+    def stop(self) -> None:
+        self._run(self._close_documents())
+        self._run(self.client.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,84 @@
+import argparse
+import io
+import timeit
+import cattrs
+from lsprotocol import converters
+from lsprotocol.types import (
+    DidChangeTextDocumentParams,
+    TextDocumentContentChangeEvent_Type2,
+    VersionedTextDocumentIdentifier,
+)
+
+from client.json_rpc_endpoint import JsonRpcEndpoint
+from client.lsp_client import full_text_did_change_params
+
+URI = "file:///project/module.py"
+
+
+def did_change_with_converter(
+    converter: cattrs.Converter, version: int, text: str
+) -> dict:
+    params = DidChangeTextDocumentParams(
+        text_document=VersionedTextDocumentIdentifier(uri=URI, version=version),
+        content_changes=[TextDocumentContentChangeEvent_Type2(text=text)],
+    )
+    return converter.unstructure(params, DidChangeTextDocumentParams)
+
+
+def did_change_with_plain_dict(version: int, text: str) -> dict:
+    return full_text_did_change_params(URI, version, text)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure the cost per didChange notification of the lsprotocol converter and the plain-dict fast path"
+    )
+    parser.add_argument(
+        "--file",
+        type=str,
+        default=__file__,
+        help="The Python file that is sent as the document text.",
+    )
+    parser.add_argument(
+        "--number",
+        type=int,
+        default=10000,
+        help="The number of notifications per measurement.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    text = open(args.file, "r", encoding="utf-8").read()
+    converter = converters.get_converter()
+    assert did_change_with_converter(converter, 2, text) == did_change_with_plain_dict(
+        2, text
+    ), "The fast path must send exactly the same params as the converter"
+
+    endpoint = JsonRpcEndpoint(io.BytesIO(), io.BytesIO())
+
+    def send(params: dict) -> None:
+        endpoint.stdin.seek(0)
+        endpoint.write_message(
+            {"jsonrpc": "2.0", "method": "textDocument/didChange", "params": params}
+        )
+
+    measurements = {
+        "converter (params only)": lambda: did_change_with_converter(
+            converter, 2, text
+        ),
+        "plain dict (params only)": lambda: did_change_with_plain_dict(2, text),
+        "converter + framing": lambda: send(
+            did_change_with_converter(converter, 2, text)
+        ),
+        "plain dict + framing": lambda: send(did_change_with_plain_dict(2, text)),
+    }
+    print(f"Document of {len(text)} characters, {args.number} notifications")
+    for name, function in measurements.items():
+        seconds = min(timeit.repeat(function, number=args.number, repeat=5))
+        print(f"{name:<26} {seconds / args.number * 1e6:8.2f} µs per message")
+
+
+if __name__ == "__main__":
+    main()
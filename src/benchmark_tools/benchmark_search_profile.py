@@ -0,0 +1,129 @@
+import argparse
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from diagnostics import is_error_message
+from fake_editor import FakeEditor
+from search_profile import SEARCH_PROFILE_WORKSPACE_CONFIGURATION
+from main import create_pyright_config_file, remove_pyright_config_file
+
+
+def measure_profile(
+    project_path: str,
+    venv_path: str | None,
+    python_files: List[str],
+    number_of_checks: int,
+    search_profile: bool,
+) -> Dict[str, object]:
+    """
+    Checks every file a number of times with an unchanged text, like a search does for a rejected
+    candidate, and returns the latencies and the error messages that could reject an annotation.
+    """
+    create_pyright_config_file(project_path, venv_path, search_profile)
+    editor = FakeEditor.new_worker()
+    if search_profile:
+        editor.workspace_configuration = SEARCH_PROFILE_WORKSPACE_CONFIGURATION
+    project_uri_path = project_path.lstrip("/")
+    editor.start(f"file:///{project_uri_path}")
+
+    latencies = []
+    error_messages = {}
+    try:
+        for file_path in python_files:
+            editor.open_file(file_path)
+            for _ in range(number_of_checks):
+                start_time = time.perf_counter()
+                editor.change_file(editor.edit_document.text, None)
+                latencies.append(time.perf_counter() - start_time)
+            error_messages[file_path] = sorted(
+                (diagnostic["range"]["start"]["line"], diagnostic["message"])
+                for diagnostic in editor.diagnostics
+                if is_error_message(diagnostic["message"])
+            )
+            editor.close_file()
+    finally:
+        editor.stop()
+        remove_pyright_config_file(project_path)
+    return {"latencies": latencies, "error_messages": error_messages}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare the Pyright check latency of the default config and the search profile"
+    )
+
+    def dir_path(string):
+        if os.path.isdir(string):
+            return string
+        else:
+            raise NotADirectoryError(string)
+
+    parser.add_argument(
+        "--project-path",
+        type=dir_path,
+        help="The path to the project whose files are checked.",
+        required=True,
+    )
+    parser.add_argument(
+        "--venv-path",
+        type=dir_path,
+        default=None,
+        help="The path to the virtual environment of the project.",
+    )
+    parser.add_argument(
+        "--number-of-files",
+        type=int,
+        default=20,
+        help="The number of Python files of the project that are checked.",
+    )
+    parser.add_argument(
+        "--number-of-checks",
+        type=int,
+        default=10,
+        help="The number of checks per file.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    project_path = os.path.abspath(args.project_path)
+    python_files = []
+    for root, _, files in os.walk(project_path):
+        python_files += [os.path.join(root, f) for f in files if f.endswith(".py")]
+    python_files = sorted(python_files)[: args.number_of_files]
+
+    results = {
+        name: measure_profile(
+            project_path,
+            args.venv_path,
+            python_files,
+            args.number_of_checks,
+            search_profile,
+        )
+        for name, search_profile in [("default", False), ("search profile", True)]
+    }
+
+    for name, result in results.items():
+        latencies = result["latencies"]
+        print(
+            f"{name:<15} mean {statistics.mean(latencies) * 1000:8.2f} ms, "
+            + f"median {statistics.median(latencies) * 1000:8.2f} ms per check"
+        )
+    different_files = [
+        file_path
+        for file_path in python_files
+        if results["default"]["error_messages"][file_path]
+        != results["search profile"]["error_messages"][file_path]
+    ]
+    print(
+        f"Files with different rejecting errors: {len(different_files)} of {len(python_files)}"
+    )
+    for file_path in different_files:
+        print(f"  {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,9 @@ def create_evaluation_csv_file(output_file) -> None:
         "# common annotations returns (all)",
         "# rare annotations parameters (all)",
         "# rare annotations returns (all)",
+        "# Pyright checks ML search",
+        "# Pyright checks per accepted ML search slot",
+        "# pruned Pyright checks ML search",
     ]
     with open(
         output_file,
@@ -0,0 +1,97 @@
+import os
+import argparse
+import pandas as pd
+import numpy as np
+
+
+PYRIGHT_CHECKS_COLUMN = "# Pyright checks ML search"
+ACCEPTED_ML_SLOTS_COLUMN = "# extra ML search annotations"
+
+
+def main(project_path: str, all_or_project: str, postfixes: list[str]) -> None:
+    rows = {}
+    for postfix in postfixes:
+        filename = (
+            f"all-evaluation-statistics-{postfix}.csv"
+            if all_or_project == "all"
+            else f"evaluation-statistics-{postfix}.csv"
+        )
+        csv_location = os.path.join(project_path, filename)
+        if not os.path.isfile(csv_location):
+            print(f"{filename} not found. Skipping...")
+            continue
+
+        df = pd.read_csv(csv_location)
+        if PYRIGHT_CHECKS_COLUMN not in df.columns:
+            print(
+                f"{filename} was created before Pyright checks were recorded. Skipping..."
+            )
+            continue
+
+        # Replace all "-" values with NaN and only keep the rows where the ML search happened.
+        df = df.replace("-", np.nan)
+        df = df[df[PYRIGHT_CHECKS_COLUMN].notnull()]
+        pyright_checks = df[PYRIGHT_CHECKS_COLUMN].astype(float)
+        accepted_ml_slots = df[ACCEPTED_ML_SLOTS_COLUMN].astype(float)
+
+        # fmt: off
+        rows[postfix] = {
+            "# files": df.shape[0],
+            "Sum - # Pyright checks": pyright_checks.sum(),
+            "Sum - # accepted ML search slots": accepted_ml_slots.sum(),
+            "Pyright checks per accepted slot": pyright_checks.sum() / accepted_ml_slots.sum(),
+            "Mean - # Pyright checks": pyright_checks.mean(),
+            "Sum - ML search time (s)": df["ML search time (s)"].astype(float).sum(),
+        }
+        # fmt: on
+
+    table = pd.DataFrame(rows).T.round(2)
+    print(table)
+
+
+def parse_arguments(project) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare the number of Pyright checks per accepted type slot between top-n settings."
+    )
+
+    def dir_path(string: str) -> str:
+        if os.path.isdir(string):
+            return string
+        else:
+            raise NotADirectoryError(string)
+
+    if project == "all":
+        parser.add_argument(
+            "--project-path",
+            type=dir_path,
+            default=os.getcwd(),
+            help="The path to the evaluation statistics CSVs.",
+        )
+    else:
+        parser.add_argument(
+            "--project-path",
+            type=dir_path,
+            default=os.path.join(
+                os.getcwd(), project, "logs-evaluation/fully-annotated"
+            ),
+            help="The path to the evaluation statistics CSVs.",
+        )
+    parser.add_argument(
+        "--postfixes",
+        nargs="+",
+        default=["top1", "top3", "top5", "top5-adaptive"],
+        help="The postfixes of the evaluation statistics CSVs to compare.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    while True:
+        all_or_project = input("Enter a value 'all' or project name): ")
+        if all_or_project in ["all"] + os.listdir("."):
+            break
+        print("Invalid input. Please enter 'all' or a project name: ")
+
+    args = parse_arguments(all_or_project)
+    main(args.project_path, all_or_project, args.postfixes)
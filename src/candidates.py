@@ -0,0 +1,149 @@
+import ast
+import logging
+import os
+import re
+from typing import Dict, Tuple
+import libcst as cst
+
+from constants import TypeSlot, Predictions
+from imports import ImportPlan, plan_imports_for_type_annotation
+from type_check import normalize_type, parse_type_from_ast, remove_type_namespace
+
+
+def remove_quotes(type_annotation: str) -> str:
+    # Type4Py sometimes returns type annotations with quotes which breaks some stuff, so must be removed
+    if '"' in type_annotation or "'" in type_annotation:
+        type_annotation = re.sub(r"[\"']", "", type_annotation)
+    return type_annotation
+
+
+def strip_module_prefixes(type_annotation: str) -> str:
+    if "." in type_annotation and "[" in type_annotation:
+        type_annotations_to_strip = list(
+            filter(None, re.split(r"\[|\]|,\s*", type_annotation))
+        )
+        for annotation in type_annotations_to_strip:
+            if "." in annotation and not "..." in annotation:
+                annotation_stripped = annotation.rsplit(".", 1)[1]
+                type_annotation = type_annotation.replace(
+                    annotation, annotation_stripped
+                )
+
+    if "." in type_annotation and not "..." in type_annotation:
+        type_annotation = type_annotation.rsplit(".", 1)[1]
+    return type_annotation
+
+
+# Modules whose names are imported by the search without their prefix
+STRIPPED_MODULE_PREFIXES = {"typing", "typing_extensions", "builtins"}
+
+
+def _is_project_class(
+    module: str, name: str, all_project_classes: Dict[str, str]
+) -> bool:
+    if name not in all_project_classes:
+        return False
+    module_path = os.path.normpath(all_project_classes[name]).removesuffix(".py")
+    module_path = module_path.removesuffix(f"{os.sep}__init__")
+    module_names = module.split(".")
+    return module_path.split(os.sep)[-len(module_names) :] == module_names
+
+
+class _NameNormalizer(ast.NodeTransformer):
+    """
+    Turns the names that must not be merged by the type normalization into single names: literals
+    keep their values, and module prefixes are only removed when they resolve to the same class.
+    """
+
+    def __init__(self, all_project_classes: Dict[str, str]) -> None:
+        self.all_project_classes = all_project_classes
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        if ast.unparse(node.value).rsplit(".", 1)[-1] == "Literal":
+            values = (
+                node.slice.elts if isinstance(node.slice, ast.Tuple) else [node.slice]
+            )
+            return ast.Name(id=f"Literal[{', '.join(map(ast.unparse, values))}]")
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+        module, name = ast.unparse(node).rsplit(".", 1)
+        if module in STRIPPED_MODULE_PREFIXES or _is_project_class(
+            module, name, self.all_project_classes
+        ):
+            return ast.Name(id=name)
+        return ast.Name(id=f"{module}.{name}")
+
+
+def normalize_type_annotation(
+    type_annotation: str, all_project_classes: Dict[str, str] | None = None
+) -> str | None:
+    """
+    Returns the normalized form of a type annotation, which is the same for type annotations that
+    mean the same type (e.g. `list[int]`, `List[int]` and `typing.List[int]`), or None if the type
+    annotation cannot be parsed.
+    """
+    try:
+        expression = ast.parse(type_annotation, mode="eval").body
+        expression = _NameNormalizer(all_project_classes or {}).visit(expression)
+        python_type = parse_type_from_ast(expression)
+        cst.parse_expression(strip_module_prefixes(type_annotation))
+    except Exception:
+        return None
+    return str(remove_type_namespace(normalize_type(python_type)))
+
+
+def prefilter_candidates(
+    search_tree_layers: Dict[TypeSlot, Predictions],
+    source_code_tree: cst.Module,
+    all_project_classes: Dict[str, str],
+    file_path: str,
+) -> Tuple[Dict[TypeSlot, Predictions], Dict[TypeSlot, Dict[str, ImportPlan]]]:
+    """
+    Removes the type annotation predictions that the search would reject without asking Pyright.
+
+    Quotes are removed, predictions that normalize to the same type (e.g. `list` and `List`) are
+    collapsed into the highest ranked one with their probabilities summed, and predictions that
+    cannot be parsed or imported are dropped.
+
+    Returns:
+        filtered_search_tree_layers: the remaining predictions per type slot
+        import_plans: the imports needed by each remaining prediction per type slot
+    """
+    logger = logging.getLogger("main")
+    filtered_search_tree_layers = {}
+    import_plans = {}
+    for slot, predictions in search_tree_layers.items():
+        filtered_predictions = []
+        slot_import_plans = {}
+        normalized_indices = {}
+        for type_annotation, probability in predictions:
+            type_annotation = remove_quotes(type_annotation)
+            normalized_type_annotation = normalize_type_annotation(
+                type_annotation, all_project_classes
+            )
+            if normalized_type_annotation is None:
+                logger.debug(f"{slot}: dropped unparseable '{type_annotation}'")
+                continue
+
+            if normalized_type_annotation in normalized_indices:
+                filtered_predictions[normalized_indices[normalized_type_annotation]][
+                    1
+                ] += probability
+                logger.debug(f"{slot}: collapsed duplicate '{type_annotation}'")
+                continue
+
+            import_plan, unknown_annotations = plan_imports_for_type_annotation(
+                source_code_tree, type_annotation, all_project_classes, file_path
+            )
+            if len(unknown_annotations) > 0:
+                logger.debug(f"{slot}: dropped unresolvable '{type_annotation}'")
+                continue
+
+            normalized_indices[normalized_type_annotation] = len(filtered_predictions)
+            filtered_predictions.append([type_annotation, probability])
+            slot_import_plans[type_annotation] = import_plan
+
+        filtered_search_tree_layers[slot] = filtered_predictions
+        import_plans[slot] = slot_import_plans
+    return filtered_search_tree_layers, import_plans
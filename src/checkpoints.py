@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Tuple
+import libcst as cst
+
+
+@dataclass
+class SearchCheckpoint:
+    """
+    The state of an unfinished depth-first search, so that a later run can continue where it stopped.
+    The accepted prefix of the search consists of the first `layer_index` layers.
+    """
+
+    signature: str
+    layer_index: int
+    layer_specific_indices: List[int]
+    nogoods: List[List[Tuple[List[str], str]]] = field(default_factory=list)
+
+
+def search_tree_signature(
+    search_tree: Dict[str, Dict[str, Any]], source_code_tree: cst.Module
+) -> str:
+    """A checkpoint can only be resumed for the same source code and the same search tree."""
+    layers = [
+        [list(layer["func_name"]), layer["param_name"], layer["predictions"]]
+        for layer in search_tree.values()
+    ]
+    content = json.dumps([source_code_tree.code, layers])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_checkpoint_file(
+    checkpoint_directory: str, relative_path: str, file_name: str
+) -> str:
+    return os.path.abspath(
+        os.path.join(checkpoint_directory, relative_path, file_name + ".json")
+    )
+
+
+def save_checkpoint(checkpoint_file: str, checkpoint: SearchCheckpoint) -> None:
+    os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+    with open(checkpoint_file, "w", encoding="utf-8") as f:
+        json.dump(asdict(checkpoint), f)
+
+
+def load_checkpoint(checkpoint_file: str, signature: str) -> SearchCheckpoint | None:
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file, "r", encoding="utf-8") as f:
+        checkpoint = SearchCheckpoint(**json.load(f))
+    if checkpoint.signature != signature:
+        return None
+    return checkpoint
+
+
+def remove_checkpoint(checkpoint_file: str) -> None:
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import functools
+import re
+from typing import Dict, List, Set
+from libcst.metadata import CodeRange
+
+ERROR_PATTERN = r'cannot be assigned to|is not defined|Operator ".*" not supported for types ".*" and ".*"'
+ALLOWED_PATTERN = r'"Unknown" is not defined'
+ERROR_REGEX = re.compile(ERROR_PATTERN)
+ALLOWED_REGEX = re.compile(ALLOWED_PATTERN)
+
+
+@functools.lru_cache(maxsize=8192)
+def is_error_message(message: str) -> bool:
+    # Most messages repeat between checks of the same file, so their verdicts are cached
+    return ERROR_REGEX.search(message) is not None
+
+
+@functools.lru_cache(maxsize=8192)
+def is_allowed_message(message: str) -> bool:
+    return ALLOWED_REGEX.search(message) is not None
+
+
+def error_in_location(range: Dict, location: CodeRange | None) -> bool:
+    return (
+        location is not None
+        and range["start"]["line"] >= location.start.line
+        and range["start"]["character"] >= location.start.column
+        and range["end"]["line"] <= location.end.line
+        and range["end"]["character"] <= location.end.column
+    )
+
+
+def has_error_in_diagnostics(
+    diagnostics: List[Dict],
+    modified_location: CodeRange | None,
+    start_errors: Set[str],
+    at_start: bool = False,
+) -> bool:
+    """
+    Decides whether Pyright rejects a modified source code: an error matching the error pattern must be
+    reported inside the modified location, and it must not have been there at the start already.
+    With `at_start`, the errors are collected in the start errors instead.
+    """
+    if at_start:
+        for diagnostic in diagnostics:
+            if is_error_message(diagnostic["message"]):
+                start_errors.add(diagnostic["message"])
+
+    return len(errors_in_diagnostics(diagnostics, modified_location, start_errors)) > 0
+
+
+def new_errors_in_diagnostics(
+    diagnostics: List[Dict], start_errors: Set[str]
+) -> List[Dict]:
+    """Returns the error diagnostics anywhere in the source code that were not there at the start."""
+    return [
+        diagnostic
+        for diagnostic in diagnostics
+        if is_error_message(diagnostic["message"])
+        and not is_allowed_message(diagnostic["message"])
+        and diagnostic["message"] not in start_errors
+    ]
+
+
+def errors_in_diagnostics(
+    diagnostics: List[Dict],
+    modified_location: CodeRange | None,
+    start_errors: Set[str],
+) -> List[Dict]:
+    """Returns the error diagnostics for which Pyright rejects a modified source code."""
+    if modified_location is None:
+        return []
+    # The range test is cheaper than the message patterns, and excludes most diagnostics of a file
+    return [
+        diagnostic
+        for diagnostic in diagnostics
+        if error_in_location(diagnostic["range"], modified_location)
+        and is_error_message(diagnostic["message"])
+        and not is_allowed_message(diagnostic["message"])
+        and diagnostic["message"] not in start_errors
+    ]
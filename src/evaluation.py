@@ -75,6 +75,9 @@ def create_evaluation_csv_file(postfix: str) -> None:
         "# common annotations returns (all)",
         "# rare annotations parameters (all)",
         "# rare annotations returns (all)",
+        "# Pyright checks ML search",
+        "# Pyright checks per accepted ML search slot",
+        "# pruned Pyright checks ML search",
     ]
     with open(
         csv_file,
@@ -221,6 +224,8 @@ def calculate_evaluation_statistics(
     total_time: float,
     peak_memory_usage_pyright: int,
     peak_memory_usage_ml_search: int,
+    number_of_pyright_checks: int = 0,
+    number_of_pruned_checks: int = 0,
 ):
     annotations_groundtruth = gather_annotated_slots(type_slots_groundtruth)
     annotations_after_pyright = gather_annotated_slots(type_slots_after_pyright)
@@ -307,6 +312,13 @@ def calculate_evaluation_statistics(
     except ZeroDivisionError:
         extra_ml_annotations_after_pyright_percentage = "-"
 
+    try:
+        pyright_checks_per_accepted_ml_slot = round(
+            number_of_pyright_checks / len(extra_ml_annotations), 2
+        )
+    except ZeroDivisionError:
+        pyright_checks_per_accepted_ml_slot = "-"
+
     try:
         avg_time_per_ml_search_slot = round(
             ml_search_time / number_of_ml_evaluated_type_slots, 2
@@ -447,5 +459,14 @@ def calculate_evaluation_statistics(
         "common_annotations_all_returns_count": len(all_annotations_common_returns),
         "rare_annotations_all_params_count": len(all_annotations_rare_params),
         "rare_annotations_all_returns_count": len(all_annotations_rare_returns),
+        "pyright_checks_ml_search_count": (
+            number_of_pyright_checks if has_performed_ml_search else "-"
+        ),
+        "pyright_checks_per_accepted_ml_slot": (
+            pyright_checks_per_accepted_ml_slot if has_performed_ml_search else "-"
+        ),
+        "pruned_checks_ml_search_count": (
+            number_of_pruned_checks if has_performed_ml_search else "-"
+        ),
     }
     return evaluation_statistics
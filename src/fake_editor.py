@@ -1,55 +1,180 @@
 from __future__ import annotations
+import functools
 import logging
 import os
-import re
+import shutil
+import socket
 import subprocess
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
+from colorama import Fore
 from libcst.metadata import CodeRange
 
 from client.json_rpc_endpoint import JsonRpcEndpoint
 from client.lsp_client import LspClient
 from client.lsp_endpoint import LspEndpoint
+from diagnostics import (
+    errors_in_diagnostics,
+    has_error_in_diagnostics,
+    new_errors_in_diagnostics,
+)
+from server_monitor import (
+    MAX_RESTART_ATTEMPTS,
+    SERVER_STOP_TIMEOUT_SECONDS,
+    PyrightTimeoutException,
+    ServerMonitor,
+    kill_process_tree,
+)
 
 from lsprotocol.types import *
 
+SHADOW_DOCUMENT_PREFIX = "__shadow"
+
+
+# Starts the servers with another command, like the session recorder or the fake server, if it is set
+langserver_command_override: List[str] | None = None
+
+
+def set_langserver_command_override(command: List[str] | None) -> None:
+    global langserver_command_override
+    langserver_command_override = command
+
+
+def get_pyright_langserver_command() -> List[str]:
+    if langserver_command_override is not None:
+        return langserver_command_override
+    return resolve_pyright_langserver_command()
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_pyright_langserver_command() -> List[str]:
+    """
+    Resolves the pyright-langserver executable once, so that starting a server does not have to go
+    through `poetry run` (which launches an extra Python interpreter) every time.
+    """
+    executable = shutil.which("pyright-langserver")
+    if executable is None:
+        try:
+            venv_path = subprocess.run(
+                ["poetry", "env", "info", "--path"],
+                cwd=os.path.dirname(os.path.realpath(__file__)),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            executable = shutil.which(
+                "pyright-langserver",
+                path=os.pathsep.join(
+                    [
+                        os.path.join(venv_path, "bin"),
+                        os.path.join(venv_path, "Scripts"),
+                    ]
+                ),
+            )
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    if executable is None:
+        return ["poetry", "run", "pyright-langserver", "--stdio"]
+    return [executable, "--stdio"]
+
 
 class FakeEditor:
     _self = None
 
-    def __init__(self):
+    def __init__(
+        self,
+        daemon_socket: str | None = None,
+        monitor: ServerMonitor | None = None,
+        pull_diagnostics: bool = False,
+        daemon_configuration_hash: str = "",
+    ):
+        # Request the diagnostics of each check with textDocument/diagnostic if the server supports it
+        self.pull_diagnostics = pull_diagnostics
+        self.registered_methods = set()
+        self.pulled_diagnostics: Dict[str, List[Dict]] = {}
+        # Attach to a warm Pyright daemon if one is given and healthy, instead of spawning a server
+        self.daemon_socket = daemon_socket
+        self.daemon_configuration_hash = daemon_configuration_hash
+        self.daemon_connection: socket.socket | None = None
         self.lsp_client = self._get_LSP_client()
         self.capabilities = self._get_editor_capabilities()
         self.received_diagnostics = False
         self.modified_location = None
         self.start_errors = set()
         self.diagnostics = []
+        self.number_of_checks = 0
+        # The server is restarted when it becomes slow, uses too much memory or stops responding
+        self.monitor = monitor if monitor is not None else ServerMonitor()
+        self.root_uri = None
+        self.edit_document: TextDocumentItem | None = None
+        self.current_python_code = None
+        self.server_capabilities: Dict[str, Any] = {}
+        # The settings returned to the server when it asks for the workspace configuration
+        self.workspace_configuration: Dict[str, Any] = {}
+        # Virtual copies of the edited document to check several versions of it at once
+        self.shadow_documents: List[TextDocumentItem] = []
+        self.shadow_diagnostics: Dict[str, Tuple[int | None, List[Dict]]] = {}
+        # Virtual documents with other code than the edited document, like slices of it
+        self.virtual_documents: Dict[str, TextDocumentItem] = {}
 
     # Singleton class
-    def __new__(cls) -> FakeEditor:
+    def __new__(cls, *args: Any, **kwargs: Any) -> FakeEditor:
         if cls._self is None:
             cls._self = super().__new__(cls)
         return cls._self
 
+    @classmethod
+    def new_worker(cls) -> FakeEditor:
+        """Creates an editor with its own pyright-langserver instance, next to the shared singleton editor."""
+        editor = super().__new__(cls)
+        if cls._self is not None:
+            editor.__init__(
+                monitor=cls._self.monitor.copy(),
+                pull_diagnostics=cls._self.pull_diagnostics,
+            )
+            editor.workspace_configuration = cls._self.workspace_configuration
+        else:
+            editor.__init__()
+        return editor
+
     def _get_LSP_client(self) -> LspClient:
-        project_path = os.getcwd()
-        # Change directory to py-hint-search project to be able to start pyright-langserver
-        current_file_path = os.path.dirname(os.path.realpath(__file__))
-        os.chdir(current_file_path)
+        if self.daemon_socket is not None:
+            # Imported here, as the daemon itself uses the server command of this module
+            from pyright_daemon import connect_to_pyright_daemon
+
+            self.daemon_connection = connect_to_pyright_daemon(
+                self.daemon_socket, self.daemon_configuration_hash
+            )
+        if self.daemon_connection is not None:
+            self.process = None
+            json_rpc_endpoint = JsonRpcEndpoint(
+                self.daemon_connection.makefile("wb"),
+                self.daemon_connection.makefile("rb"),
+            )
+            return self._create_LSP_client(json_rpc_endpoint)
 
+        # Start pyright-langserver from the py-hint-search project, where it is installed
+        current_file_path = os.path.dirname(os.path.realpath(__file__))
         self.process = subprocess.Popen(
-            args=["poetry", "run", "pyright-langserver", "--stdio"],
+            args=get_pyright_langserver_command(),
+            cwd=current_file_path,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
         )
-        os.chdir(project_path)
 
         json_rpc_endpoint = JsonRpcEndpoint(self.process.stdin, self.process.stdout)
+        return self._create_LSP_client(json_rpc_endpoint)
+
+    def _create_LSP_client(self, json_rpc_endpoint: JsonRpcEndpoint) -> LspClient:
         lsp_endpoint = LspEndpoint(
             json_rpc_endpoint,
             callbacks={"textDocument/publishDiagnostics": self._handle_diagnostics},
+            request_callbacks={
+                "workspace/configuration": self._handle_configuration_request,
+                "client/registerCapability": self._handle_register_capability,
+            },
         )
         return LspClient(lsp_endpoint)
 
@@ -69,32 +194,192 @@ class FakeEditor:
             ),
         )
 
+    def _handle_configuration_request(self, params: Dict[str, Any]) -> List[Any]:
+        return [
+            self.workspace_configuration.get(item.get("section"))
+            for item in params["items"]
+        ]
+
+    def _handle_register_capability(self, params: Dict[str, Any]) -> None:
+        for registration in params.get("registrations", []):
+            self.registered_methods.add(registration["method"])
+
+    @property
+    def uses_pull_diagnostics(self) -> bool:
+        # The server offers pull diagnostics statically in its capabilities, or registers them later
+        return self.pull_diagnostics and (
+            "diagnosticProvider" in self.server_capabilities
+            or "textDocument/diagnostic" in self.registered_methods
+        )
+
     def _handle_diagnostics(self, jsonrpc_message: Dict[str, Any]) -> None:
-        self.diagnostics = jsonrpc_message["params"]["diagnostics"]
+        # Pushed diagnostics cannot be matched to a check as reliably as the pulled ones
+        if self.uses_pull_diagnostics:
+            return
+        params = jsonrpc_message["params"]
+        if SHADOW_DOCUMENT_PREFIX in params["uri"]:
+            # Diagnostics of shadow documents that are already closed are ignored
+            if params["uri"] in self.shadow_diagnostics:
+                self.shadow_diagnostics[params["uri"]] = (
+                    params.get("version"),
+                    params["diagnostics"],
+                )
+            return
+        self.diagnostics = params["diagnostics"]
         self.received_diagnostics = True
 
     def _wait_for_diagnostics(self) -> None:
         # Wait for diagnostics to be received. Currently the best async solution I could come up with
+        deadline = time.perf_counter() + self.monitor.diagnostics_timeout
         while not self.received_diagnostics:
+            if time.perf_counter() > deadline:
+                raise PyrightTimeoutException(
+                    f"No diagnostics received within {self.monitor.diagnostics_timeout:.0f} seconds"
+                )
             time.sleep(0.001)
         self.received_diagnostics = False
 
+    def _pull_diagnostics(self, uris: List[str]) -> List[List[Dict]]:
+        try:
+            reports = self.lsp_client.document_diagnostics(
+                uris, self.monitor.diagnostics_timeout
+            )
+        except TimeoutError:
+            raise PyrightTimeoutException(
+                f"No diagnostics received within {self.monitor.diagnostics_timeout:.0f} seconds"
+            )
+        for uri, report in zip(uris, reports):
+            # Without a previous result id the report is always full, but an unchanged one is still valid
+            if report.get("kind") != "unchanged":
+                self.pulled_diagnostics[uri] = report.get("items", [])
+        return [self.pulled_diagnostics.get(uri, []) for uri in uris]
+
+    def _receive_diagnostics(self) -> None:
+        """Gets the diagnostics of the current version of the edited document."""
+        if self.uses_pull_diagnostics:
+            self.diagnostics = self._pull_diagnostics([self.edit_document.uri])[0]
+        else:
+            self._wait_for_diagnostics()
+
+    def _receive_shadow_diagnostics(self, versions: Dict[str, int]) -> None:
+        if self.uses_pull_diagnostics:
+            uris = list(versions)
+            for uri, diagnostics in zip(uris, self._pull_diagnostics(uris)):
+                self.shadow_diagnostics[uri] = (versions[uri], diagnostics)
+        else:
+            self._wait_for_shadow_diagnostics(versions)
+
+    def _wait_for_shadow_diagnostics(self, versions: Dict[str, int]) -> None:
+        # Diagnostics are matched to the change by their version. Without a version, any new diagnostics count
+        def is_waiting(uri: str, version: int) -> bool:
+            received_version, diagnostics = self.shadow_diagnostics[uri]
+            return diagnostics is None or received_version not in (version, None)
+
+        deadline = time.perf_counter() + self.monitor.diagnostics_timeout
+        while any(is_waiting(uri, version) for uri, version in versions.items()):
+            if time.perf_counter() > deadline:
+                raise PyrightTimeoutException(
+                    f"No diagnostics received within {self.monitor.diagnostics_timeout:.0f} seconds"
+                )
+            time.sleep(0.001)
+
+    def _server_pid(self) -> int | None:
+        return self.process.pid if self.process is not None else None
+
+    def _stop_server(self) -> None:
+        old_endpoint = self.lsp_client.lsp_endpoint
+        # Messages the old server still sends must not be taken for those of the new server
+        old_endpoint.callbacks = {}
+        old_endpoint.request_callbacks = {}
+        old_endpoint.default_callback = lambda jsonrpc_message: None
+        old_endpoint.stop()
+        if self.process is not None:
+            kill_process_tree(self.process.pid)
+        elif self.daemon_connection is not None:
+            # Shutting the socket down ends the reads of the old endpoint, closing it does not
+            try:
+                self.daemon_connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.daemon_connection.close()
+        # The old endpoint ends at the end of the output of the old server
+        old_endpoint.join(SERVER_STOP_TIMEOUT_SECONDS)
+
+    def restart_server(self, reason: str) -> None:
+        """
+        Replaces the server by a new one and reopens the edited document and its shadow documents with
+        their current code, so that the pending check can be retried transparently. A replacement that
+        does not respond either is replaced again, up to MAX_RESTART_ATTEMPTS times.
+        """
+        for _ in range(MAX_RESTART_ATTEMPTS):
+            print(f"{Fore.YELLOW}Restarting Pyright: {reason}")
+            logger = logging.getLogger("main")
+            logger.warning(f"Restarting Pyright: {reason}")
+            try:
+                self._restart_server()
+                return
+            except PyrightTimeoutException as e:
+                reason = e.message
+        raise PyrightTimeoutException(
+            f"Pyright did not respond after {MAX_RESTART_ATTEMPTS} restarts: {reason}"
+        )
+
+    def _restart_server(self) -> None:
+        self._stop_server()
+        self.monitor.reset()
+
+        # The replacement server is never the daemon, as the daemon may be the one that stopped responding
+        self.daemon_socket = None
+        self.daemon_connection = None
+        self.received_diagnostics = False
+        self.registered_methods = set()
+        self.virtual_documents = {}
+        self.lsp_client = self._get_LSP_client()
+        self.start(self.root_uri)
+
+        if self.edit_document is None:
+            return
+        self.edit_document = TextDocumentItem(
+            uri=self.edit_document.uri,
+            language_id="python",
+            version=1,
+            text=self.current_python_code,
+        )
+        self.lsp_client.did_open(
+            DidOpenTextDocumentParams(text_document=self.edit_document)
+        )
+        self._receive_diagnostics()
+        number_of_shadow_documents = len(self.shadow_documents)
+        self.shadow_documents = []
+        self.shadow_diagnostics = {}
+        if number_of_shadow_documents > 0:
+            self.open_shadow_documents(number_of_shadow_documents)
+
     def start(self, root_uri: str) -> None:
+        self.root_uri = root_uri
         workspace_folders = [WorkspaceFolder(name="py-hint-search", uri=root_uri)]
-        self.lsp_client.initialize(
-            InitializeParams(
-                process_id=self.process.pid,
-                root_path=None,
-                root_uri=root_uri,
-                initialization_options=None,
-                capabilities=self.capabilities,
-                trace=TraceValues.Verbose,
-                workspace_folders=workspace_folders,
+        # The server is ready to receive documents once it has answered the initialize request
+        try:
+            initialize_result = self.lsp_client.initialize(
+                InitializeParams(
+                    process_id=(
+                        self.process.pid if self.process is not None else os.getpid()
+                    ),
+                    root_path=None,
+                    root_uri=root_uri,
+                    initialization_options=None,
+                    capabilities=self.capabilities,
+                    trace=TraceValues.Verbose,
+                    workspace_folders=workspace_folders,
+                ),
+                self.monitor.diagnostics_timeout,
             )
-        )
-        time.sleep(1)
+        except TimeoutError:
+            raise PyrightTimeoutException(
+                f"No response to the initialize request within {self.monitor.diagnostics_timeout:.0f} seconds"
+            )
+        self.server_capabilities = initialize_result.get("capabilities", {})
         self.lsp_client.initialized()
-        time.sleep(1)
 
     def open_file(self, file_path: str) -> None:
         uri_file_path = (
@@ -114,68 +399,191 @@ class FakeEditor:
             version=1,
             text=python_code,
         )
+        self.current_python_code = python_code
         self.lsp_client.did_open(
             DidOpenTextDocumentParams(text_document=self.edit_document)
         )
-        self._wait_for_diagnostics()
+        try:
+            self._receive_diagnostics()
+        except PyrightTimeoutException as e:
+            # The restarted server reopens the document, which gives its diagnostics
+            self.restart_server(e.message)
 
     def change_file(
         self, new_python_code: str, modified_location: CodeRange | None
     ) -> None:
         self.modified_location = modified_location
+        self.number_of_checks += 1
+        reason = self.monitor.restart_reason(self._server_pid())
+        if reason is not None:
+            self.restart_server(reason)
+
+        start_time = time.perf_counter()
+        try:
+            self._send_change(new_python_code)
+        except PyrightTimeoutException as e:
+            # The restarted server reopens the document with the new code, which gives its diagnostics
+            self.restart_server(e.message)
+            return
+        self.monitor.record_check(time.perf_counter() - start_time)
+
+    def _send_change(self, new_python_code: str) -> None:
+        self.current_python_code = new_python_code
         self.edit_document.version += 1
-        document = VersionedTextDocumentIdentifier(
-            uri=self.edit_document.uri,
-            version=self.edit_document.version,
+        self.lsp_client.did_change_full_text(
+            self.edit_document.uri, self.edit_document.version, new_python_code
         )
-        change = TextDocumentContentChangeEvent_Type2(text=new_python_code)
-        self.lsp_client.did_change(
-            DidChangeTextDocumentParams(
-                text_document=document,
-                content_changes=[change],
-            )
+        self._receive_diagnostics()
+
+    def has_diagnostic_error(self, at_start: bool = False) -> bool:
+        return has_error_in_diagnostics(
+            self.diagnostics, self.modified_location, self.start_errors, at_start
         )
-        self._wait_for_diagnostics()
-
-    def _error_in_modified_location(self, range: Dict) -> bool:
-        return (
-            self.modified_location is not None
-            and range["start"]["line"] >= self.modified_location.start.line
-            and range["start"]["character"] >= self.modified_location.start.column
-            and range["end"]["line"] <= self.modified_location.end.line
-            and range["end"]["character"] <= self.modified_location.end.column
+
+    def get_diagnostic_errors(self) -> List[Dict]:
+        """Returns the errors for which the last change has a diagnostic error."""
+        return errors_in_diagnostics(
+            self.diagnostics, self.modified_location, self.start_errors
         )
 
-    def has_diagnostic_error(self, at_start: bool = False) -> bool:
-        ERROR_PATTERN = r'cannot be assigned to|is not defined|Operator ".*" not supported for types ".*" and ".*"'
-        ALLOWED_PATTERN = r'"Unknown" is not defined'
+    def get_new_errors(self) -> List[Dict]:
+        """Returns the errors anywhere in the edited document that were not there at the start."""
+        return new_errors_in_diagnostics(self.diagnostics, self.start_errors)
+
+    def has_diagnostic_error_at(self, location: CodeRange) -> bool:
+        """Checks the current diagnostics for errors in another location than the last modified one."""
+        self.modified_location = location
+        return self.has_diagnostic_error()
+
+    def open_shadow_documents(self, number_of_documents: int) -> None:
+        """
+        Opens virtual copies of the edited document next to it, under names that do not exist on disk,
+        so that Pyright can analyse several versions of the document at the same time.
+        """
+        directory, file_name = self.edit_document.uri.rsplit("/", 1)
+        for i in range(number_of_documents):
+            shadow_document = TextDocumentItem(
+                uri=f"{directory}/{SHADOW_DOCUMENT_PREFIX}{i}__{file_name}",
+                language_id="python",
+                version=1,
+                text=self.edit_document.text,
+            )
+            self.shadow_documents.append(shadow_document)
+            self.shadow_diagnostics[shadow_document.uri] = (None, None)
+            self.lsp_client.did_open(
+                DidOpenTextDocumentParams(text_document=shadow_document)
+            )
+        self._receive_shadow_diagnostics(
+            {document.uri: document.version for document in self.shadow_documents}
+        )
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.shadow_documents)
+
+    def check_in_parallel(
+        self, changes: List[Tuple[str, CodeRange | None]]
+    ) -> List[bool]:
+        """
+        Checks several versions of the edited document at once, one per shadow document, and returns
+        for each version whether it has a diagnostic error in its modified location.
+        """
+        has_errors = []
+        for start in range(0, len(changes), self.batch_size):
+            batch = changes[start : start + self.batch_size]
+            self.number_of_checks += len(batch)
+            try:
+                has_errors += self._check_batch(batch)
+            except PyrightTimeoutException as e:
+                self.restart_server(e.message)
+                has_errors += self._check_batch(batch)
+        return has_errors
 
-        for diagnostic in self.diagnostics:
-            diagnostic_has_error = (
-                len(re.findall(ERROR_PATTERN, diagnostic["message"])) > 0
+    def _check_batch(self, batch: List[Tuple[str, CodeRange | None]]) -> List[bool]:
+        versions = {}
+        for shadow_document, (new_python_code, _) in zip(self.shadow_documents, batch):
+            shadow_document.version += 1
+            versions[shadow_document.uri] = shadow_document.version
+            self.shadow_diagnostics[shadow_document.uri] = (None, None)
+            self.lsp_client.did_change_full_text(
+                shadow_document.uri, shadow_document.version, new_python_code
             )
-            if diagnostic_has_error and at_start:
-                self.start_errors.add(diagnostic["message"])
-
-            if diagnostic_has_error and self._error_in_modified_location(
-                diagnostic["range"]
-            ):
-                diagnostic_is_allowed = (
-                    len(re.findall(ALLOWED_PATTERN, diagnostic["message"])) > 0
-                    or diagnostic["message"] in self.start_errors
+        self._receive_shadow_diagnostics(versions)
+
+        has_errors = []
+        for shadow_document, (_, modified_location) in zip(
+            self.shadow_documents, batch
+        ):
+            _, diagnostics = self.shadow_diagnostics[shadow_document.uri]
+            has_errors.append(
+                has_error_in_diagnostics(
+                    diagnostics, modified_location, self.start_errors
                 )
-                if diagnostic_is_allowed:
-                    continue
+            )
+        return has_errors
+
+    def check_document(self, uri: str, python_code: str) -> List[Dict]:
+        """
+        Checks code in a virtual document next to the edited document and returns its diagnostics.
+        The uri has to contain the shadow document prefix, so that the diagnostics are told apart.
+        """
+        self.number_of_checks += 1
+        try:
+            return self._check_virtual_document(uri, python_code)
+        except PyrightTimeoutException as e:
+            self.restart_server(e.message)
+            return self._check_virtual_document(uri, python_code)
+
+    def _check_virtual_document(self, uri: str, python_code: str) -> List[Dict]:
+        self.shadow_diagnostics[uri] = (None, None)
+        document = self.virtual_documents.get(uri)
+        if document is None:
+            document = TextDocumentItem(
+                uri=uri, language_id="python", version=1, text=python_code
+            )
+            self.virtual_documents[uri] = document
+            self.lsp_client.did_open(DidOpenTextDocumentParams(text_document=document))
+        else:
+            document.version += 1
+            self.lsp_client.did_change_full_text(uri, document.version, python_code)
+        self._receive_shadow_diagnostics({uri: document.version})
+        _, diagnostics = self.shadow_diagnostics[uri]
+        return diagnostics
 
-                return True
-        return False
+    def close_shadow_documents(self) -> None:
+        for shadow_document in self.shadow_documents:
+            document = TextDocumentIdentifier(uri=shadow_document.uri)
+            self.lsp_client.did_close(
+                DidCloseTextDocumentParams(text_document=document)
+            )
+        self.shadow_documents = []
+        self.shadow_diagnostics = {}
 
     def close_file(self) -> None:
+        if len(self.shadow_documents) > 0:
+            self.close_shadow_documents()
+        for uri in self.virtual_documents:
+            self.lsp_client.did_close(
+                DidCloseTextDocumentParams(
+                    text_document=TextDocumentIdentifier(uri=uri)
+                )
+            )
+        self.virtual_documents = {}
         document = TextDocumentIdentifier(uri=self.edit_document.uri)
         self.lsp_client.did_close(DidCloseTextDocumentParams(text_document=document))
         self.edit_document = None
-        self._wait_for_diagnostics()
+        # Pulled diagnostics are not sent for closed documents
+        if self.uses_pull_diagnostics:
+            self.pulled_diagnostics = {}
+            return
+        try:
+            self._wait_for_diagnostics()
+        except PyrightTimeoutException as e:
+            self.restart_server(e.message)
 
     def stop(self) -> None:
+        # The daemon answers the shutdown itself and keeps its server running for the next run
         self.lsp_client.shutdown()
         self.lsp_client.exit()
+        if self.daemon_connection is not None:
+            self.daemon_connection.close()
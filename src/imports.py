@@ -9,7 +9,7 @@ import importlib
 import contextlib
 import sys
 from types import ModuleType
-from typing import Dict, List, Optional, Set, Union
+from typing import Dict, List, Optional, Set, Tuple, TypeAlias, Union
 import typing
 import libcst as cst
 import libcst.matchers as m
@@ -114,12 +114,20 @@ def _get_import_module_path(
     return module_path
 
 
-def add_import_to_source_code_tree(
+ImportPlan: TypeAlias = List[Tuple[str, str]]
+
+
+def plan_imports_for_type_annotation(
     source_code_tree: cst.Module,
     type_annotation: str,
     all_project_classes: Dict[str, str],
     file_path: str,
-):
+) -> Tuple[ImportPlan, Set[str]]:
+    """
+    Returns:
+        import_plan: the (imported name, statement) pairs that must be added to the source code tree
+        unknown_annotations: the names in the type annotation that cannot be resolved
+    """
     logger = logging.getLogger("main")
     if type_annotation.startswith("(") and type_annotation.endswith(")"):
         type_annotation = type_annotation[1:-1]
@@ -139,6 +147,7 @@ def add_import_to_source_code_tree(
     visitor_aliases = TypeAliasesCollector()
     source_code_tree.visit(visitor_aliases)
 
+    import_plan = []
     unknown_annotations = set()
     for annotation in potential_annotation_imports:
         if annotation in BUILT_IN_TYPES or annotation == "":
@@ -148,37 +157,34 @@ def add_import_to_source_code_tree(
         elif annotation in visitor_aliases.existing_type_aliases:
             continue
         elif annotation in typing.__all__ or annotation in ["LiteralString", "Self"]:
-            transformer = ImportInserter(f"from typing import {annotation}")
-            source_code_tree = source_code_tree.visit(transformer)
+            import_plan.append((annotation, f"from typing import {annotation}"))
         elif annotation == "Unknown":
             # If Pyright cannot infer the type, it occasionally uses "Unknown" as the type.
             # Although not officially supported, it is similar to "Any" and thus we need a TypeAlias for it.
-            transformer_alias = TypeAliasInserter("Unknown: TypeAlias = Any")
-            source_code_tree = source_code_tree.visit(transformer_alias)
+            import_plan.append(("Unknown", "Unknown: TypeAlias = Any"))
             if "TypeAlias" not in visitor_imports.existing_import_items:
-                transformer_import_type_alias = ImportInserter(
-                    f"from typing_extensions import TypeAlias"
+                import_plan.append(
+                    ("TypeAlias", "from typing_extensions import TypeAlias")
                 )
-                source_code_tree = source_code_tree.visit(transformer_import_type_alias)
             if "Any" not in visitor_imports.existing_import_items:
-                transformer_import = ImportInserter(f"from typing import Any")
-                source_code_tree = source_code_tree.visit(transformer_import)
+                import_plan.append(("Any", "from typing import Any"))
         elif "." in annotation:
             if annotation == "...":
                 continue
             module, annotation = annotation.rsplit(".", 1)
+            import_statement = f"from {module} import {annotation}"
             try:
-                transformer = ImportInserter(f"from {module} import {annotation}")
-                source_code_tree = source_code_tree.visit(transformer)
+                cst.parse_statement(import_statement)
             except Exception as e:
                 print(
-                    f"Import error. Original type '{type_annotation}'. Import 'from {module} import {annotation}' failed"
+                    f"Import error. Original type '{type_annotation}'. Import '{import_statement}' failed"
                 )
                 logger.error(
-                    f"Import error. Original type '{type_annotation}'. Import 'from {module} import {annotation}' failed"
+                    f"Import error. Original type '{type_annotation}'. Import '{import_statement}' failed"
                 )
                 logger.error(e)
                 continue
+            import_plan.append((annotation, import_statement))
         elif annotation in all_project_classes:
             import_module_path = _get_import_module_path(
                 all_project_classes, annotation, file_path
@@ -187,23 +193,62 @@ def add_import_to_source_code_tree(
             if import_module_path == ".":
                 continue
 
+            import_statement = f"from {import_module_path} import {annotation}"
             try:
-                transformer = ImportInserter(
-                    f"from {import_module_path} import {annotation}"
-                )
-                source_code_tree = source_code_tree.visit(transformer)
+                cst.parse_statement(import_statement)
             except Exception as e:
                 print(
-                    f"Import error. Original type '{type_annotation}'. Import 'from {import_module_path} import {annotation}' failed"
+                    f"Import error. Original type '{type_annotation}'. Import '{import_statement}' failed"
                 )
                 logger.error(
-                    f"Import error. Original type '{type_annotation}'. Import 'from {import_module_path} import {annotation}' failed"
+                    f"Import error. Original type '{type_annotation}'. Import '{import_statement}' failed"
                 )
                 logger.error(e)
                 continue
+            import_plan.append((annotation, import_statement))
         else:
             unknown_annotations.add(annotation)
             continue
+    return import_plan, unknown_annotations
+
+
+def apply_import_plan(
+    source_code_tree: cst.Module, import_plan: ImportPlan
+) -> cst.Module:
+    if len(import_plan) == 0:
+        return source_code_tree
+
+    visitor_imports = ImportsCollector()
+    source_code_tree.visit(visitor_imports)
+
+    visitor_aliases = TypeAliasesCollector()
+    source_code_tree.visit(visitor_aliases)
+
+    existing_names = (
+        visitor_imports.existing_import_items | visitor_aliases.existing_type_aliases
+    )
+    for name, statement in import_plan:
+        if name in existing_names:
+            continue
+        if ":" in statement:
+            transformer = TypeAliasInserter(statement)
+        else:
+            transformer = ImportInserter(statement)
+        source_code_tree = source_code_tree.visit(transformer)
+        existing_names.add(name)
+    return source_code_tree
+
+
+def add_import_to_source_code_tree(
+    source_code_tree: cst.Module,
+    type_annotation: str,
+    all_project_classes: Dict[str, str],
+    file_path: str,
+):
+    import_plan, unknown_annotations = plan_imports_for_type_annotation(
+        source_code_tree, type_annotation, all_project_classes, file_path
+    )
+    source_code_tree = apply_import_plan(source_code_tree, import_plan)
     return source_code_tree, unknown_annotations
 
 
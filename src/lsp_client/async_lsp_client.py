@@ -0,0 +1,205 @@
+from __future__ import annotations
+import asyncio
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from client.json_rpc_endpoint import (
+    CONTENT_LENGTH_HEADER,
+    CONTENT_TYPE_HEADER,
+    DEFAULT_CHARSET,
+    JSON_RPC_HEADER_FORMAT,
+    dumps_message,
+    get_charset,
+    loads_message,
+    parse_header_field,
+)
+from client.lsp_client import full_text_did_change_params
+
+
+class AsyncLspClient:
+    """
+    An asyncio LSP client for a language server on subprocess pipes. Requests are matched to their
+    responses by id and diagnostics to the change that caused them by (uri, version), so many documents
+    can be checked concurrently from a single thread. Writes wait for the pipe to drain, so a server that
+    falls behind slows down the client instead of buffering without limit.
+    """
+
+    def __init__(
+        self,
+        request_callbacks: Dict[str, Callable[[Any], Any]] | None = None,
+        notification_callbacks: Dict[str, Callable[[Any], None]] | None = None,
+    ) -> None:
+        self.request_callbacks = request_callbacks or {}
+        self.notification_callbacks = notification_callbacks or {}
+        self.process: asyncio.subprocess.Process | None = None
+        self.next_id = 0
+        self.pending_requests: Dict[int, asyncio.Future] = {}
+        self.pending_diagnostics: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.write_lock = asyncio.Lock()
+        self.reader_task: asyncio.Task | None = None
+
+    async def start(self, command: Sequence[str], cwd: str | None = None) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.reader_task = asyncio.create_task(self._read_messages())
+
+    async def _read_message(self) -> Dict[str, Any] | None:
+        reader = self.process.stdout
+        content_length = None
+        charset = DEFAULT_CHARSET
+        while True:
+            line = await reader.readline()
+            if not line:
+                return None
+            if line in (b"\r\n", b"\n"):
+                break
+            name, value = parse_header_field(line)
+            if name == CONTENT_LENGTH_HEADER:
+                content_length = int(value)
+            elif name == CONTENT_TYPE_HEADER:
+                charset = get_charset(value)
+        if content_length is None:
+            raise RuntimeError("Bad header: missing Content-Length")
+        try:
+            body = await reader.readexactly(content_length)
+        except asyncio.IncompleteReadError:
+            return None
+        return loads_message(body, charset)
+
+    async def _read_messages(self) -> None:
+        try:
+            while (message := await self._read_message()) is not None:
+                await self._handle_message(message)
+        finally:
+            # Nothing answers the pending futures once the server has quit
+            for future in list(self.pending_requests.values()) + list(
+                self.pending_diagnostics.values()
+            ):
+                if not future.done():
+                    future.set_exception(ConnectionError("Server quit"))
+
+    async def _handle_message(self, message: Dict[str, Any]) -> None:
+        if "result" in message or "error" in message:
+            future = self.pending_requests.pop(message.get("id"), None)
+            if future is None or future.done():
+                return
+            if "error" in message:
+                future.set_exception(Exception(message["error"]))
+            else:
+                future.set_result(message["result"])
+        elif "method" in message and "id" in message:
+            # The server waits for an answer, so unknown requests are answered with an empty result
+            request_callback = self.request_callbacks.get(message["method"])
+            result = (
+                request_callback(message.get("params"))
+                if request_callback is not None
+                else None
+            )
+            await self._write({"jsonrpc": "2.0", "id": message["id"], "result": result})
+        elif message.get("method") == "textDocument/publishDiagnostics":
+            self._handle_diagnostics(message["params"])
+        elif message.get("method") in self.notification_callbacks:
+            self.notification_callbacks[message["method"]](message.get("params"))
+
+    def _handle_diagnostics(self, params: Dict[str, Any]) -> None:
+        uri = params["uri"]
+        version = params.get("version")
+        if version is None:
+            # Without a version, the diagnostics belong to the oldest change of the document
+            keys = sorted(key for key in self.pending_diagnostics if key[0] == uri)
+            if len(keys) == 0:
+                return
+            version = keys[0][1]
+        future = self.pending_diagnostics.pop((uri, version), None)
+        if future is not None and not future.done():
+            future.set_result(params["diagnostics"])
+
+    async def _write(self, message: Dict[str, Any]) -> None:
+        body = dumps_message(message)
+        async with self.write_lock:
+            self.process.stdin.write(JSON_RPC_HEADER_FORMAT % len(body))
+            self.process.stdin.write(body)
+            await self.process.stdin.drain()
+
+    async def send_request(self, method: str, params: Any = None) -> Any:
+        request_id = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._write(message)
+        return await future
+
+    async def send_notification(self, method: str, params: Any = None) -> None:
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._write(message)
+
+    def _expect_diagnostics(self, uri: str, version: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending_diagnostics[(uri, version)] = future
+        return future
+
+    async def _wait_for_diagnostics(
+        self, uri: str, version: int, future: asyncio.Future, timeout: float | None
+    ) -> List[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending_diagnostics.pop((uri, version), None)
+
+    # --- Standard LSP methods ---
+    async def initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        result = await self.send_request("initialize", params)
+        await self.send_notification("initialized", {})
+        return result
+
+    async def did_open(
+        self, uri: str, text: str, version: int = 1, timeout: float | None = None
+    ) -> List[Dict[str, Any]]:
+        """Opens a document and returns its diagnostics."""
+        future = self._expect_diagnostics(uri, version)
+        await self.send_notification(
+            "textDocument/didOpen",
+            {
+                "textDocument": {
+                    "uri": uri,
+                    "languageId": "python",
+                    "version": version,
+                    "text": text,
+                }
+            },
+        )
+        return await self._wait_for_diagnostics(uri, version, future, timeout)
+
+    async def did_change(
+        self, uri: str, version: int, text: str, timeout: float | None = None
+    ) -> List[Dict[str, Any]]:
+        """Replaces the text of a document and returns the diagnostics of that version."""
+        future = self._expect_diagnostics(uri, version)
+        await self.send_notification(
+            "textDocument/didChange", full_text_did_change_params(uri, version, text)
+        )
+        return await self._wait_for_diagnostics(uri, version, future, timeout)
+
+    async def did_close(self, uri: str) -> None:
+        await self.send_notification(
+            "textDocument/didClose", {"textDocument": {"uri": uri}}
+        )
+
+    async def stop(self) -> None:
+        try:
+            await asyncio.wait_for(self.send_request("shutdown"), 10)
+            await self.send_notification("exit")
+            await asyncio.wait_for(self.process.wait(), 10)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            self.process.kill()
+        if self.reader_task is not None:
+            await asyncio.gather(self.reader_task, return_exceptions=True)
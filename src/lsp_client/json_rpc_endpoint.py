@@ -1,11 +1,17 @@
 from __future__ import print_function
 import json
-import re
 import threading
-from typing import IO
+from typing import IO, Tuple
 
-JSON_RPC_REQ_FORMAT = "Content-Length: {json_string_len}\r\n\r\n{json_string}"
-JSON_RPC_RES_REGEX = "Content-Length: ([0-9]*)\r\n"
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_RPC_HEADER_FORMAT = b"Content-Length: %d\r\n\r\n"
+CONTENT_LENGTH_HEADER = b"content-length"
+CONTENT_TYPE_HEADER = b"content-type"
+DEFAULT_CHARSET = "utf-8"
 
 
 class MyEncoder(json.JSONEncoder):
@@ -17,6 +23,42 @@ class MyEncoder(json.JSONEncoder):
         return o.__dict__
 
 
+def _encode_object(o):
+    return o.__dict__
+
+
+def dumps_message(message) -> bytes:
+    """Encodes a message as UTF-8 JSON bytes, with orjson if it is installed."""
+    if orjson is not None:
+        return orjson.dumps(message, default=_encode_object)
+    return json.dumps(message, cls=MyEncoder).encode(DEFAULT_CHARSET)
+
+
+def loads_message(body: bytes, charset: str = DEFAULT_CHARSET):
+    """Decodes a message straight from its bytes, with orjson if it is installed."""
+    if charset not in ("utf-8", "utf8"):
+        body = body.decode(charset)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def get_charset(content_type: bytes) -> str:
+    for parameter in content_type.split(b";")[1:]:
+        name, _, value = parameter.partition(b"=")
+        if name.strip().lower() == b"charset":
+            return value.strip().strip(b'"').decode("ascii").lower()
+    return DEFAULT_CHARSET
+
+
+def parse_header_field(line: bytes) -> Tuple[bytes, bytes]:
+    """Splits a header line into its lowercase field name and its value."""
+    name, separator, value = line.partition(b":")
+    if not separator:
+        raise RuntimeError("Bad header: " + line.decode(errors="replace"))
+    return name.strip().lower(), value.strip()
+
+
 class JsonRpcEndpoint(object):
     """
     Thread safe JSON RPC endpoint implementation. Responsible to recieve and send JSON RPC messages, as described in the
@@ -29,36 +71,35 @@ class JsonRpcEndpoint(object):
         self.read_lock = threading.Lock()
         self.write_lock = threading.Lock()
 
-    @staticmethod
-    def _add_header(json_string: str) -> str:
-        return JSON_RPC_REQ_FORMAT.format(
-            json_string_len=len(json_string),
-            json_string=json_string,
-        )
-
     def write_message(self, message):
-        json_string = json.dumps(message, cls=MyEncoder)
-        # print("\nSENDING:", json_string)
-        jsonrpc_req = self._add_header(json_string)
+        body = dumps_message(message)
+        # print("\nSENDING:", body)
+        # The Content-Length is the number of bytes of the body, not the number of characters
         with self.write_lock:
-            self.stdin.write(jsonrpc_req.encode())
+            self.stdin.write(JSON_RPC_HEADER_FORMAT % len(body))
+            self.stdin.write(body)
             self.stdin.flush()
 
     def read_response(self):
         with self.read_lock:
-            line = self.stdout.readline()
-            if not line:
-                return None
-            line = line.decode()
-            match = re.match(JSON_RPC_RES_REGEX, line)
-            if match is None or not match.groups():
-                raise RuntimeError("Bad header: " + line)
-            size = int(match.groups()[0])
-            line = self.stdout.readline()
-            if not line:
+            content_length = None
+            charset = DEFAULT_CHARSET
+            # The header part consists of header fields, such as Content-Type, and ends with an empty line
+            while True:
+                line = self.stdout.readline()
+                if not line:
+                    return None
+                if line in (b"\r\n", b"\n"):
+                    break
+                name, value = parse_header_field(line)
+                if name == CONTENT_LENGTH_HEADER:
+                    content_length = int(value)
+                elif name == CONTENT_TYPE_HEADER:
+                    charset = get_charset(value)
+            if content_length is None:
+                raise RuntimeError("Bad header: missing Content-Length")
+
+            body = self.stdout.read(content_length)
+            if len(body) < content_length:
                 return None
-            line = line.decode()
-            if line != "\r\n":
-                raise RuntimeError("Bad header: missing newline")
-            jsonrpc_res = self.stdout.read(size)
-            return json.loads(jsonrpc_res)
+            return loads_message(body, charset)
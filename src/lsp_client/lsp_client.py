@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Dict, List
 from client.lsp_endpoint import LspEndpoint
 from lsprotocol import converters
 from lsprotocol.types import (
@@ -9,13 +9,26 @@ from lsprotocol.types import (
 )
 
 
+def full_text_did_change_params(uri: str, version: int, text: str) -> Dict[str, Any]:
+    """
+    Builds the params of a didChange notification that replaces the whole document as a plain dict,
+    exactly as lsprotocol unstructures them, without constructing and unstructuring attrs objects.
+    """
+    return {
+        "textDocument": {"uri": uri, "version": version},
+        "contentChanges": [{"text": text}],
+    }
+
+
 class LspClient(object):
     def __init__(self, lsp_endpoint: LspEndpoint):
         self.lsp_endpoint = lsp_endpoint
         self.converter = converters.get_converter()
 
-    def send_request(self, method: str, params: Any = None):
-        self.lsp_endpoint.send_request(method, params)
+    def send_request(
+        self, method: str, params: Any = None, timeout: float | None = None
+    ):
+        return self.lsp_endpoint.send_request(method, params, timeout)
 
     def send_notification(self, method: str, params: Any = None):
         self.lsp_endpoint.send_notification(method, params)
@@ -24,10 +37,10 @@ class LspClient(object):
         self.lsp_endpoint.send_result(method, result)
 
     # --- Standard LSP methods ---
-    def initialize(self, params: InitializeParams):
+    def initialize(self, params: InitializeParams, timeout: float | None = None):
         self.lsp_endpoint.start()
         return self.send_request(
-            "initialize", self.converter.unstructure(params, InitializeParams)
+            "initialize", self.converter.unstructure(params, InitializeParams), timeout
         )
 
     def initialized(self):
@@ -48,6 +61,30 @@ class LspClient(object):
             self.converter.unstructure(params, DidChangeTextDocumentParams),
         )
 
+    def did_change_full_text(self, uri: str, version: int, text: str):
+        # Fast path for the didChange notification that is sent for every checked candidate
+        return self.send_notification(
+            "textDocument/didChange", full_text_did_change_params(uri, version, text)
+        )
+
+    def document_diagnostics(
+        self, uris: List[str], timeout: float | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Pulls the diagnostic reports of several documents with pipelined textDocument/diagnostic
+        requests, and returns them in the order of the documents.
+        """
+        request_ids = [
+            self.lsp_endpoint.send_request_without_waiting(
+                "textDocument/diagnostic", {"textDocument": {"uri": uri}}
+            )
+            for uri in uris
+        ]
+        return [
+            self.lsp_endpoint.wait_for_response(request_id, timeout)
+            for request_id in request_ids
+        ]
+
     def did_close(self, params: DidCloseTextDocumentParams):
         return self.send_notification(
             "textDocument/didClose",
@@ -1,4 +1,4 @@
-from __future__ import print_function
+from __future__ import annotations, print_function
 import threading
 from typing import Callable, Dict
 
@@ -11,10 +11,13 @@ class LspEndpoint(threading.Thread):
         json_rpc_endpoint: JsonRpcEndpoint,
         default_callback: Callable = print,
         callbacks: Dict[str, Callable] = {},
+        request_callbacks: Dict[str, Callable] = {},
     ):
         threading.Thread.__init__(self)
         self.json_rpc_endpoint = json_rpc_endpoint
         self.callbacks = callbacks
+        # Requests from the server are answered with the result of their callback
+        self.request_callbacks = request_callbacks
         self.default_callback = default_callback
         self.event_dict = {}
         self.response_dict = {}
@@ -22,11 +25,22 @@ class LspEndpoint(threading.Thread):
         self.shutdown_flag = False
 
     def handle_result(self, jsonrpc_res):
+        # Responses to requests that timed out are dropped
+        event = self.event_dict.get(jsonrpc_res["id"])
+        if event is None:
+            return
         self.response_dict[jsonrpc_res["id"]] = jsonrpc_res
-        cond = self.event_dict[jsonrpc_res["id"]]
-        cond.acquire()
-        cond.notify()
-        cond.release()
+        event.set()
+
+    def handle_request(self, jsonrpc_message):
+        # The server waits for an answer, so unknown requests are answered with an empty result
+        request_callback = self.request_callbacks.get(jsonrpc_message["method"])
+        result = (
+            request_callback(jsonrpc_message.get("params"))
+            if request_callback is not None
+            else None
+        )
+        self.send_response(jsonrpc_message["id"], result)
 
     def stop(self):
         self.shutdown_flag = True
@@ -42,6 +56,8 @@ class LspEndpoint(threading.Thread):
             # print("\nRECIEVED MESSAGE:", jsonrpc_message)
             if "result" in jsonrpc_message or "error" in jsonrpc_message:
                 self.handle_result(jsonrpc_message)
+            elif "method" in jsonrpc_message and "id" in jsonrpc_message:
+                self.handle_request(jsonrpc_message)
             elif "method" in jsonrpc_message:
                 if jsonrpc_message["method"] in self.callbacks:
                     self.callbacks[jsonrpc_message["method"]](jsonrpc_message)
@@ -70,19 +86,35 @@ class LspEndpoint(threading.Thread):
             message_dict["result"] = result
         self.json_rpc_endpoint.write_message(message_dict)
 
-    def send_request(self, method_name: str, params=None):
+    def send_response(self, id, result):
+        self.json_rpc_endpoint.write_message(
+            {"jsonrpc": "2.0", "id": id, "result": result}
+        )
+
+    def send_request_without_waiting(self, method_name: str, params=None) -> int:
+        # Several requests can be outstanding at once, their responses are matched by id
         current_id = self.next_id
         self.next_id += 1
-        cond = threading.Condition()
-        self.event_dict[current_id] = cond
-        cond.acquire()
+        self.event_dict[current_id] = threading.Event()
         self.send_message(method_name, params, current_id)
-        cond.wait()
-        cond.release()
-        response = self.response_dict[current_id]
+        return current_id
+
+    def wait_for_response(self, request_id: int, timeout: float | None = None):
+        if not self.event_dict[request_id].wait(timeout):
+            del self.event_dict[request_id]
+            raise TimeoutError(
+                f"No response to request {request_id} within {timeout} seconds"
+            )
+        del self.event_dict[request_id]
+        response = self.response_dict.pop(request_id)
         if "error" in response:
             raise Exception(response["error"])
         return response["result"]
 
+    def send_request(self, method_name: str, params=None, timeout: float | None = None):
+        return self.wait_for_response(
+            self.send_request_without_waiting(method_name, params), timeout
+        )
+
     def send_notification(self, method_name: str, params=None):
         self.send_message(method_name, params)
@@ -0,0 +1,417 @@
+"""
+Records the JSON-RPC exchange between py-hint-search and pyright-langserver, and replays it with a fake
+server, so that search engines and LSP client changes can be benchmarked offline and deterministically,
+without Node and Pyright.
+
+Record a session with `python lsp_replay.py record --output DIR -- pyright-langserver --stdio`, which
+sits between the client and the server and writes every message to a session file in DIR. Replay it
+with `python lsp_replay.py replay --recording DIR`, which answers every document text of the recording
+with its recorded diagnostics and any other text with no diagnostics after a fixed latency.
+"""
+from __future__ import annotations
+import argparse
+import glob
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, List, Tuple
+
+from client.json_rpc_endpoint import (
+    JsonRpcEndpoint,
+    dumps_message,
+    loads_message,
+)
+
+SESSION_FILE_NAME = "session-{pid}.jsonl"
+FALLBACK_LATENCY_SECONDS = 0.05
+# Used when the recording has no initialize result: full document sync, like FakeEditor sends
+DEFAULT_SERVER_CAPABILITIES = {"textDocumentSync": 1}
+
+
+def get_record_command(output_directory: str, command: List[str]) -> List[str]:
+    """Returns the command that starts the language server command through the session recorder."""
+    return [
+        sys.executable,
+        os.path.realpath(__file__),
+        "record",
+        "--output",
+        os.path.abspath(output_directory),
+        "--",
+    ] + command
+
+
+def get_replay_command(
+    recording_path: str, latency: float = FALLBACK_LATENCY_SECONDS
+) -> List[str]:
+    """Returns the command that starts a fake server that replays a recording."""
+    return [
+        sys.executable,
+        os.path.realpath(__file__),
+        "replay",
+        "--recording",
+        os.path.abspath(recording_path),
+        "--latency",
+        str(latency),
+    ]
+
+
+def record_session(output_directory: str, command: List[str]) -> int:
+    """
+    Starts the language server and forwards the messages between it and the client on stdin and stdout,
+    writing each of them with its time and direction to a new session file. Returns the exit code of
+    the server.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    session_path = os.path.join(
+        output_directory, SESSION_FILE_NAME.format(pid=os.getpid())
+    )
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    client = JsonRpcEndpoint(sys.stdout.buffer, sys.stdin.buffer)
+    server = JsonRpcEndpoint(process.stdin, process.stdout)
+    start_time = time.perf_counter()
+    recording_lock = threading.Lock()
+
+    recording = open(session_path, "wb")
+
+    def forward(source: JsonRpcEndpoint, target: JsonRpcEndpoint, sender: str):
+        while (message := source.read_response()) is not None:
+            record = {
+                "time": time.perf_counter() - start_time,
+                "from": sender,
+                "message": message,
+            }
+            with recording_lock:
+                if recording.closed:
+                    return
+                recording.write(dumps_message(record) + b"\n")
+            try:
+                target.write_message(message)
+            except (BrokenPipeError, ValueError):
+                return
+        if sender == "client":
+            # The client has quit, so the server gets no more messages
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    # The session ends when the server closes its output, e.g. after the exit notification, even if
+    # the client keeps its pipe open
+    threading.Thread(
+        target=forward, args=(client, server, "client"), daemon=True
+    ).start()
+    forward(server, client, "server")
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    with recording_lock:
+        recording.close()
+    return process.returncode
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RecordedSession:
+    """The answers of the server in one or more recorded sessions, by document text."""
+
+    initialize_result: Dict[str, Any] | None = None
+    # The capabilities that the server registered after the initialization
+    registrations: List[Dict[str, Any]] = field(default_factory=list)
+    diagnostics: Dict[str, List[Dict]] = field(default_factory=dict)
+    # The time between a change of the document and its diagnostics
+    latencies: Dict[str, float] = field(default_factory=dict)
+    number_of_pushed_diagnostics: int = 0
+    number_of_pulled_diagnostics: int = 0
+
+    @property
+    def pushes_diagnostics(self) -> bool:
+        """Whether the server pushed diagnostics after a change, or only answered pull requests."""
+        return (
+            self.number_of_pushed_diagnostics > 0
+            or self.number_of_pulled_diagnostics == 0
+        )
+
+    def add_diagnostics(
+        self, text: str | None, diagnostics: List[Dict], latency: float
+    ) -> None:
+        # The first answer for a text is kept, later ones of the same text give the same verdicts
+        if text is None or _text_key(text) in self.diagnostics:
+            return
+        self.diagnostics[_text_key(text)] = diagnostics
+        self.latencies[_text_key(text)] = latency
+
+    def get_diagnostics(self, text: str) -> Tuple[List[Dict], float] | None:
+        key = _text_key(text)
+        if key not in self.diagnostics:
+            return None
+        return self.diagnostics[key], self.latencies[key]
+
+
+def _load_session_file(session_path: str, session: RecordedSession) -> None:
+    with open(session_path, "rb") as recording:
+        records = [loads_message(line) for line in recording if line.strip()]
+
+    # The text of each open document and the time it was last changed
+    documents: Dict[str, Tuple[str | None, float]] = {}
+    changes: Dict[Tuple[str, int], Tuple[str | None, float]] = {}
+    client_requests: Dict[Any, Tuple[str, str | None, float]] = {}
+    for record in records:
+        message = record["message"]
+        method = message.get("method")
+        if record["from"] == "client":
+            params = message.get("params") or {}
+            if method == "textDocument/didOpen":
+                document = params["textDocument"]
+                documents[document["uri"]] = (document["text"], record["time"])
+                changes[(document["uri"], document["version"])] = documents[
+                    document["uri"]
+                ]
+            elif method == "textDocument/didChange":
+                document = params["textDocument"]
+                content_changes = params["contentChanges"]
+                # Only changes that replace the full text give a known text
+                text = (
+                    content_changes[-1]["text"]
+                    if len(content_changes) > 0 and "range" not in content_changes[-1]
+                    else None
+                )
+                documents[document["uri"]] = (text, record["time"])
+                changes[(document["uri"], document["version"])] = documents[
+                    document["uri"]
+                ]
+            elif method == "textDocument/didClose":
+                documents.pop(params["textDocument"]["uri"], None)
+            elif method is not None and "id" in message:
+                uri = params.get("textDocument", {}).get("uri")
+                text = documents.get(uri, (None, None))[0]
+                client_requests[message["id"]] = (method, text, record["time"])
+        else:
+            if method == "textDocument/publishDiagnostics":
+                params = message["params"]
+                version = params.get("version")
+                if version is not None:
+                    session.number_of_pushed_diagnostics += 1
+                    change = changes.pop((params["uri"], version), None)
+                else:
+                    # Without a version, the diagnostics belong to the current text of the document
+                    change = documents.get(params["uri"])
+                if change is not None:
+                    session.add_diagnostics(
+                        change[0], params["diagnostics"], record["time"] - change[1]
+                    )
+            elif method == "client/registerCapability":
+                session.registrations.append(message["params"])
+            elif method is None and message.get("id") in client_requests:
+                request_method, text, request_time = client_requests.pop(message["id"])
+                result = message.get("result")
+                if request_method == "initialize" and result is not None:
+                    session.initialize_result = result
+                elif (
+                    request_method == "textDocument/diagnostic"
+                    and result is not None
+                    and result.get("kind") == "full"
+                ):
+                    session.number_of_pulled_diagnostics += 1
+                    session.add_diagnostics(
+                        text, result["items"], record["time"] - request_time
+                    )
+
+
+def load_recording(recording_path: str) -> RecordedSession:
+    """Loads a session file, or all session files of a directory, into one recorded session."""
+    if os.path.isdir(recording_path):
+        session_paths = sorted(glob.glob(os.path.join(recording_path, "*.jsonl")))
+    else:
+        session_paths = [recording_path]
+    session = RecordedSession()
+    for session_path in session_paths:
+        _load_session_file(session_path, session)
+    return session
+
+
+class FakePyrightServer:
+    """
+    A stand-in for pyright-langserver that answers with the diagnostics of a recorded session. The
+    diagnostics of a recorded text are sent after its recorded latency times the latency scale, those
+    of any other text are empty and sent after the fallback latency. Both push and pull diagnostics
+    are supported, depending on what the recorded server registered.
+    """
+
+    def __init__(
+        self,
+        session: RecordedSession,
+        latency: float = FALLBACK_LATENCY_SECONDS,
+        latency_scale: float = 1.0,
+    ) -> None:
+        self.session = session
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.documents: Dict[str, Tuple[str, int | None]] = {}
+        self.number_of_replayed_checks = 0
+        self.number_of_missed_checks = 0
+        self.next_request_id = 0
+
+    def _get_diagnostics(self, text: str) -> List[Dict]:
+        recorded = self.session.get_diagnostics(text)
+        if recorded is None:
+            self.number_of_missed_checks += 1
+            time.sleep(self.latency)
+            return []
+        self.number_of_replayed_checks += 1
+        diagnostics, latency = recorded
+        time.sleep(latency * self.latency_scale)
+        return diagnostics
+
+    def _publish_diagnostics(
+        self, endpoint: JsonRpcEndpoint, uri: str, diagnostics: List[Dict]
+    ) -> None:
+        params: Dict[str, Any] = {"uri": uri, "diagnostics": diagnostics}
+        if uri in self.documents:
+            params["version"] = self.documents[uri][1]
+        endpoint.write_message(
+            {
+                "jsonrpc": "2.0",
+                "method": "textDocument/publishDiagnostics",
+                "params": params,
+            }
+        )
+
+    def _push_diagnostics(self, endpoint: JsonRpcEndpoint, uri: str) -> None:
+        if not self.session.pushes_diagnostics:
+            return
+        diagnostics = self._get_diagnostics(self.documents[uri][0])
+        self._publish_diagnostics(endpoint, uri, diagnostics)
+
+    def _respond(self, endpoint: JsonRpcEndpoint, request_id: Any, result: Any):
+        endpoint.write_message({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+    def serve(self, stdin: IO[bytes], stdout: IO[bytes]) -> None:
+        """Answers the messages of a client until it sends exit or closes the input."""
+        endpoint = JsonRpcEndpoint(stdout, stdin)
+        while (message := endpoint.read_response()) is not None:
+            method = message.get("method")
+            params = message.get("params") or {}
+            if method == "initialize":
+                result = self.session.initialize_result or {
+                    "capabilities": DEFAULT_SERVER_CAPABILITIES
+                }
+                self._respond(endpoint, message["id"], result)
+            elif method == "initialized":
+                for registration_params in self.session.registrations:
+                    endpoint.write_message(
+                        {
+                            "jsonrpc": "2.0",
+                            "id": f"fake-{self.next_request_id}",
+                            "method": "client/registerCapability",
+                            "params": registration_params,
+                        }
+                    )
+                    self.next_request_id += 1
+            elif method == "shutdown":
+                self._respond(endpoint, message["id"], None)
+            elif method == "exit":
+                return
+            elif method == "textDocument/didOpen":
+                document = params["textDocument"]
+                self.documents[document["uri"]] = (
+                    document["text"],
+                    document["version"],
+                )
+                self._push_diagnostics(endpoint, document["uri"])
+            elif method == "textDocument/didChange":
+                document = params["textDocument"]
+                text = self.documents.get(document["uri"], ("", None))[0]
+                for change in params["contentChanges"]:
+                    # Changes of a range are not tracked, they are checked like an unknown text
+                    text = change["text"] if "range" not in change else ""
+                self.documents[document["uri"]] = (text, document["version"])
+                self._push_diagnostics(endpoint, document["uri"])
+            elif method == "textDocument/didClose":
+                uri = params["textDocument"]["uri"]
+                self.documents.pop(uri, None)
+                self._publish_diagnostics(endpoint, uri, [])
+            elif method == "textDocument/diagnostic":
+                text = self.documents.get(params["textDocument"]["uri"], ("", None))[0]
+                items = self._get_diagnostics(text)
+                self._respond(endpoint, message["id"], {"kind": "full", "items": items})
+            elif method is not None and "id" in message:
+                self._respond(endpoint, message["id"], None)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Record a language server session or replay it with a fake Pyright server"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser(
+        "record", help="Run a language server and record its session."
+    )
+    record_parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="The directory the session file is written to.",
+    )
+    record_parser.add_argument(
+        "server_command",
+        nargs=argparse.REMAINDER,
+        help="The command that starts the language server, after --.",
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Answer like the language server of a recorded session."
+    )
+    replay_parser.add_argument(
+        "--recording",
+        type=str,
+        required=True,
+        help="A session file, or a directory with session files.",
+    )
+    replay_parser.add_argument(
+        "--latency",
+        type=float,
+        default=FALLBACK_LATENCY_SECONDS,
+        help="The number of seconds before answering a document text that is not in the recording.",
+    )
+    replay_parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Multiplies the recorded latencies, e.g. 0 to answer recorded texts immediately.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == "record":
+        server_command = args.server_command
+        if len(server_command) > 0 and server_command[0] == "--":
+            server_command = server_command[1:]
+        exit_code = record_session(args.output, server_command)
+        sys.stdout.flush()
+        # The thread that reads from the client may still be blocked on stdin, which would block exiting
+        os._exit(exit_code)
+    server = FakePyrightServer(
+        load_recording(args.recording), args.latency, args.latency_scale
+    )
+    server.serve(sys.stdin.buffer, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
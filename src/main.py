@@ -2,14 +2,18 @@ import json
 import os
 import argparse
 import time
-from typing import Dict, Tuple
+from typing import Any, Dict, Tuple
 import libcst as cst
 import colorama
 from colorama import Fore
 import tracemalloc
 
 from loggers import create_evaluation_logger, create_main_logger, close_logger
-from fake_editor import FakeEditor
+from fake_editor import (
+    FakeEditor,
+    resolve_pyright_langserver_command,
+    set_langserver_command_override,
+)
 from imports import (
     add_import_to_source_code_tree,
     get_all_classes_in_project,
@@ -28,7 +32,47 @@ from searchtree import (
     transform_predictions_to_slots_to_search,
     build_search_tree,
     depth_first_traversal,
+    best_first_traversal,
+    restarting_depth_first_traversal,
+    SEARCH_TIMEOUT_SECONDS,
+    SearchStatus,
+)
+from async_batch import AsyncBatchVerifier
+from acceptance import (
+    AcceptanceStatistics,
+    load_acceptance_statistics,
+    save_acceptance_statistics,
+)
+from candidates import prefilter_candidates
+from checkpoints import get_checkpoint_file
+from nogoods import NogoodStore
+from portfolio import SearchPortfolio
+from pyright_batch import PyrightBatchEditor, PyrightBatchVerifier
+from slicing import SliceEditor, verify_full_module
+from lsp_replay import FALLBACK_LATENCY_SECONDS, get_record_command, get_replay_command
+from pyright_daemon import (
+    DAEMON_IDLE_TIMEOUT_SECONDS,
+    PyrightDaemonException,
+    daemon_supported,
+    ensure_pyright_daemon,
+    get_configuration_hash,
+    get_daemon_socket_path,
+)
+from search_profile import (
+    SEARCH_PROFILE_WORKSPACE_CONFIGURATION,
+    get_search_profile_config,
 )
+from server_monitor import DIAGNOSTICS_TIMEOUT_SECONDS, ServerMonitor
+from rule_based import fill_rule_based_type_slots
+from phases import (
+    apply_phase_result,
+    collect_phase_result,
+    count_phase_annotations,
+    get_phase_results_file,
+    load_phase_results,
+    save_phase_results,
+)
+from slot_ordering import SLOT_ORDERING_STRATEGIES, order_search_tree_layers
 from stubs import create_stub_file
 from evaluation import (
     append_to_evaluation_csv_file,
@@ -54,6 +98,12 @@ def parse_arguments() -> argparse.Namespace:
         else:
             raise NotADirectoryError(normalized_path)
 
+    def positive_int(string: str) -> int:
+        value = int(string)
+        if value < 1:
+            raise argparse.ArgumentTypeError(f"{value} is not at least 1")
+        return value
+
     parser.add_argument(
         "--project-path",
         type=dir_path,
@@ -72,6 +122,195 @@ def parse_arguments() -> argparse.Namespace:
         default="1",
         help="Try the top-n type annotation predictions during search.",
     )
+    parser.add_argument(
+        "--adaptive-top-n",
+        action="store_true",
+        help="Select up to top-n type annotation predictions per slot based on the prediction confidences.",
+    )
+    parser.add_argument(
+        "--cumulative-probability",
+        type=float,
+        default=0.9,
+        help="Stop adding predictions to a slot once their cumulative probability reaches this value (adaptive top-n only).",
+    )
+    parser.add_argument(
+        "--confidence-drop",
+        type=float,
+        default=0.2,
+        help="Stop adding predictions to a slot once a prediction is less than this fraction as likely as the previous one (adaptive top-n only).",
+    )
+    parser.add_argument(
+        "--branching-budget",
+        type=int,
+        default=None,
+        help="The maximum number of type annotation predictions over all slots of a file (adaptive top-n only).",
+    )
+    parser.add_argument(
+        "--phases",
+        type=int,
+        nargs="+",
+        choices=range(1, 6),
+        default=None,
+        help="Annotate the project in phases with increasing top-n (e.g. '--phases 1 5'). Each phase only searches the type slots left unresolved by the previous phase. Overrides --top-n.",
+    )
+    parser.add_argument(
+        "--rule-based-annotations",
+        action="store_true",
+        help="Fill trivial type slots (e.g. `__init__` returns and parameters with literal defaults) without searching them. They are verified with a single Pyright check per file.",
+    )
+    parser.add_argument(
+        "--learn-candidate-order",
+        action="store_true",
+        help="Reorder the type annotation predictions of a slot by how often they were accepted for slots with the same name in the files processed before.",
+    )
+    parser.add_argument(
+        "--acceptance-statistics-file",
+        type=str,
+        default=None,
+        help="Load and save the acceptance statistics of --learn-candidate-order in this JSON file, so that they are kept between runs.",
+    )
+    parser.add_argument(
+        "--search-strategy",
+        type=str,
+        choices=["dfs", "best-first", "dfs-restarts"],
+        default="dfs",
+        help="The search strategy used to find a valid combination of type annotations.",
+    )
+    parser.add_argument(
+        "--forward-checking",
+        action="store_true",
+        help="After accepting a type annotation, check the candidates of the related later type slots at once and drop the rejected ones (dfs and dfs-restarts only).",
+    )
+    parser.add_argument(
+        "--parallel-candidates",
+        action="store_true",
+        help="Check the next candidates of a type slot at the same time and take the highest ranked one without errors (dfs and dfs-restarts only).",
+    )
+    parser.add_argument(
+        "--shadow-documents",
+        type=positive_int,
+        default=4,
+        help="The number of virtual copies of a file that Pyright checks at the same time for --forward-checking and --parallel-candidates.",
+    )
+    parser.add_argument(
+        "--batch-backend",
+        type=str,
+        choices=["lsp", "cli", "async"],
+        default="lsp",
+        help="How --forward-checking and --parallel-candidates check many candidates at once: with shadow documents in the language server (lsp), with one run of the Pyright CLI per batch (cli) or concurrently with a separate asyncio language server client (async).",
+    )
+    parser.add_argument(
+        "--pyright-daemon",
+        action="store_true",
+        help="Attach to a warm pyright-langserver that stays alive between runs on the same project and virtual environment, and start it if it is not running yet.",
+    )
+    parser.add_argument(
+        "--pyright-daemon-idle-timeout",
+        type=float,
+        default=DAEMON_IDLE_TIMEOUT_SECONDS,
+        help="The number of seconds without a run after which the Pyright daemon shuts down.",
+    )
+    parser.add_argument(
+        "--search-profile",
+        action="store_true",
+        help="Generate a Pyright config that only analyses the annotated files and only reports the rules that can reject a type annotation.",
+    )
+    parser.add_argument(
+        "--pull-diagnostics",
+        action="store_true",
+        help="Request the diagnostics of every check with textDocument/diagnostic when the Pyright version supports it, instead of waiting for pushed diagnostics.",
+    )
+    parser.add_argument(
+        "--slice-mode",
+        action="store_true",
+        help="Check the type annotations of a function on a slice of the module with only that function and its context, and verify the result once on the full module.",
+    )
+    parser.add_argument(
+        "--diagnostics-timeout",
+        type=float,
+        default=DIAGNOSTICS_TIMEOUT_SECONDS,
+        help="Restart Pyright and retry the check when it does not send diagnostics within this many seconds.",
+    )
+    parser.add_argument(
+        "--server-memory-limit",
+        type=float,
+        default=None,
+        help="Restart Pyright when its memory usage exceeds this many MB.",
+    )
+    parser.add_argument(
+        "--server-latency-limit",
+        type=float,
+        default=None,
+        help="Restart Pyright when its average check latency over the last checks exceeds this many seconds.",
+    )
+    parser.add_argument(
+        "--record-lsp-session",
+        type=str,
+        default=None,
+        help="Record the JSON-RPC messages of every language server session to a file in this directory.",
+    )
+    parser.add_argument(
+        "--fake-pyright",
+        type=str,
+        default=None,
+        help="Replace Pyright by a fake server that replays the diagnostics of this recorded session file or directory.",
+    )
+    parser.add_argument(
+        "--fake-pyright-latency",
+        type=float,
+        default=FALLBACK_LATENCY_SECONDS,
+        help="The number of seconds the fake server takes to answer a document text that is not in the recording.",
+    )
+    parser.add_argument(
+        "--portfolio",
+        type=str,
+        nargs="+",
+        choices=["dfs", "best-first", "dfs-restarts"],
+        default=None,
+        help="Race these search strategies against each other on every file, each with its own Pyright instance. The first complete combination wins. Overrides --search-strategy.",
+    )
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        default=10,
+        help="The maximum number of partial type annotation combinations kept by the best-first search.",
+    )
+    parser.add_argument(
+        "--restart-base-failures",
+        type=int,
+        default=16,
+        help="The number of failed type annotations after which the first restart happens. Later budgets grow with the Luby sequence (dfs-restarts only).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="The random seed used to perturb the order of the type slots on a restart (dfs-restarts only).",
+    )
+    parser.add_argument(
+        "--learn-nogoods",
+        action="store_true",
+        help="Remember combinations of type annotations rejected by Pyright and skip them without checking them again.",
+    )
+    parser.add_argument(
+        "--slot-order",
+        type=str,
+        choices=list(SLOT_ORDERING_STRATEGIES),
+        default="source",
+        help="The order in which the type slots are searched.",
+    )
+    parser.add_argument(
+        "--search-timeout",
+        type=float,
+        default=SEARCH_TIMEOUT_SECONDS,
+        help="The maximum number of seconds the ML search may take per file.",
+    )
+    parser.add_argument(
+        "--checkpoint-directory",
+        type=str,
+        default=None,
+        help="Store the state of a search that times out or is interrupted in this directory, so that a later run continues the search of that file instead of starting over (dfs only).",
+    )
     parser.add_argument(
         "--only-run-pyright",
         type=bool,
@@ -88,8 +327,12 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def create_pyright_config_file(project_path: str, venv_path: str | None) -> None:
+def create_pyright_config_file(
+    project_path: str, venv_path: str | None, search_profile: bool = False
+) -> None:
     config = {"typeCheckingMode": "strict"}
+    if search_profile:
+        config |= get_search_profile_config(project_path, venv_path)
 
     if venv_path is not None:
         config["venvPath"] = venv_path
@@ -196,9 +439,15 @@ def preprocess_source_code_tree(source_code_tree: cst.Module) -> cst.Module:
 def run_ml_search(
     source_code_tree: cst.Module,
     file: str,
+    file_path: str,
     added_extra_pyright_annotations: bool,
     editor: FakeEditor,
     all_project_classes: Dict[str, str],
+    nogood_store: NogoodStore | None = None,
+    checkpoint_file: str | None = None,
+    portfolio: SearchPortfolio | None = None,
+    acceptance_statistics: AcceptanceStatistics | None = None,
+    batch_verifier: PyrightBatchVerifier | AsyncBatchVerifier | None = None,
 ) -> tuple[cst.Module, bool, bool, int]:
     """
     Returns:
@@ -207,6 +456,17 @@ def run_ml_search(
         should_skip_file: boolean indicating whether the file should be skipped
         number_of_ml_evaluated_type_slots: integer value of the number of type slots evaluated by the ML model
     """
+    # Fill the type slots that follow from the source code alone, so they are not searched
+    rule_based_annotations = {}
+    if args.rule_based_annotations:
+        source_code_tree, rule_based_annotations = fill_rule_based_type_slots(
+            source_code_tree, editor
+        )
+        if len(rule_based_annotations) > 0:
+            logger.info(
+                f"Filled {len(rule_based_annotations)} type slots with rule-based annotations"
+            )
+
     # Get available and already type annotated parameters and return types
     visitor_type_slots = TypeSlotsVisitor()
     source_code_tree.visit(visitor_type_slots)
@@ -231,6 +491,10 @@ def run_ml_search(
             print(f"{Fore.GREEN}'{file}' completed fully with Pyright annotations!")
             logger.info(f"'{file}' completed fully with Pyright annotations!")
             return source_code_tree, False, False, 0
+        elif len(rule_based_annotations) > 0:
+            print(f"{Fore.GREEN}'{file}' completed fully with rule-based annotations!")
+            logger.info(f"'{file}' completed fully with rule-based annotations!")
+            return source_code_tree, False, False, 0
         else:
             print(f"{Fore.BLUE}'{file}' has no type slots to fill. Skipping...\n")
             logger.info(f"'{file}' has no type slots to fill. Skipping...")
@@ -241,59 +505,154 @@ def run_ml_search(
         logger.warning(f"'{file}' contains too many type slots. Skipping...")
         return source_code_tree, False, True, 0
 
-    search_tree = build_search_tree(search_tree_layers, args.top_n)
-
-    type_annotated_source_code_tree = depth_first_traversal(
-        search_tree,
-        source_code_tree,
-        editor,
-        number_of_type_slots_to_fill,
-        all_project_classes,
+    # Collapse duplicate predictions and drop the ones that cannot be inserted before searching
+    current_file_path = editor.edit_document.uri.removeprefix("file:///")
+    search_tree_layers, import_plans = prefilter_candidates(
+        search_tree_layers, source_code_tree, all_project_classes, current_file_path
     )
-    return type_annotated_source_code_tree, True, False, number_of_type_slots_to_fill
 
+    # Try the predictions that were accepted most often for similar slots in earlier files first
+    if acceptance_statistics is not None:
+        search_tree_layers = acceptance_statistics.reorder_predictions(
+            search_tree_layers
+        )
 
-def main(args: argparse.Namespace) -> None:
-    working_directory = os.getcwd()
-    project_path = (
-        args.project_path.lstrip("/")
-        if args.project_path.startswith("/")
-        else args.project_path
+    search_tree_layers = order_search_tree_layers(
+        search_tree_layers, source_code_tree, args.slot_order
     )
-    root_uri = f"file:///{project_path}"
 
-    print("Gathering all local classes in the project...")
-    ALL_PROJECT_CLASSES = get_all_classes_in_project(args.project_path, args.venv_path)
-    if args.venv_path is not None:
-        venv_directory = args.venv_path.split(os.sep)[-1]
-        print("Gathering all classes in the virtual environment...")
-        ALL_VENV_CLASSES = get_all_classes_in_virtual_environment(args.venv_path)
-        ALL_PROJECT_CLASSES = ALL_VENV_CLASSES | ALL_PROJECT_CLASSES
+    search_tree = build_search_tree(
+        search_tree_layers,
+        args.top_n,
+        args.adaptive_top_n,
+        args.cumulative_probability,
+        args.confidence_drop,
+        args.branching_budget,
+        import_plans,
+    )
 
-    stubs_path_pyright = get_pyright_stubs_path(working_directory)
-    pyright_annotations_exist = os.path.isdir(stubs_path_pyright)
-    if not pyright_annotations_exist:
-        print(
-            f"{Fore.YELLOW}No Pyright stubs found. Skipping Pyright annotations...\n"
-            + "Recommended: Run Pyright command from README to create Pyright stubs\n"
+    # The other editors are synced with the file once the rule-based annotations are filled, so that
+    # their start errors are those of the source code that is searched
+    if portfolio is not None:
+        portfolio.open_file(file_path, source_code_tree)
+    if batch_verifier is not None:
+        batch_verifier.open_file(file_path, source_code_tree.code)
+        editor = PyrightBatchEditor(editor, batch_verifier)
+    elif (
+        (args.forward_checking or args.parallel_candidates)
+        and portfolio is None
+        and args.search_strategy != "best-first"
+    ):
+        editor.open_shadow_documents(args.shadow_documents)
+
+    full_module_editor = editor
+    if args.slice_mode and portfolio is None and batch_verifier is None:
+        editor = SliceEditor(editor, source_code_tree.code)
+
+    if portfolio is not None:
+        type_annotated_source_code_tree, search_status = portfolio.search(
+            search_tree,
+            source_code_tree,
+            number_of_type_slots_to_fill,
+            all_project_classes,
+            args.beam_width,
+            args.seed,
+            args.restart_base_failures,
+            nogood_store,
+            args.search_timeout,
         )
-        logger.warning(
-            "No Pyright stubs found. Skipping Pyright annotations... "
-            + "Recommended: Run Pyright command from README to create Pyright stubs"
+    elif args.search_strategy == "best-first":
+        type_annotated_source_code_tree, search_status = best_first_traversal(
+            search_tree,
+            source_code_tree,
+            editor,
+            number_of_type_slots_to_fill,
+            all_project_classes,
+            args.beam_width,
+            nogood_store,
+            args.search_timeout,
+        )
+    elif args.search_strategy == "dfs-restarts":
+        (
+            type_annotated_source_code_tree,
+            search_status,
+        ) = restarting_depth_first_traversal(
+            search_tree,
+            source_code_tree,
+            editor,
+            number_of_type_slots_to_fill,
+            all_project_classes,
+            args.seed,
+            args.restart_base_failures,
+            nogood_store=nogood_store,
+            timeout=args.search_timeout,
+            forward_checking=args.forward_checking,
+            parallel_candidates=args.parallel_candidates,
+        )
+    else:
+        type_annotated_source_code_tree, search_status = depth_first_traversal(
+            search_tree,
+            source_code_tree,
+            editor,
+            number_of_type_slots_to_fill,
+            all_project_classes,
+            nogood_store,
+            args.search_timeout,
+            checkpoint_file,
+            args.forward_checking,
+            args.parallel_candidates,
         )
 
-    typed_directory = (
-        f"type-annotated-top{args.top_n}"
-        if not args.only_run_pyright
-        else "pyright-annotated"
-    )
-    typed_path = os.path.abspath(os.path.join(working_directory, typed_directory))
+    if isinstance(editor, SliceEditor):
+        type_annotated_source_code_tree = verify_full_module(
+            type_annotated_source_code_tree, source_code_tree, full_module_editor
+        )
 
-    editor = FakeEditor()
-    editor.start(root_uri)
+    # Only a finished search has verified the candidates it passed over, and only the candidates
+    # that were kept in the search tree were tried at all
+    if acceptance_statistics is not None and search_status == SearchStatus.COMPLETE:
+        acceptance_statistics.record_search_outcome(
+            {
+                layer["func_name"] + (layer["param_name"],): layer["predictions"]
+                for layer in search_tree.values()
+            },
+            type_annotated_source_code_tree,
+        )
+    return type_annotated_source_code_tree, True, False, number_of_type_slots_to_fill
 
-    postfix = "pyright" if args.only_run_pyright else f"top{args.top_n}"
-    create_evaluation_csv_file(postfix)
+
+def annotate_project(
+    args: argparse.Namespace,
+    editor: FakeEditor,
+    all_project_classes: Dict[str, str],
+    working_directory: str,
+    pyright_annotations_exist: bool,
+    typed_path: str,
+    postfix: str,
+    phase_results_file: str | None = None,
+    previous_phase_results: Dict[str, Dict[str, Any]] | None = None,
+    portfolio: SearchPortfolio | None = None,
+    acceptance_statistics: AcceptanceStatistics | None = None,
+    batch_verifier: PyrightBatchVerifier | AsyncBatchVerifier | None = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns:
+        phase_results: the type annotations accepted by the ML search per file, which are persisted
+        to the phase results file (if any) and used as the starting point of the next phase
+    """
+    venv_directory = (
+        args.venv_path.split(os.sep)[-1] if args.venv_path is not None else None
+    )
+    phase_results = (
+        load_phase_results(phase_results_file) if phase_results_file is not None else {}
+    )
+
+    def count_pyright_checks() -> int:
+        return (
+            editor.number_of_checks
+            + (portfolio.number_of_worker_checks if portfolio is not None else 0)
+            + (batch_verifier.number_of_checks if batch_verifier is not None else 0)
+        )
 
     # Walk through project directories and type annotate all Python files
     for root, dirs, files in os.walk(args.project_path):
@@ -352,7 +711,7 @@ def main(args: argparse.Namespace) -> None:
                     working_directory,
                     file_path,
                     file,
-                    ALL_PROJECT_CLASSES,
+                    all_project_classes,
                 )
                 editor.change_file(source_code_tree.code, None)
                 editor.has_diagnostic_error(at_start=True)
@@ -386,12 +745,41 @@ def main(args: argparse.Namespace) -> None:
             #####################
             tracemalloc.start()
             start_time_ml_search = time.perf_counter()
+            number_of_checks_before_ml_search = count_pyright_checks()
 
             has_performed_ml_search = False
             should_skip_file = False
             number_of_ml_evaluated_type_slots = 0
+            nogood_store = None
             if not args.only_run_pyright:
                 source_code_tree = preprocess_source_code_tree(source_code_tree)
+                source_code_tree_before_ml_search = source_code_tree
+
+                # Start from the type annotations accepted in the previous phase, so only the unresolved slots are searched
+                relative_file = os.path.join(relative_path, file)
+                has_previous_phase_annotations = (
+                    previous_phase_results is not None
+                    and relative_file in previous_phase_results
+                )
+                if has_previous_phase_annotations:
+                    source_code_tree = apply_phase_result(
+                        source_code_tree, previous_phase_results[relative_file]
+                    )
+
+                if args.learn_nogoods:
+                    nogood_store = NogoodStore()
+
+                checkpoint_file = None
+                if (
+                    args.checkpoint_directory is not None
+                    and args.search_strategy == "dfs"
+                    and portfolio is None
+                ):
+                    checkpoint_file = get_checkpoint_file(
+                        os.path.join(args.checkpoint_directory, postfix),
+                        relative_path,
+                        file,
+                    )
 
                 (
                     source_code_tree,
@@ -401,11 +789,47 @@ def main(args: argparse.Namespace) -> None:
                 ) = run_ml_search(
                     source_code_tree,
                     file,
-                    added_extra_pyright_annotations,
+                    file_path,
+                    added_extra_pyright_annotations or has_previous_phase_annotations,
                     editor,
-                    ALL_PROJECT_CLASSES,
+                    all_project_classes,
+                    nogood_store,
+                    checkpoint_file,
+                    portfolio,
+                    acceptance_statistics,
+                    batch_verifier,
                 )
 
+                if (
+                    acceptance_statistics is not None
+                    and args.acceptance_statistics_file is not None
+                ):
+                    save_acceptance_statistics(
+                        args.acceptance_statistics_file, acceptance_statistics
+                    )
+
+                if portfolio is not None:
+                    portfolio.close_file()
+
+                # The search of this file is unfinished, so it is continued in a later run instead of being evaluated now
+                if checkpoint_file is not None and os.path.exists(checkpoint_file):
+                    print(
+                        f"{Fore.YELLOW}'{file}' search checkpoint saved. Continue it in a later run. Skipping...\n"
+                    )
+                    logger.warning(
+                        f"'{file}' search checkpoint saved. Continue it in a later run. Skipping..."
+                    )
+                    should_skip_file = True
+
+            if phase_results_file is not None and not args.only_run_pyright:
+                if not should_skip_file:
+                    phase_results[relative_file] = collect_phase_result(
+                        source_code_tree_before_ml_search, source_code_tree
+                    )
+                elif has_previous_phase_annotations:
+                    phase_results[relative_file] = previous_phase_results[relative_file]
+                save_phase_results(phase_results_file, phase_results)
+
             if should_skip_file:
                 editor.close_file()
                 continue
@@ -442,6 +866,8 @@ def main(args: argparse.Namespace) -> None:
                 finish_time_total,
                 peak_memory_usage_pyright if has_performed_pyright_step else 0,
                 peak_memory_usage_ml_search if has_performed_ml_search else 0,
+                count_pyright_checks() - number_of_checks_before_ml_search,
+                nogood_store.number_of_pruned_checks if nogood_store is not None else 0,
             )
             append_to_evaluation_csv_file(list(evaluation_statistics.values()), postfix)
 
@@ -449,6 +875,204 @@ def main(args: argparse.Namespace) -> None:
                 evaluation_logger.info(f"{k}: {v}")
             print()
 
+    return phase_results
+
+
+def main(args: argparse.Namespace) -> None:
+    working_directory = os.getcwd()
+    project_path = (
+        args.project_path.lstrip("/")
+        if args.project_path.startswith("/")
+        else args.project_path
+    )
+    root_uri = f"file:///{project_path}"
+
+    print("Gathering all local classes in the project...")
+    ALL_PROJECT_CLASSES = get_all_classes_in_project(args.project_path, args.venv_path)
+    if args.venv_path is not None:
+        print("Gathering all classes in the virtual environment...")
+        ALL_VENV_CLASSES = get_all_classes_in_virtual_environment(args.venv_path)
+        ALL_PROJECT_CLASSES = ALL_VENV_CLASSES | ALL_PROJECT_CLASSES
+
+    stubs_path_pyright = get_pyright_stubs_path(working_directory)
+    pyright_annotations_exist = os.path.isdir(stubs_path_pyright)
+    if not pyright_annotations_exist:
+        print(
+            f"{Fore.YELLOW}No Pyright stubs found. Skipping Pyright annotations...\n"
+            + "Recommended: Run Pyright command from README to create Pyright stubs\n"
+        )
+        logger.warning(
+            "No Pyright stubs found. Skipping Pyright annotations... "
+            + "Recommended: Run Pyright command from README to create Pyright stubs"
+        )
+
+    search_strategy_postfix = (
+        f"-{args.search_strategy}" if args.search_strategy != "dfs" else ""
+    )
+    if args.portfolio is not None:
+        search_strategy_postfix = f"-portfolio-{'-'.join(args.portfolio)}"
+    if args.adaptive_top_n:
+        search_strategy_postfix += "-adaptive"
+    if args.slot_order != "source":
+        search_strategy_postfix += f"-{args.slot_order}-order"
+    if args.rule_based_annotations:
+        search_strategy_postfix += "-rule-based"
+    if args.learn_candidate_order:
+        search_strategy_postfix += "-learned-order"
+    if args.forward_checking:
+        search_strategy_postfix += "-forward-checking"
+    if args.parallel_candidates:
+        search_strategy_postfix += f"-parallel{args.shadow_documents}"
+    if args.slice_mode:
+        search_strategy_postfix += "-slice"
+
+    if args.fake_pyright is not None:
+        set_langserver_command_override(
+            get_replay_command(args.fake_pyright, args.fake_pyright_latency)
+        )
+    elif args.record_lsp_session is not None:
+        set_langserver_command_override(
+            get_record_command(
+                args.record_lsp_session, resolve_pyright_langserver_command()
+            )
+        )
+
+    workspace_configuration = (
+        SEARCH_PROFILE_WORKSPACE_CONFIGURATION if args.search_profile else {}
+    )
+    daemon_socket = None
+    daemon_configuration_hash = get_configuration_hash(
+        args.project_path, workspace_configuration
+    )
+    # The daemon runs its own server, which is not recorded or replaced
+    if (
+        args.pyright_daemon
+        and args.fake_pyright is None
+        and args.record_lsp_session is None
+    ):
+        try:
+            if not daemon_supported():
+                raise PyrightDaemonException(
+                    "Unix sockets are not supported on this platform"
+                )
+            daemon_socket = get_daemon_socket_path(args.project_path, args.venv_path)
+            ensure_pyright_daemon(
+                daemon_socket,
+                root_uri,
+                daemon_configuration_hash,
+                args.pyright_daemon_idle_timeout,
+            )
+        except PyrightDaemonException as e:
+            print(f"{Fore.YELLOW}{e.message}. Starting Pyright without the daemon...")
+            logger.warning(f"{e.message}. Starting Pyright without the daemon")
+            daemon_socket = None
+
+    server_monitor = ServerMonitor(
+        args.server_memory_limit, args.server_latency_limit, args.diagnostics_timeout
+    )
+    editor = FakeEditor(
+        daemon_socket,
+        server_monitor,
+        args.pull_diagnostics,
+        daemon_configuration_hash,
+    )
+    if daemon_socket is not None and editor.daemon_connection is None:
+        print(
+            f"{Fore.YELLOW}The Pyright daemon is busy or unhealthy. Starting Pyright without the daemon..."
+        )
+        logger.warning(
+            "The Pyright daemon is busy or unhealthy. Starting Pyright without the daemon"
+        )
+    editor.workspace_configuration = workspace_configuration
+    editor.start(root_uri)
+
+    acceptance_statistics = None
+    if args.learn_candidate_order:
+        acceptance_statistics = (
+            load_acceptance_statistics(args.acceptance_statistics_file)
+            if args.acceptance_statistics_file is not None
+            else AcceptanceStatistics()
+        )
+
+    batch_verifier = None
+    if args.batch_backend == "cli" and (
+        args.forward_checking or args.parallel_candidates
+    ):
+        batch_verifier = PyrightBatchVerifier(args.project_path)
+    elif args.batch_backend == "async" and (
+        args.forward_checking or args.parallel_candidates
+    ):
+        batch_verifier = AsyncBatchVerifier(
+            root_uri,
+            args.shadow_documents,
+            args.diagnostics_timeout,
+            workspace_configuration,
+        )
+
+    portfolio = None
+    if args.portfolio is not None and not args.only_run_pyright:
+        portfolio = SearchPortfolio(list(dict.fromkeys(args.portfolio)), editor)
+        portfolio.start(root_uri)
+
+    # Without phases, the project is annotated in a single phase with the given top-n
+    phases = args.phases if args.phases is not None else [args.top_n]
+    previous_phase_results = None
+    for phase_index, top_n in enumerate(phases):
+        args.top_n = top_n
+        phase_prefix = f"phase{phase_index + 1}-" if args.phases is not None else ""
+        typed_directory = (
+            f"type-annotated-{phase_prefix}top{args.top_n}{search_strategy_postfix}"
+            if not args.only_run_pyright
+            else "pyright-annotated"
+        )
+        typed_path = os.path.abspath(os.path.join(working_directory, typed_directory))
+
+        postfix = (
+            "pyright"
+            if args.only_run_pyright
+            else f"{phase_prefix}top{args.top_n}{search_strategy_postfix}"
+        )
+        create_evaluation_csv_file(postfix)
+
+        phase_results_file = None
+        if args.phases is not None:
+            print(
+                f"Phase {phase_index + 1}: searching with the top-{top_n} predictions"
+            )
+            logger.info(
+                f"Phase {phase_index + 1}: searching with the top-{top_n} predictions"
+            )
+            phase_results_file = get_phase_results_file(working_directory, postfix)
+
+        phase_results = annotate_project(
+            args,
+            editor,
+            ALL_PROJECT_CLASSES,
+            working_directory,
+            pyright_annotations_exist,
+            typed_path,
+            postfix,
+            phase_results_file,
+            previous_phase_results,
+            portfolio,
+            acceptance_statistics,
+            batch_verifier,
+        )
+
+        if args.phases is not None:
+            logger.info(
+                f"Phase {phase_index + 1}: {count_phase_annotations(phase_results)} accepted ML search annotations"
+            )
+        previous_phase_results = phase_results
+
+    if portfolio is not None:
+        print(f"Portfolio wins per search strategy: {portfolio.wins}")
+        logger.info(f"Portfolio wins per search strategy: {portfolio.wins}")
+        portfolio.stop()
+    if isinstance(batch_verifier, AsyncBatchVerifier):
+        batch_verifier.stop()
+    if editor.monitor.number_of_restarts > 0:
+        logger.info(f"Pyright was restarted {editor.monitor.number_of_restarts} times")
     editor.stop()
 
 
@@ -457,7 +1081,9 @@ if __name__ == "__main__":
     os.chdir(os.path.abspath(os.path.join(args.project_path, "..")))
 
     try:
-        create_pyright_config_file(args.project_path, args.venv_path)
+        create_pyright_config_file(
+            args.project_path, args.venv_path, args.search_profile
+        )
         logger = create_main_logger()
         evaluation_logger = create_evaluation_logger()
         main(args)
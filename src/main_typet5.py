@@ -249,7 +249,7 @@ def run_ml_search(
 
     search_tree = build_search_tree(search_tree_layers, args.top_n)
 
-    type_annotated_source_code_tree = depth_first_traversal(
+    type_annotated_source_code_tree, _ = depth_first_traversal(
         search_tree,
         source_code_tree,
         editor,
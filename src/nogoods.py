@@ -0,0 +1,227 @@
+import ast
+import threading
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+from constants import TypeSlot
+from slot_ordering import FunctionName
+
+Nogood = FrozenSet[Tuple[TypeSlot, str]]
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+BINDING_NODES = (ast.Assign, ast.AnnAssign, ast.AugAssign, ast.For, ast.AsyncFor)
+
+
+def _bound_names(node: ast.AST) -> Set[str]:
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AnnAssign, ast.AugAssign, ast.For, ast.AsyncFor)):
+        targets = [node.target]
+    elif isinstance(node, ast.NamedExpr):
+        targets = [node.target]
+    elif isinstance(node, ast.withitem) and node.optional_vars is not None:
+        targets = [node.optional_vars]
+    elif isinstance(node, ast.comprehension):
+        targets = [node.target]
+    else:
+        return set()
+    return {
+        n.id for target in targets for n in ast.walk(target) if isinstance(n, ast.Name)
+    }
+
+
+def _bindings(nodes: List[ast.AST]) -> Dict[str, List[ast.AST]]:
+    bindings = {}
+    for node in nodes:
+        for name in _bound_names(node):
+            bindings.setdefault(name, []).append(node)
+    return bindings
+
+
+class _SupportFinder:
+    """
+    Finds the type slots that the type checking of the code in a diagnostic range depends on: the
+    parameters and return type of the function around it that the range uses (also through its local
+    variables), all slots of the functions it refers to and, for attributes, all slots of the methods
+    with that name or that assign the instance attribute.
+    """
+
+    def __init__(self, python_code: str) -> None:
+        module = ast.parse(python_code)
+        self.functions: Dict[FunctionName, ast.FunctionDef] = {}
+        self._collect_functions(module.body, ())
+        self.module_bindings = _bindings(module.body)
+
+        self.functions_by_name: Dict[str, Set[FunctionName]] = {}
+        self.functions_by_attribute: Dict[str, Set[FunctionName]] = {}
+        for function, node in self.functions.items():
+            self.functions_by_name.setdefault(function[-1], set()).add(function)
+            if len(function) > 1:
+                # Calling a class calls its `__init__` method
+                if function[-1] == "__init__":
+                    self.functions_by_name.setdefault(function[-2], set()).add(function)
+                self.functions_by_attribute.setdefault(function[-1], set()).add(
+                    function
+                )
+                for n in ast.walk(node):
+                    if isinstance(n, ast.Attribute) and isinstance(n.ctx, ast.Store):
+                        self.functions_by_attribute.setdefault(n.attr, set()).add(
+                            function
+                        )
+
+    def _collect_functions(self, body: List[ast.stmt], names: FunctionName) -> None:
+        for node in body:
+            if isinstance(node, FUNCTION_NODES):
+                self.functions[names + (node.name,)] = node
+            elif isinstance(node, ast.ClassDef):
+                self._collect_functions(node.body, names + (node.name,))
+
+    def _function_slots(self, function: FunctionName) -> Set[TypeSlot]:
+        arguments = self.functions[function].args
+        parameters = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+        parameters += [p for p in (arguments.vararg, arguments.kwarg) if p is not None]
+        return {function + (p.arg,) for p in parameters} | {function + ("return",)}
+
+    def touched_slots(self, range: Dict) -> Set[TypeSlot] | None:
+        """Returns None if the range is not inside a function of the module."""
+        # The lines of the language server protocol start at 0, those of ast at 1
+        start = (range["start"]["line"] + 1, range["start"]["character"])
+        end = (range["end"]["line"] + 1, range["end"]["character"])
+
+        def overlaps(node: ast.AST) -> bool:
+            return (node.lineno, node.col_offset) <= end and start <= (
+                node.end_lineno,
+                node.end_col_offset,
+            )
+
+        surrounding_functions = [
+            function
+            for function, node in self.functions.items()
+            if (node.lineno, node.col_offset) <= start
+            and end <= (node.end_lineno, node.end_col_offset)
+        ]
+        if len(surrounding_functions) == 0:
+            return None
+        function = max(surrounding_functions, key=len)
+        function_node = self.functions[function]
+        parameters = {slot[-1] for slot in self._function_slots(function)} - {"return"}
+        local_bindings = _bindings(list(ast.walk(function_node)))
+
+        slots = set()
+        visited_bindings = set()
+        nodes = [
+            node
+            for node in ast.walk(function_node)
+            if node is not function_node and hasattr(node, "lineno") and overlaps(node)
+        ]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            if isinstance(node, (ast.Return, ast.Yield, ast.YieldFrom)):
+                slots.add(function + ("return",))
+            elif isinstance(node, ast.arg) and node.arg in parameters:
+                slots.add(function + (node.arg,))
+            elif isinstance(node, ast.Attribute):
+                for f in self.functions_by_attribute.get(node.attr, set()):
+                    slots |= self._function_slots(f)
+            elif isinstance(node, ast.Name):
+                if node.id in parameters:
+                    slots.add(function + (node.id,))
+                for f in self.functions_by_name.get(node.id, set()):
+                    slots |= self._function_slots(f)
+                # The type of a variable depends on the code that assigns it
+                bindings = local_bindings.get(node.id) or self.module_bindings.get(
+                    node.id, []
+                )
+                for binding in bindings:
+                    if id(binding) not in visited_bindings:
+                        visited_bindings.add(id(binding))
+                        nodes += list(ast.walk(binding))
+        return slots
+
+
+class NogoodStore:
+    """
+    Remembers combinations of type annotations that Pyright rejected, so that the search does not
+    check the same conflicting combination again after backtracking.
+
+    A rejected type annotation is only combined with the annotations of the type slots that the code
+    in the ranges of its errors depends on. If that cannot be determined, nothing is learned.
+
+    The portfolio workers share one store, so it is guarded by a lock.
+    """
+
+    def __init__(self) -> None:
+        self.nogoods: Dict[Tuple[TypeSlot, str], List[Nogood]] = {}
+        self.number_of_pruned_checks = 0
+        self.lock = threading.Lock()
+
+    def learn(
+        self,
+        assignment: Dict[TypeSlot, str],
+        failed_slot: TypeSlot,
+        failed_annotation: str,
+        python_code: str,
+        errors: List[Dict] | None,
+    ) -> Nogood | None:
+        """
+        Learns the nogood of a rejected type annotation from the errors in the checked code. Returns
+        None when the errors are unknown or a slot they depend on cannot be determined.
+        """
+        if errors is None or len(errors) == 0:
+            return None
+        try:
+            support_finder = _SupportFinder(python_code)
+        except SyntaxError:
+            return None
+        support = set()
+        for error in errors:
+            slots = support_finder.touched_slots(error["range"])
+            if slots is None:
+                return None
+            support |= slots
+
+        nogood = frozenset(
+            {(failed_slot, failed_annotation)}
+            | {
+                (slot, annotation)
+                for slot, annotation in assignment.items()
+                if slot in support and slot != failed_slot
+            }
+        )
+        with self.lock:
+            self.nogoods.setdefault((failed_slot, failed_annotation), []).append(nogood)
+        return nogood
+
+    def is_pruned(
+        self,
+        assignment: Dict[TypeSlot, str],
+        slot: TypeSlot,
+        annotation: str,
+    ) -> bool:
+        """
+        Checks whether assigning the annotation to the slot, on top of the assignment of the
+        earlier slots, contains a combination that Pyright rejected before.
+        """
+        assigned_items = set(assignment.items()) | {(slot, annotation)}
+        with self.lock:
+            for nogood in self.nogoods.get((slot, annotation), []):
+                if nogood <= assigned_items:
+                    self.number_of_pruned_checks += 1
+                    return True
+        return False
+
+    def to_json(self) -> List[List[Tuple[List[str], str]]]:
+        with self.lock:
+            unique_nogoods = {
+                nogood for nogoods in self.nogoods.values() for nogood in nogoods
+            }
+        return [
+            [(list(slot), annotation) for slot, annotation in sorted(nogood)]
+            for nogood in unique_nogoods
+        ]
+
+    def load_json(self, nogoods: List[List[Tuple[List[str], str]]]) -> None:
+        for items in nogoods:
+            nogood = frozenset((tuple(slot), annotation) for slot, annotation in items)
+            # The slot that failed is unknown after loading, so the nogood is indexed under all of its items
+            with self.lock:
+                for item in nogood:
+                    self.nogoods.setdefault(item, []).append(nogood)
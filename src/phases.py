@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Any, Dict
+import libcst as cst
+import libcst.matchers as m
+
+from annotations import insert_annotations, node_to_code
+from evaluation import calculate_extra_annotations, gather_all_type_slots
+from imports import ImportInserter, TypeAliasInserter
+
+
+def _is_import_or_type_alias(statement: cst.BaseStatement) -> bool:
+    return m.matches(
+        statement,
+        m.SimpleStatementLine(
+            body=[
+                m.Import()
+                | m.ImportFrom()
+                | m.AnnAssign(annotation=m.Annotation(annotation=m.Name("TypeAlias")))
+            ]
+        ),
+    )
+
+
+def collect_phase_result(
+    source_code_tree_before: cst.Module, source_code_tree_after: cst.Module
+) -> Dict[str, Any]:
+    """
+    Collects the type annotations and the import and type alias statements that the ML search
+    added to the source code, so that a later phase can start from them.
+    """
+    accepted_annotations = calculate_extra_annotations(
+        gather_all_type_slots(source_code_tree_before),
+        gather_all_type_slots(source_code_tree_after),
+    )
+    existing_statements = {
+        node_to_code(statement) for statement in source_code_tree_before.body
+    }
+    added_statements = [
+        node_to_code(statement)
+        for statement in source_code_tree_after.body
+        if _is_import_or_type_alias(statement)
+        and node_to_code(statement) not in existing_statements
+    ]
+    return {
+        "annotations": [
+            [list(slot), annotation]
+            for slot, annotation in accepted_annotations.items()
+        ],
+        "statements": added_statements,
+    }
+
+
+def apply_phase_result(
+    source_code_tree: cst.Module, phase_result: Dict[str, Any]
+) -> cst.Module:
+    # Statements are inserted at the top of the module, so insert them in reverse to keep their order
+    for statement in reversed(phase_result["statements"]):
+        if "TypeAlias =" in statement:
+            transformer = TypeAliasInserter(statement)
+        else:
+            transformer = ImportInserter(statement)
+        source_code_tree = source_code_tree.visit(transformer)
+
+    return insert_annotations(
+        source_code_tree,
+        {tuple(slot): annotation for slot, annotation in phase_result["annotations"]},
+    )
+
+
+def get_phase_results_file(working_directory: str, postfix: str) -> str:
+    return os.path.join(working_directory, f"accepted-annotations-{postfix}.json")
+
+
+def load_phase_results(phase_results_file: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(phase_results_file):
+        return {}
+    with open(phase_results_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_phase_results(
+    phase_results_file: str, phase_results: Dict[str, Dict[str, Any]]
+) -> None:
+    with open(phase_results_file, "w", encoding="utf-8") as f:
+        json.dump(phase_results, f, indent=2)
+
+
+def count_phase_annotations(phase_results: Dict[str, Dict[str, Any]]) -> int:
+    return sum(len(result["annotations"]) for result in phase_results.values())
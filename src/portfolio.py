@@ -0,0 +1,199 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+import libcst as cst
+from colorama import Fore
+
+from fake_editor import FakeEditor
+from nogoods import NogoodStore
+from searchtree import (
+    SEARCH_TIMEOUT_SECONDS,
+    SearchResult,
+    SearchStatus,
+    best_first_search,
+    depth_first_search,
+    restarting_depth_first_search,
+)
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class CancellableEditor:
+    """Wraps an editor so that a search stops at its next Pyright check once another search has won."""
+
+    def __init__(self, editor: FakeEditor, stop_event: threading.Event) -> None:
+        self.editor = editor
+        self.stop_event = stop_event
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.editor, name)
+
+    def change_file(self, *args: Any, **kwargs: Any) -> None:
+        if self.stop_event.is_set():
+            raise SearchCancelled()
+        self.editor.change_file(*args, **kwargs)
+
+
+class SearchPortfolio:
+    """
+    Races several search strategies against each other on the same file. Every strategy has its own
+    pyright-langserver instance, so the strategies do not wait for each other's diagnostics. The first
+    strategy that finds a complete combination of type annotations wins and the others are cancelled.
+    If no strategy finishes before the timeout, the best validated partial combination is used.
+    """
+
+    def __init__(self, strategies: List[str], editor: FakeEditor) -> None:
+        # The first strategy reuses the editor of the project, the others get a worker editor
+        self.main_strategy = strategies[0]
+        self.editors = {strategies[0]: editor}
+        for strategy in strategies[1:]:
+            self.editors[strategy] = FakeEditor.new_worker()
+        self.wins = {strategy: 0 for strategy in strategies}
+        self.number_of_worker_checks = 0
+
+    def _worker_editors(self) -> List[FakeEditor]:
+        return [
+            editor
+            for strategy, editor in self.editors.items()
+            if strategy != self.main_strategy
+        ]
+
+    def start(self, root_uri: str) -> None:
+        for editor in self._worker_editors():
+            editor.start(root_uri)
+
+    def open_file(self, file_path: str, source_code_tree: cst.Module) -> None:
+        # The workers need the same start errors as the editor of the project
+        for editor in self._worker_editors():
+            editor.open_file(file_path)
+            editor.has_diagnostic_error(at_start=True)
+            editor.change_file(source_code_tree.code, None)
+            editor.has_diagnostic_error(at_start=True)
+
+    def close_file(self) -> None:
+        for editor in self._worker_editors():
+            if editor.edit_document is not None:
+                editor.close_file()
+
+    def stop(self) -> None:
+        for editor in self._worker_editors():
+            editor.stop()
+
+    def search(
+        self,
+        search_tree: Dict[str, Dict[str, Any]],
+        original_source_code_tree: cst.Module,
+        number_of_type_slots: int,
+        all_project_classes: Dict[str, str],
+        beam_width: int = 10,
+        seed: int = 0,
+        restart_base_failures: int = 16,
+        nogood_store: NogoodStore | None = None,
+        timeout: float = SEARCH_TIMEOUT_SECONDS,
+    ) -> Tuple[cst.Module, SearchStatus]:
+        logger = logging.getLogger("main")
+        deadline = time.time() + timeout
+        stop_event = threading.Event()
+        lock = threading.Lock()
+        results: Dict[str, SearchResult] = {}
+        winner = None
+
+        search_functions: Dict[str, Callable[[FakeEditor], SearchResult]] = {
+            "dfs": lambda editor: depth_first_search(
+                search_tree,
+                original_source_code_tree,
+                editor,
+                number_of_type_slots,
+                all_project_classes,
+                deadline,
+                nogood_store=nogood_store,
+            ),
+            "best-first": lambda editor: best_first_search(
+                search_tree,
+                original_source_code_tree,
+                editor,
+                number_of_type_slots,
+                all_project_classes,
+                beam_width,
+                nogood_store,
+                deadline - time.time(),
+            ),
+            "dfs-restarts": lambda editor: restarting_depth_first_search(
+                search_tree,
+                original_source_code_tree,
+                editor,
+                number_of_type_slots,
+                all_project_classes,
+                seed,
+                restart_base_failures,
+                nogood_store=nogood_store,
+                timeout=deadline - time.time(),
+            ),
+        }
+
+        def run(strategy: str) -> None:
+            nonlocal winner
+            editor = self.editors[strategy]
+            number_of_checks_before = editor.number_of_checks
+            try:
+                search_result = search_functions[strategy](
+                    CancellableEditor(editor, stop_event)
+                )
+            except SearchCancelled:
+                logger.info(f"Portfolio: {strategy} cancelled")
+                return
+            finally:
+                if strategy != self.main_strategy:
+                    with lock:
+                        self.number_of_worker_checks += (
+                            editor.number_of_checks - number_of_checks_before
+                        )
+
+            with lock:
+                results[strategy] = search_result
+                if search_result.status == SearchStatus.COMPLETE and winner is None:
+                    winner = strategy
+                    stop_event.set()
+
+        threads = [
+            threading.Thread(target=run, args=(strategy,), name=strategy)
+            for strategy in self.editors
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        status = SearchStatus.EXHAUSTED
+        if winner is None and len(results) > 0:
+            best_strategy = max(
+                results, key=lambda s: results[s].number_of_accepted_annotations
+            )
+            status = results[best_strategy].status
+            if results[best_strategy].number_of_accepted_annotations > 0:
+                winner = best_strategy
+
+        if winner is None:
+            print(f"{Fore.RED}No strategy found a combination of type annotations...")
+            logger.error(
+                "Portfolio: no strategy found a combination of type annotations"
+            )
+            return original_source_code_tree, status
+
+        self.wins[winner] += 1
+        search_result = results[winner]
+        if search_result.status == SearchStatus.COMPLETE:
+            print(f"{Fore.GREEN}{winner} found a combination of type annotations!")
+        else:
+            print(
+                f"{Fore.YELLOW}{winner} found the best partial combination of type annotations."
+            )
+        logger.info(
+            f"Portfolio: {winner} won with {search_result.number_of_accepted_annotations} type annotations ({search_result.status.value})"
+        )
+        logger.info(f"Portfolio wins so far: {self.wins}")
+        return search_result.source_code_tree, search_result.status
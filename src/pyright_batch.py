@@ -0,0 +1,187 @@
+from __future__ import annotations
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Tuple
+from libcst.metadata import CodeRange
+
+from diagnostics import has_error_in_diagnostics
+from fake_editor import FakeEditor
+
+VARIANT_FILE_PREFIX = "__variant"
+
+
+class PyrightBatchException(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+
+
+# Paths in a Pyright config are relative to the directory of the config file
+PATH_CONFIG_KEYS = ("venvPath", "stubPath", "typeshedPath")
+
+
+def get_variant_config(project_path: str) -> Dict[str, Any]:
+    """
+    Returns the Pyright config of the project with absolute paths, so that it can be used from
+    another directory, and with the project in the extra paths, so that its imports still resolve.
+    """
+    project_path = os.path.abspath(project_path)
+    config = {}
+    config_file = os.path.join(project_path, "pyrightconfig.json")
+    if os.path.exists(config_file):
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+    for key in PATH_CONFIG_KEYS:
+        if key in config:
+            config[key] = os.path.join(project_path, config[key])
+    config.setdefault("stubPath", os.path.join(project_path, "typings"))
+    if "venv" in config:
+        config.setdefault("venvPath", project_path)
+    config["extraPaths"] = [
+        os.path.join(project_path, path) for path in config.get("extraPaths", [])
+    ] + [project_path]
+    # The variant files are given to the CLI, so nothing else has to be included
+    config.pop("include", None)
+    return config
+
+
+def _get_pyright_command() -> List[str]:
+    pyright_executable = shutil.which("pyright")
+    if pyright_executable is not None:
+        return [pyright_executable]
+    return [sys.executable, "-m", "pyright"]
+
+
+class PyrightBatchVerifier:
+    """
+    Verifies many versions of a file with a single run of the Pyright CLI, instead of one language server
+    round trip per version. The versions are written as variant files to a temporary directory, so that
+    the project itself is never modified. The directory mirrors the location of the file in the project
+    and links to the other files of its directory, so that its relative imports still resolve, and
+    gets the Pyright config of the project. The verdicts follow the same rules as the editor.
+    """
+
+    def __init__(self, project_path: str, batch_size: int = 64) -> None:
+        self.project_path = project_path
+        self.batch_size = batch_size
+        self.command = _get_pyright_command()
+        self.config = get_variant_config(project_path)
+        self.file_path = None
+        self.start_python_code = None
+        self.start_errors = set()
+        self.number_of_checks = 0
+
+    def open_file(self, file_path: str, python_code: str) -> None:
+        # The start errors are only collected once the file is checked, as most files need no batches
+        self.file_path = file_path
+        self.start_errors = set()
+        self.start_python_code = python_code
+
+    def check_in_parallel(
+        self, changes: List[Tuple[str, CodeRange | None]]
+    ) -> List[bool]:
+        if self.start_python_code is not None:
+            self._run_pyright([(self.start_python_code, None)], at_start=True)
+            self.start_python_code = None
+
+        has_errors = []
+        for start in range(0, len(changes), self.batch_size):
+            batch = changes[start : start + self.batch_size]
+            self.number_of_checks += len(batch)
+            has_errors += self._run_pyright(batch)
+        return has_errors
+
+    def _run_pyright(
+        self, changes: List[Tuple[str, CodeRange | None]], at_start: bool = False
+    ) -> List[bool]:
+        directory, file_name = os.path.split(os.path.abspath(self.file_path))
+        relative_directory = os.path.relpath(
+            directory, os.path.abspath(self.project_path)
+        )
+        if relative_directory.startswith(os.pardir):
+            relative_directory = os.curdir
+        temporary_directory = tempfile.TemporaryDirectory(prefix="py-hint-search-")
+        try:
+            # Pyright reports the resolved paths of the files
+            root = os.path.realpath(temporary_directory.name)
+            variant_directory = os.path.normpath(os.path.join(root, relative_directory))
+            os.makedirs(variant_directory, exist_ok=True)
+            for entry in os.listdir(directory):
+                try:
+                    os.symlink(
+                        os.path.join(directory, entry),
+                        os.path.join(variant_directory, entry),
+                    )
+                except OSError:
+                    # Without links, only the relative imports of the file do not resolve
+                    break
+
+            variant_files = [
+                os.path.join(
+                    variant_directory, f"{VARIANT_FILE_PREFIX}{i}__{file_name}"
+                )
+                for i in range(len(changes))
+            ]
+            for variant_file, (python_code, _) in zip(variant_files, changes):
+                with open(variant_file, "w", encoding="utf-8") as f:
+                    f.write(python_code)
+            config_file = os.path.join(root, "pyrightconfig.json")
+            with open(config_file, "w", encoding="utf-8") as f:
+                json.dump(self.config, f)
+
+            result = subprocess.run(
+                self.command
+                + ["--outputjson", "--project", config_file]
+                + variant_files,
+                cwd=root,
+                capture_output=True,
+                text=True,
+            )
+        finally:
+            temporary_directory.cleanup()
+
+        try:
+            output = json.loads(result.stdout)
+        except json.JSONDecodeError:
+            raise PyrightBatchException(result.stderr or result.stdout)
+
+        diagnostics_per_file: Dict[str, List[Dict[str, Any]]] = {}
+        for diagnostic in output.get("generalDiagnostics", []):
+            diagnostics_per_file.setdefault(
+                os.path.normcase(diagnostic["file"]), []
+            ).append(diagnostic)
+
+        return [
+            has_error_in_diagnostics(
+                diagnostics_per_file.get(os.path.normcase(variant_file), []),
+                modified_location,
+                self.start_errors,
+                at_start,
+            )
+            for variant_file, (_, modified_location) in zip(variant_files, changes)
+        ]
+
+
+class PyrightBatchEditor:
+    """Uses the editor for single checks and the Pyright CLI for the batched checks of the search."""
+
+    def __init__(self, editor: FakeEditor, verifier: PyrightBatchVerifier) -> None:
+        self.editor = editor
+        self.verifier = verifier
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.editor, name)
+
+    @property
+    def batch_size(self) -> int:
+        return self.verifier.batch_size
+
+    def check_in_parallel(
+        self, changes: List[Tuple[str, CodeRange | None]]
+    ) -> List[bool]:
+        return self.verifier.check_in_parallel(changes)
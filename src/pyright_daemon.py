@@ -0,0 +1,394 @@
+"""
+Keeps a warm pyright-langserver alive between runs of main.py behind a local Unix socket, so that
+repeated runs on the same project do not pay for the cold analysis of the virtual environment and
+typeshed again. Start it with `python pyright_daemon.py --socket PATH --root-uri URI`, or let
+`ensure_pyright_daemon` start it in the background.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Set
+
+from client.json_rpc_endpoint import JsonRpcEndpoint
+from fake_editor import get_pyright_langserver_command
+
+# A healthy daemon greets with `ready <configuration hash>`
+DAEMON_READY = b"ready"
+DAEMON_UNHEALTHY = b"unhealthy\n"
+MAX_GREETING_LENGTH = 64
+# Sent by a client to stop a daemon whose configuration is out of date
+DAEMON_SHUTDOWN_METHOD = "daemon/shutdown"
+DAEMON_IDLE_TIMEOUT_SECONDS = 30 * 60
+DAEMON_START_TIMEOUT_SECONDS = 120
+
+
+class PyrightDaemonException(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+
+
+def daemon_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def get_daemon_socket_path(project_path: str, venv_path: str | None) -> str:
+    """There is one daemon per combination of project and virtual environment."""
+    key = f"{os.path.abspath(project_path)}|{os.path.abspath(venv_path) if venv_path else ''}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"py-hint-search-pyright-{digest}.sock")
+
+
+def get_configuration_hash(
+    project_path: str, workspace_configuration: Dict[str, Any]
+) -> str:
+    """
+    A daemon keeps analysing with the configuration it was started with, so a run only uses a daemon
+    started with the same Pyright config file and workspace configuration (e.g. of the search profile).
+    """
+    pyright_config = ""
+    config_file = os.path.join(project_path, "pyrightconfig.json")
+    if os.path.exists(config_file):
+        with open(config_file, "r", encoding="utf-8") as f:
+            pyright_config = f.read()
+    key = json.dumps([pyright_config, workspace_configuration], sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _ready_greeting(configuration_hash: str) -> bytes:
+    return DAEMON_READY + b" " + configuration_hash.encode("ascii") + b"\n"
+
+
+def _read_greeting(connection: socket.socket) -> bytes:
+    # Read byte by byte, as a buffered reader could take server messages sent right after the greeting
+    greeting = b""
+    while not greeting.endswith(b"\n") and len(greeting) < MAX_GREETING_LENGTH:
+        byte = connection.recv(1)
+        if not byte:
+            break
+        greeting += byte
+    return greeting
+
+
+def connect_to_pyright_daemon(
+    socket_path: str, configuration_hash: str
+) -> socket.socket | None:
+    """
+    Connects to a running daemon. The daemon greets every connection with its health and the hash of
+    its configuration, so a daemon that is busy with another client, is unhealthy, has another
+    configuration or is no longer running gives None instead of a hanging client.
+    """
+    if not daemon_supported() or not os.path.exists(socket_path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.settimeout(5)
+        connection.connect(socket_path)
+        greeting = _read_greeting(connection)
+        connection.settimeout(None)
+    except OSError:
+        connection.close()
+        return None
+    if greeting != _ready_greeting(configuration_hash):
+        connection.close()
+        return None
+    return connection
+
+
+def _stop_outdated_daemon(socket_path: str, configuration_hash: str) -> bool:
+    """
+    Stops the daemon on the socket if it is ready but has another configuration, and returns whether
+    a daemon with the configuration is still needed. A busy daemon is left alone.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(5)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        # A daemon that did not shut down cleanly leaves its socket file behind
+        probe.close()
+        os.remove(socket_path)
+        return True
+    with probe:
+        try:
+            greeting = _read_greeting(probe)
+        except OSError:
+            # The daemon is busy with another client, so the run goes without it
+            return False
+        if not greeting.startswith(DAEMON_READY) or greeting == _ready_greeting(
+            configuration_hash
+        ):
+            return False
+        with probe.makefile("wb") as stream:
+            JsonRpcEndpoint(stream, None).write_message(
+                {"jsonrpc": "2.0", "method": DAEMON_SHUTDOWN_METHOD}
+            )
+    deadline = time.time() + DAEMON_START_TIMEOUT_SECONDS
+    while os.path.exists(socket_path):
+        if time.time() > deadline:
+            raise PyrightDaemonException(
+                "The Pyright daemon with another configuration did not stop in time"
+            )
+        time.sleep(0.05)
+    return True
+
+
+def ensure_pyright_daemon(
+    socket_path: str,
+    root_uri: str,
+    configuration_hash: str,
+    idle_timeout: float = DAEMON_IDLE_TIMEOUT_SECONDS,
+) -> None:
+    """
+    Starts a daemon in the background, unless one with the same configuration is already listening on
+    the socket. A daemon with another configuration is stopped and replaced.
+    """
+    if not daemon_supported():
+        raise PyrightDaemonException("Unix sockets are not supported on this platform")
+    if os.path.exists(socket_path) and not _stop_outdated_daemon(
+        socket_path, configuration_hash
+    ):
+        return
+
+    subprocess.Popen(
+        [
+            sys.executable,
+            os.path.realpath(__file__),
+            "--socket",
+            socket_path,
+            "--root-uri",
+            root_uri,
+            "--configuration-hash",
+            configuration_hash,
+            "--idle-timeout",
+            str(idle_timeout),
+        ],
+        cwd=os.path.dirname(os.path.realpath(__file__)),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.time() + DAEMON_START_TIMEOUT_SECONDS
+    while not os.path.exists(socket_path):
+        if time.time() > deadline:
+            raise PyrightDaemonException("The Pyright daemon did not start in time")
+        time.sleep(0.05)
+
+
+class PyrightDaemon:
+    """
+    Relays the JSON-RPC messages of one client at a time to a pyright-langserver that stays initialized
+    between clients. The daemon performs the initialize handshake itself, answers the handshake and the
+    shutdown of each client from that, and closes the documents a client left open when it disconnects.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        root_uri: str,
+        configuration_hash: str,
+        idle_timeout: float,
+    ) -> None:
+        self.socket_path = socket_path
+        self.root_uri = root_uri
+        self.configuration_hash = configuration_hash
+        self.idle_timeout = idle_timeout
+        self.shutdown_requested = False
+        self.process = subprocess.Popen(
+            args=get_pyright_langserver_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.server = JsonRpcEndpoint(self.process.stdin, self.process.stdout)
+        self.client: JsonRpcEndpoint | None = None
+        self.client_lock = threading.Lock()
+        self.initialize_result = None
+        self.initialized = threading.Event()
+        self.stopping = False
+        self.open_documents: Set[str] = set()
+        # Every document the current client has opened, including the ones it closed since
+        self.client_documents: Set[str] = set()
+
+    def _initialize_server(self) -> None:
+        self.server.write_message(
+            {
+                "jsonrpc": "2.0",
+                "id": "daemon-initialize",
+                "method": "initialize",
+                "params": {
+                    "processId": os.getpid(),
+                    "rootUri": self.root_uri,
+                    "capabilities": {
+                        "textDocument": {
+                            "synchronization": {"dynamicRegistration": True},
+                            "publishDiagnostics": {"relatedInformation": True},
+                        }
+                    },
+                    "workspaceFolders": [
+                        {"name": "py-hint-search", "uri": self.root_uri}
+                    ],
+                },
+            }
+        )
+        self.initialized.wait()
+        self.server.write_message(
+            {"jsonrpc": "2.0", "method": "initialized", "params": {}}
+        )
+
+    def _relay_server_messages(self) -> None:
+        while True:
+            message = self.server.read_response()
+            if message is None:
+                if self.stopping:
+                    return
+                # The server crashed, so the daemon is no longer healthy
+                os._exit(1)
+            if message.get("id") == "daemon-initialize":
+                self.initialize_result = message.get("result")
+                self.initialized.set()
+                continue
+            # Diagnostics of documents closed for a previous client are not meant for the current one
+            if (
+                message.get("method") == "textDocument/publishDiagnostics"
+                and message["params"]["uri"] not in self.client_documents
+            ):
+                continue
+            with self.client_lock:
+                client = self.client
+            if client is not None:
+                try:
+                    client.write_message(message)
+                    continue
+                except OSError:
+                    pass
+            # Without a client, the requests of the server are answered by the daemon
+            if "method" in message and "id" in message:
+                result = None
+                if message["method"] == "workspace/configuration":
+                    result = [None for _ in message["params"]["items"]]
+                self.server.write_message(
+                    {"jsonrpc": "2.0", "id": message["id"], "result": result}
+                )
+
+    def _serve_client(self, client: JsonRpcEndpoint) -> None:
+        while True:
+            try:
+                message = client.read_response()
+            except (OSError, RuntimeError, ValueError):
+                message = None
+            if message is None:
+                return
+            method = message.get("method")
+            if method in ("initialize", "shutdown"):
+                result = self.initialize_result if method == "initialize" else None
+                client.write_message(
+                    {"jsonrpc": "2.0", "id": message["id"], "result": result}
+                )
+                continue
+            if method == "initialized":
+                continue
+            if method == "exit":
+                return
+            if method == DAEMON_SHUTDOWN_METHOD:
+                self.shutdown_requested = True
+                return
+            if method == "textDocument/didOpen":
+                self.open_documents.add(message["params"]["textDocument"]["uri"])
+                self.client_documents.add(message["params"]["textDocument"]["uri"])
+            elif method == "textDocument/didClose":
+                self.open_documents.discard(message["params"]["textDocument"]["uri"])
+            self.server.write_message(message)
+
+    def _close_open_documents(self) -> None:
+        for uri in self.open_documents:
+            self.server.write_message(
+                {
+                    "jsonrpc": "2.0",
+                    "method": "textDocument/didClose",
+                    "params": {"textDocument": {"uri": uri}},
+                }
+            )
+        self.open_documents = set()
+
+    def _stop_server(self) -> None:
+        self.stopping = True
+        try:
+            self.server.write_message(
+                {"jsonrpc": "2.0", "id": "daemon-shutdown", "method": "shutdown"}
+            )
+            self.server.write_message({"jsonrpc": "2.0", "method": "exit"})
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+    def serve(self) -> None:
+        threading.Thread(target=self._relay_server_messages, daemon=True).start()
+        self._initialize_server()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen()
+        listener.settimeout(self.idle_timeout)
+        try:
+            while self.process.poll() is None:
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    break
+                connection.settimeout(None)
+                with connection:
+                    if self.process.poll() is not None:
+                        connection.sendall(DAEMON_UNHEALTHY)
+                        break
+                    connection.sendall(_ready_greeting(self.configuration_hash))
+                    client = JsonRpcEndpoint(
+                        connection.makefile("wb"), connection.makefile("rb")
+                    )
+                    with self.client_lock:
+                        self.client = client
+                        self.client_documents = set()
+                    try:
+                        self._serve_client(client)
+                    finally:
+                        with self.client_lock:
+                            self.client = None
+                        self._close_open_documents()
+                    if self.shutdown_requested:
+                        break
+        finally:
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self._stop_server()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep a warm pyright-langserver alive between runs of py-hint-search."
+    )
+    parser.add_argument("--socket", type=str, required=True)
+    parser.add_argument("--root-uri", type=str, required=True)
+    parser.add_argument("--configuration-hash", type=str, required=True)
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DAEMON_IDLE_TIMEOUT_SECONDS,
+        help="Shut down after this many seconds without a client.",
+    )
+    daemon_args = parser.parse_args()
+    PyrightDaemon(
+        daemon_args.socket,
+        daemon_args.root_uri,
+        daemon_args.configuration_hash,
+        daemon_args.idle_timeout,
+    ).serve()
@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional, Tuple
+import libcst as cst
+from libcst.metadata import CodeRange, PositionProvider
+
+from annotations import (
+    RuleBasedTypeSlotsVisitor,
+    TypeSlotsVisitor,
+    insert_annotations,
+)
+from constants import TypeSlot
+from fake_editor import FakeEditor
+from slot_ordering import build_call_graph
+
+
+class FunctionLocationVisitor(cst.CSTVisitor):
+    METADATA_DEPENDENCIES = (PositionProvider,)
+
+    def __init__(self) -> None:
+        self.stack: List[str] = []
+        self.locations: Dict[Tuple[str, ...], CodeRange] = {}
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> Optional[bool]:
+        self.stack.append(node.name.value)
+        return True
+
+    def leave_ClassDef(self, node: cst.ClassDef) -> None:
+        self.stack.pop()
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> Optional[bool]:
+        self.stack.append(node.name.value)
+        self.locations[tuple(self.stack)] = self.get_metadata(PositionProvider, node)
+        return False
+
+    def leave_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.stack.pop()
+
+
+def infer_rule_based_annotations(source_code_tree: cst.Module) -> Dict[TypeSlot, str]:
+    visitor_type_slots = TypeSlotsVisitor()
+    source_code_tree.visit(visitor_type_slots)
+    visitor_rule_based = RuleBasedTypeSlotsVisitor()
+    source_code_tree.visit(visitor_rule_based)
+    available_slots = set(visitor_type_slots.available_slots)
+    return {
+        slot: annotation
+        for slot, annotation in visitor_rule_based.annotations.items()
+        if slot in available_slots
+    }
+
+
+def _error_in_location(range: Dict, location: CodeRange) -> bool:
+    # The lines of the language server protocol start at 0, those of libcst at 1
+    start = (range["start"]["line"] + 1, range["start"]["character"])
+    end = (range["end"]["line"] + 1, range["end"]["character"])
+    return (location.start.line, location.start.column) <= start and end <= (
+        location.end.line,
+        location.end.column,
+    )
+
+
+def fill_rule_based_type_slots(
+    source_code_tree: cst.Module, editor: FakeEditor
+) -> Tuple[cst.Module, Dict[TypeSlot, str]]:
+    """
+    Fills the type slots whose type annotation follows from the source code alone and verifies all
+    of them with a single Pyright check. Every error in the module that was not there at the start is
+    attributed to the annotated functions it is in or that it calls (e.g. a caller that passes a
+    float to a parameter annotated as int), and to all of them if it cannot be attributed. Only the
+    type annotations of those functions are dropped again (which are then left to the ML search).
+    The check is repeated until the module has no new errors.
+    """
+    call_graph = build_call_graph(source_code_tree)
+    annotations = infer_rule_based_annotations(source_code_tree)
+    while len(annotations) > 0:
+        modified_tree = insert_annotations(source_code_tree, annotations)
+        editor.change_file(modified_tree.code, None)
+
+        visitor = FunctionLocationVisitor()
+        cst.MetadataWrapper(modified_tree).visit(visitor)
+        annotated_functions = {slot[:-1] for slot in annotations}
+        failed_functions = set()
+        for error in editor.get_new_errors():
+            blamed_functions = set()
+            for function, location in visitor.locations.items():
+                if _error_in_location(error["range"], location):
+                    blamed_functions |= (
+                        {function} | call_graph.get(function, set())
+                    ) & annotated_functions
+            failed_functions |= (
+                blamed_functions if len(blamed_functions) > 0 else annotated_functions
+            )
+        if len(failed_functions) == 0:
+            return modified_tree, annotations
+
+        annotations = {
+            slot: annotation
+            for slot, annotation in annotations.items()
+            if slot[:-1] not in failed_functions
+        }
+    return source_code_tree, annotations
@@ -0,0 +1,77 @@
+import os
+from typing import Any, Dict, List
+
+# Strict-mode rules whose messages can never match the error pattern of has_error_in_diagnostics, so
+# disabling them does not change any verdict. Rules that report type assignment problems are kept, as
+# their messages can include "cannot be assigned to".
+SEARCH_PROFILE_DISABLED_RULES = [
+    "reportConstantRedefinition",
+    "reportDeprecated",
+    "reportImplicitStringConcatenation",
+    "reportMissingModuleSource",
+    "reportMissingParameterType",
+    "reportMissingSuperCall",
+    "reportMissingTypeArgument",
+    "reportMissingTypeStubs",
+    "reportPrivateUsage",
+    "reportTypeCommentUsage",
+    "reportUnknownArgumentType",
+    "reportUnknownLambdaType",
+    "reportUnknownMemberType",
+    "reportUnknownParameterType",
+    "reportUnknownVariableType",
+    "reportUnnecessaryCast",
+    "reportUnnecessaryComparison",
+    "reportUnnecessaryContains",
+    "reportUnnecessaryIsInstance",
+    "reportUnnecessaryTypeIgnoreComment",
+    "reportUntypedBaseClass",
+    "reportUntypedClassDecorator",
+    "reportUntypedFunctionDecorator",
+    "reportUntypedNamedTuple",
+    "reportUnusedClass",
+    "reportUnusedFunction",
+    "reportUnusedImport",
+    "reportUnusedVariable",
+]
+
+# The default excludes of Pyright, which are replaced when the exclude setting is given. Pyright then
+# also stops excluding the directories with a pyvenv.cfg file, so virtual environments are excluded by name
+DEFAULT_EXCLUDES = ["**/node_modules", "**/__pycache__", "**/.*"]
+VENV_DIRECTORY_NAMES = ["venv", ".venv", "env", ".env", "virtualenv"]
+
+# Returned to the language server when it asks for the workspace configuration. Open-files-only
+# diagnostics are already the default, but the informational log messages that Pyright sends during
+# every analysis are read and discarded by the editor
+SEARCH_PROFILE_WORKSPACE_CONFIGURATION = {
+    "python.analysis": {"logLevel": "Error"},
+}
+
+
+def get_search_profile_excludes(project_path: str, venv_path: str | None) -> List[str]:
+    """Excludes the directories that are not annotated, like the virtual environment of the project."""
+    excludes = DEFAULT_EXCLUDES + [f"**/{name}" for name in VENV_DIRECTORY_NAMES]
+    if venv_path is not None:
+        relative_venv_path = os.path.relpath(os.path.abspath(venv_path), project_path)
+        if not relative_venv_path.startswith(".."):
+            excludes.append(relative_venv_path.replace(os.sep, "/"))
+    return excludes
+
+
+def get_search_profile_config(
+    project_path: str, venv_path: str | None
+) -> Dict[str, Any]:
+    """
+    Returns the Pyright settings of the search profile: the virtual environments inside the project
+    are excluded, and the strict-mode rules that cannot reject a type annotation are neither checked
+    nor reported. The files to include stay the default, the whole project, as the annotated files
+    import each other.
+    """
+    config: Dict[str, Any] = {
+        "exclude": get_search_profile_excludes(
+            os.path.abspath(project_path), venv_path
+        ),
+    }
+    for rule in SEARCH_PROFILE_DISABLED_RULES:
+        config[rule] = "none"
+    return config
@@ -1,17 +1,32 @@
+import heapq
 import logging
-import re
+import math
+import random
 import time
-from typing import Any, Dict, List, Tuple, Union, TypeAlias
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, Set, Tuple, Union, TypeAlias
 import libcst as cst
+from libcst.metadata import CodeRange
 from colorama import Fore
 
 from annotations import (
     insert_parameter_annotation,
     insert_return_annotation,
 )
+from candidates import remove_quotes, strip_module_prefixes
 from constants import TypeSlot, Predictions
 from fake_editor import FakeEditor
-from imports import add_import_to_source_code_tree
+from imports import ImportPlan, add_import_to_source_code_tree, apply_import_plan
+from checkpoints import (
+    SearchCheckpoint,
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+    search_tree_signature,
+)
+from nogoods import NogoodStore
+from slot_ordering import build_call_graph
 
 
 def transform_predictions_to_slots_to_search(
@@ -45,134 +60,954 @@ def transform_predictions_to_slots_to_search(
     return slots_to_search
 
 
+def select_candidates_adaptively(
+    predictions: Predictions,
+    max_candidates: int,
+    cumulative_probability_threshold: float,
+    confidence_drop_ratio: float,
+) -> Predictions:
+    """
+    Keeps predictions in rank order until their cumulative probability reaches the threshold or the
+    confidence drops sharply, i.e. a prediction is less than `confidence_drop_ratio` times as likely
+    as the one before it. The top prediction is always kept.
+    """
+    selected_predictions = predictions[:1]
+    cumulative_probability = predictions[0][1] if len(predictions) > 0 else 0
+    for previous, current in zip(predictions, predictions[1:max_candidates]):
+        if cumulative_probability >= cumulative_probability_threshold:
+            break
+        if current[1] < previous[1] * confidence_drop_ratio:
+            break
+        selected_predictions.append(current)
+        cumulative_probability += current[1]
+    return selected_predictions
+
+
+def apply_branching_budget(
+    selected_predictions: List[Predictions],
+    branching_budget: int,
+) -> List[Predictions]:
+    """
+    Limits the total number of predictions over all layers of a file to the branching budget.
+    Every layer keeps its top prediction and the remaining budget goes to the most likely of the
+    other selected predictions.
+    """
+    extra_predictions = sorted(
+        (
+            (-probability, layer_index, rank)
+            for layer_index, predictions in enumerate(selected_predictions)
+            for rank, (_, probability) in enumerate(predictions[1:], start=1)
+        )
+    )
+    remaining_budget = max(branching_budget - len(selected_predictions), 0)
+    number_of_kept_predictions = [1] * len(selected_predictions)
+    for _, layer_index, rank in extra_predictions[:remaining_budget]:
+        number_of_kept_predictions[layer_index] = max(
+            number_of_kept_predictions[layer_index], rank + 1
+        )
+    return [
+        predictions[:number_of_kept]
+        for predictions, number_of_kept in zip(
+            selected_predictions, number_of_kept_predictions
+        )
+    ]
+
+
 def build_search_tree(
     search_tree_layers: Dict[TypeSlot, Predictions],
     top_k: int,
+    adaptive_top_n: bool = False,
+    cumulative_probability_threshold: float = 0.9,
+    confidence_drop_ratio: float = 0.2,
+    branching_budget: int | None = None,
+    import_plans: Dict[TypeSlot, Dict[str, ImportPlan]] | None = None,
 ) -> Dict[str, Dict[str, Any]]:
+    if adaptive_top_n:
+        selected_predictions = [
+            select_candidates_adaptively(
+                preds, top_k, cumulative_probability_threshold, confidence_drop_ratio
+            )
+            for preds in search_tree_layers.values()
+        ]
+        if branching_budget is not None:
+            selected_predictions = apply_branching_budget(
+                selected_predictions, branching_budget
+            )
+    else:
+        selected_predictions = [preds[:top_k] for preds in search_tree_layers.values()]
+
     search_tree = {}
-    for layer_index, (slot, preds) in enumerate(search_tree_layers.items()):
+    for layer_index, (slot, preds) in enumerate(
+        zip(search_tree_layers.keys(), selected_predictions)
+    ):
         func_name, param_name = slot[:-1], slot[-1]
         search_tree[f"layer_{layer_index}"] = {
             "func_name": func_name,
             "param_name": param_name,
-            "predictions": preds[:top_k] + [["", 0]],
+            "predictions": preds + [["", 0]],
         }
+        if import_plans is not None and slot in import_plans:
+            search_tree[f"layer_{layer_index}"]["import_plans"] = import_plans[slot]
     return search_tree
 
 
-def depth_first_traversal(
+def _add_type_annotation_imports(
+    source_code_tree: cst.Module,
+    type_slot: Dict[str, Any],
+    type_annotation: str,
+    editor: FakeEditor,
+    all_project_classes: Dict[str, str],
+) -> Tuple[cst.Module, bool]:
+    # Use the import plan of the prefiltered predictions if there is one
+    import_plans = type_slot.get("import_plans", {})
+    if type_annotation in import_plans:
+        return apply_import_plan(source_code_tree, import_plans[type_annotation]), False
+
+    current_file_path = editor.edit_document.uri.removeprefix("file:///")
+    tree_with_import, unknown_annotations = add_import_to_source_code_tree(
+        source_code_tree,
+        type_annotation,
+        all_project_classes,
+        current_file_path,
+    )
+    return tree_with_import, len(unknown_annotations) > 0
+
+
+def _layer_slot(type_slot: Dict[str, Any]) -> TypeSlot:
+    return type_slot["func_name"] + (type_slot["param_name"],)
+
+
+def _insert_type_annotation(
+    source_code_tree: cst.Module,
+    type_slot: Dict[str, Any],
+    type_annotation: str,
+) -> Tuple[cst.Module, CodeRange | None]:
+    type_annotation = strip_module_prefixes(type_annotation)
+    return (
+        insert_return_annotation(
+            source_code_tree,
+            type_annotation,
+            type_slot["func_name"],
+        )
+        if type_slot["param_name"] == "return"
+        else insert_parameter_annotation(
+            source_code_tree,
+            type_annotation,
+            type_slot["func_name"],
+            type_slot["param_name"],
+        )
+    )
+
+
+SEARCH_TIMEOUT_SECONDS = 5 * 60
+
+
+class SearchStatus(Enum):
+    COMPLETE = "complete"
+    EXHAUSTED = "exhausted"
+    TIMEOUT = "timeout"
+    OUT_OF_FAILURES = "out of failures"
+    INTERRUPTED = "interrupted"
+
+
+@dataclass
+class SearchResult:
+    status: SearchStatus
+    # The complete combination, or otherwise the best validated partial combination
+    source_code_tree: cst.Module
+    number_of_accepted_annotations: int
+    number_of_checks: int
+    # The position of the search when it stopped early, so that it can be resumed from there
+    layer_index: int = 0
+    layer_specific_indices: List[int] = field(default_factory=list)
+
+
+def _replay_accepted_prefix(
+    search_tree: Dict[str, Dict[str, Any]],
+    modified_trees: List[cst.Module | None],
+    slot_annotations: List[str],
+    layer_index: int,
+    layer_specific_indices: List[int],
+    editor: FakeEditor,
+    all_project_classes: Dict[str, str],
+) -> None:
+    # The type annotations before the layer index were already accepted by Pyright, so they are inserted without checking them again
+    for i in range(layer_index):
+        type_slot = search_tree[f"layer_{i}"]
+        type_annotation = remove_quotes(
+            type_slot["predictions"][layer_specific_indices[i]][0]
+        )
+        slot_annotations[i] = type_annotation
+        modified_trees[i], _ = _add_type_annotation_imports(
+            modified_trees[i],
+            type_slot,
+            type_annotation,
+            editor,
+            all_project_classes,
+        )
+        modified_trees[i + 1], _ = _insert_type_annotation(
+            modified_trees[i], type_slot, type_annotation
+        )
+
+
+def _related_later_layers(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    number_of_type_slots: int,
+) -> List[List[int]]:
+    # Layers are related if their functions are the same or one calls the other
+    call_graph = build_call_graph(original_source_code_tree)
+    functions = [
+        search_tree[f"layer_{i}"]["func_name"] for i in range(number_of_type_slots)
+    ]
+    return [
+        [
+            j
+            for j in range(i + 1, number_of_type_slots)
+            if functions[j] == functions[i]
+            or functions[j] in call_graph.get(functions[i], set())
+            or functions[i] in call_graph.get(functions[j], set())
+        ]
+        for i in range(number_of_type_slots)
+    ]
+
+
+def _forward_check(
+    search_tree: Dict[str, Dict[str, Any]],
+    source_code_tree: cst.Module,
+    later_layers: List[int],
+    pruned_candidates: Dict[int, Set[int]],
+    editor: FakeEditor,
+    all_project_classes: Dict[str, str],
+) -> Tuple[Dict[int, Set[int]], int]:
+    """
+    Checks the candidates of the later layers on top of the accepted type annotations in batches of the
+    editor. Returns the rejected candidates per layer and the number of checks.
+    """
+    candidates = []
+    changes = []
+    for j in later_layers:
+        type_slot = search_tree[f"layer_{j}"]
+        for candidate_index, (type_annotation, _) in enumerate(
+            type_slot["predictions"]
+        ):
+            type_annotation = remove_quotes(type_annotation)
+            if type_annotation == "" or candidate_index in pruned_candidates.get(
+                j, set()
+            ):
+                continue
+            tree_with_import, is_unknown_annotation = _add_type_annotation_imports(
+                source_code_tree,
+                type_slot,
+                type_annotation,
+                editor,
+                all_project_classes,
+            )
+            if is_unknown_annotation:
+                continue
+            candidates.append((j, candidate_index))
+            changes.append(
+                _insert_type_annotation(tree_with_import, type_slot, type_annotation)
+            )
+
+    rejected_candidates = {}
+    has_errors = editor.check_in_parallel(
+        [(modified_tree.code, location) for modified_tree, location in changes]
+    )
+    for (j, candidate_index), has_error in zip(candidates, has_errors):
+        if has_error:
+            rejected_candidates.setdefault(j, set()).add(candidate_index)
+    return rejected_candidates, len(changes)
+
+
+def _check_sibling_candidates(
+    search_tree: Dict[str, Dict[str, Any]],
+    layer_index: int,
+    start_index: int,
+    source_code_tree: cst.Module,
+    skipped_candidates: Set[int],
+    editor: FakeEditor,
+    all_project_classes: Dict[str, str],
+) -> Dict[int, bool]:
+    """
+    Checks the next candidates of a layer from the start index at once, as one batch of the editor.
+    Returns whether each checked candidate has an error.
+    """
+    type_slot = search_tree[f"layer_{layer_index}"]
+    candidate_indices = []
+    changes = []
+    for candidate_index in range(start_index, len(type_slot["predictions"])):
+        if len(changes) == editor.batch_size:
+            break
+        if candidate_index in skipped_candidates:
+            continue
+        type_annotation = remove_quotes(type_slot["predictions"][candidate_index][0])
+        tree_with_import, is_unknown_annotation = _add_type_annotation_imports(
+            source_code_tree, type_slot, type_annotation, editor, all_project_classes
+        )
+        if is_unknown_annotation:
+            continue
+        candidate_indices.append(candidate_index)
+        modified_tree, modified_location = _insert_type_annotation(
+            tree_with_import, type_slot, type_annotation
+        )
+        changes.append((modified_tree.code, modified_location))
+    return dict(zip(candidate_indices, editor.check_in_parallel(changes)))
+
+
+def depth_first_search(
     search_tree: Dict[str, Dict[str, Any]],
     original_source_code_tree: cst.Module,
     editor: FakeEditor,
     number_of_type_slots: int,
     all_project_classes: Dict[str, str],
-) -> cst.Module:
+    deadline: float,
+    max_failures: int | None = None,
+    nogood_store: NogoodStore | None = None,
+    checkpoint: SearchCheckpoint | None = None,
+    forward_checking: bool = False,
+    parallel_candidates: bool = False,
+) -> SearchResult:
     layer_index = 0
     layer_specific_indices = [0] * number_of_type_slots
     slot_annotations = [""] * number_of_type_slots
     modified_trees = [original_source_code_tree] + [None] * number_of_type_slots
-    logger = logging.getLogger("main")
+    number_of_checks = 0
+    number_of_failures = 0
+    best_partial_tree = original_source_code_tree
+    best_number_of_accepted_annotations = 0
+
+    if checkpoint is not None:
+        layer_index = checkpoint.layer_index
+        layer_specific_indices = list(checkpoint.layer_specific_indices)
+        _replay_accepted_prefix(
+            search_tree,
+            modified_trees,
+            slot_annotations,
+            layer_index,
+            layer_specific_indices,
+            editor,
+            all_project_classes,
+        )
+        best_partial_tree = modified_trees[layer_index]
+        best_number_of_accepted_annotations = sum(
+            annotation != "" for annotation in slot_annotations[:layer_index]
+        )
+
+    # Candidates rejected by forward checking after accepting a layer, per later layer
+    forward_pruned_candidates: List[Dict[int, Set[int]]] = [
+        {} for _ in range(number_of_type_slots)
+    ]
+    if forward_checking:
+        related_later_layers = _related_later_layers(
+            search_tree, original_source_code_tree, number_of_type_slots
+        )
+
+    # Verdicts of candidates checked ahead in parallel, per layer, with the type annotations they were checked on
+    sibling_verdicts: List[Tuple[Tuple[str, ...], Dict[int, bool]]] = [
+        ((), {}) for _ in range(number_of_type_slots)
+    ]
+
+    def active_pruned_candidates(layer: int) -> Set[int]:
+        return set().union(
+            *(forward_pruned_candidates[i].get(layer, set()) for i in range(layer))
+        )
+
+    # The position at the start of the current iteration, which is consistent even when interrupted halfway
+    position = (layer_index, list(layer_specific_indices))
+
+    def result(status: SearchStatus) -> SearchResult:
+        return SearchResult(
+            status,
+            best_partial_tree,
+            best_number_of_accepted_annotations,
+            number_of_checks,
+            position[0],
+            position[1],
+        )
+
+    try:
+        while 0 <= layer_index < number_of_type_slots:
+            position = (layer_index, list(layer_specific_indices))
+            # The forward checks of this layer and later ones depended on type annotations that changed
+            for i in range(layer_index, number_of_type_slots):
+                forward_pruned_candidates[i] = {}
+            if time.time() > deadline:
+                return result(SearchStatus.TIMEOUT)
+            if max_failures is not None and number_of_failures >= max_failures:
+                return result(SearchStatus.OUT_OF_FAILURES)
+
+            type_slot = search_tree[f"layer_{layer_index}"]
+            type_annotation = type_slot["predictions"][
+                layer_specific_indices[layer_index]
+            ][0]
+
+            type_annotation = remove_quotes(type_annotation)
+
+            slot_annotations[layer_index] = type_annotation
+            # Clear right side of the array as those type annotations are not yet known because of backtracking
+            slot_annotations[layer_index + 1 :] = [""] * (
+                number_of_type_slots - (layer_index + 1)
+            )
 
-    start_time = time.time()
-    while 0 <= layer_index < number_of_type_slots:
-        if time.time() - start_time > 5 * 60:
             print(
-                f"{Fore.RED}Timeout after 5 minutes. File takes too long to process. Likely backtracking is taking too long..."
+                f"{layer_index}: {type_slot['func_name']}-{type_slot['param_name']} -> {type_annotation}"
             )
-            logger.error(
-                "Timeout after 5 minutes. File takes too long to process. Likely backtracking is taking too long..."
+
+            # Handle imports of type annotations
+            tree_with_import, is_unknown_annotation = _add_type_annotation_imports(
+                modified_trees[layer_index],
+                type_slot,
+                type_annotation,
+                editor,
+                all_project_classes,
             )
-            return original_source_code_tree
+            modified_trees[layer_index] = tree_with_import
 
-        type_slot = search_tree[f"layer_{layer_index}"]
-        type_annotation = type_slot["predictions"][layer_specific_indices[layer_index]][
-            0
-        ]
+            if is_unknown_annotation:
+                layer_specific_indices[layer_index] += 1
+                number_of_failures += 1
+                continue
 
-        # Type4Py sometimes returns type annotations with quotes which breaks some stuff, so must be removed
-        if '"' in type_annotation or "'" in type_annotation:
-            type_annotation = re.sub(r"[\"']", "", type_annotation)
+            if nogood_store is not None:
+                assignment = {
+                    _layer_slot(search_tree[f"layer_{i}"]): slot_annotations[i]
+                    for i in range(layer_index)
+                }
 
-        slot_annotations[layer_index] = type_annotation
-        # Clear right side of the array as those type annotations are not yet known because of backtracking
-        slot_annotations[layer_index + 1 :] = [""] * (
-            number_of_type_slots - (layer_index + 1)
+            # Skip the Pyright check if the combination contains one that was rejected before
+            if forward_checking and layer_specific_indices[
+                layer_index
+            ] in active_pruned_candidates(layer_index):
+                has_error = True
+            elif nogood_store is not None and nogood_store.is_pruned(
+                assignment, _layer_slot(type_slot), type_annotation
+            ):
+                has_error = True
+            else:
+                # Add type annotation to source code
+                modified_tree, modified_location = _insert_type_annotation(
+                    modified_trees[layer_index], type_slot, type_annotation
+                )
+                if parallel_candidates:
+                    candidate_index = layer_specific_indices[layer_index]
+                    prefix, verdicts = sibling_verdicts[layer_index]
+                    if (
+                        prefix != tuple(slot_annotations[:layer_index])
+                        or candidate_index not in verdicts
+                    ):
+                        verdicts = _check_sibling_candidates(
+                            search_tree,
+                            layer_index,
+                            candidate_index,
+                            modified_trees[layer_index],
+                            (
+                                active_pruned_candidates(layer_index)
+                                if forward_checking
+                                else set()
+                            ),
+                            editor,
+                            all_project_classes,
+                        )
+                        number_of_checks += len(verdicts)
+                        sibling_verdicts[layer_index] = (
+                            tuple(slot_annotations[:layer_index]),
+                            verdicts,
+                        )
+                    has_error = verdicts[candidate_index]
+                else:
+                    editor.change_file(modified_tree.code, modified_location)
+                    number_of_checks += 1
+                    has_error = editor.has_diagnostic_error()
+                if has_error and nogood_store is not None:
+                    # The verdicts of a batch do not say which errors they are based on
+                    nogood_store.learn(
+                        assignment,
+                        _layer_slot(type_slot),
+                        type_annotation,
+                        modified_tree.code,
+                        None if parallel_candidates else editor.get_diagnostic_errors(),
+                    )
+
+            # On error, change pointers to try next type annotation
+            if has_error:
+                number_of_failures += 1
+                layer_specific_indices[layer_index] += 1
+                while layer_specific_indices[layer_index] >= len(
+                    search_tree[f"layer_{layer_index}"]["predictions"]
+                ):
+                    layer_specific_indices[layer_index] = 0
+                    layer_index -= 1
+                    if layer_index < 0:
+                        break
+                    layer_specific_indices[layer_index] += 1
+            else:
+                modified_trees[layer_index + 1] = modified_tree
+                modified_trees[layer_index + 2 :] = [None] * (
+                    number_of_type_slots - (layer_index + 1)
+                )
+                if forward_checking and len(related_later_layers[layer_index]) > 0:
+                    (
+                        forward_pruned_candidates[layer_index],
+                        number_of_forward_checks,
+                    ) = _forward_check(
+                        search_tree,
+                        modified_tree,
+                        related_later_layers[layer_index],
+                        {
+                            j: active_pruned_candidates(j)
+                            for j in related_later_layers[layer_index]
+                        },
+                        editor,
+                        all_project_classes,
+                    )
+                    number_of_checks += number_of_forward_checks
+                layer_index += 1
+
+                number_of_accepted_annotations = sum(
+                    annotation != "" for annotation in slot_annotations[:layer_index]
+                )
+                if number_of_accepted_annotations > best_number_of_accepted_annotations:
+                    best_partial_tree = modified_tree
+                    best_number_of_accepted_annotations = number_of_accepted_annotations
+
+        if layer_index < 0:
+            return result(SearchStatus.EXHAUSTED)
+
+        best_partial_tree = modified_trees[number_of_type_slots]
+        best_number_of_accepted_annotations = sum(
+            annotation != "" for annotation in slot_annotations
         )
+        return result(SearchStatus.COMPLETE)
+    except KeyboardInterrupt:
+        return result(SearchStatus.INTERRUPTED)
+
+
+def depth_first_traversal(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+    number_of_type_slots: int,
+    all_project_classes: Dict[str, str],
+    nogood_store: NogoodStore | None = None,
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+    checkpoint_file: str | None = None,
+    forward_checking: bool = False,
+    parallel_candidates: bool = False,
+) -> Tuple[cst.Module, SearchStatus]:
+    """
+    When a checkpoint file is given, the search continues from the checkpoint stored in it (if any)
+    and stores a new checkpoint in it when the search times out or is interrupted. The checkpoint
+    file is removed once the search has finished.
+    """
+    logger = logging.getLogger("main")
+
+    checkpoint = None
+    if checkpoint_file is not None:
+        signature = search_tree_signature(search_tree, original_source_code_tree)
+        checkpoint = load_checkpoint(checkpoint_file, signature)
+        if checkpoint is not None:
+            print(f"{Fore.BLUE}Resuming search from layer {checkpoint.layer_index}...")
+            logger.info(f"Resuming search from layer {checkpoint.layer_index}")
+            if nogood_store is not None:
+                nogood_store.load_json(checkpoint.nogoods)
+
+    search_result = depth_first_search(
+        search_tree,
+        original_source_code_tree,
+        editor,
+        number_of_type_slots,
+        all_project_classes,
+        time.time() + timeout,
+        nogood_store=nogood_store,
+        checkpoint=checkpoint,
+        forward_checking=forward_checking,
+        parallel_candidates=parallel_candidates,
+    )
+
+    if checkpoint_file is not None:
+        if search_result.status in (SearchStatus.TIMEOUT, SearchStatus.INTERRUPTED):
+            save_checkpoint(
+                checkpoint_file,
+                SearchCheckpoint(
+                    signature,
+                    search_result.layer_index,
+                    search_result.layer_specific_indices,
+                    nogood_store.to_json() if nogood_store is not None else [],
+                ),
+            )
+            logger.info(
+                f"Saved search checkpoint at layer {search_result.layer_index} to {checkpoint_file}"
+            )
+        else:
+            remove_checkpoint(checkpoint_file)
+
+    if search_result.status == SearchStatus.INTERRUPTED:
+        raise KeyboardInterrupt
 
+    if search_result.status == SearchStatus.TIMEOUT:
         print(
-            f"{layer_index}: {type_slot['func_name']}-{type_slot['param_name']} -> {type_annotation}"
+            f"{Fore.RED}Timeout after {timeout:.0f} seconds. File takes too long to process. Likely backtracking is taking too long..."
         )
+        logger.error(
+            f"Timeout after {timeout:.0f} seconds. File takes too long to process. Likely backtracking is taking too long..."
+        )
+        return original_source_code_tree, search_result.status
 
-        # Handle imports of type annotations
-        current_file_path = editor.edit_document.uri.removeprefix("file:///")
-        tree_with_import, is_unknown_annotation = add_import_to_source_code_tree(
-            modified_trees[layer_index],
-            type_annotation,
+    if search_result.status == SearchStatus.EXHAUSTED:
+        print(f"{Fore.RED}No possible combination of type annotations found...")
+        logger.error(
+            f"No possible combination of type annotations found after {search_result.number_of_checks} Pyright checks..."
+        )
+        return original_source_code_tree, search_result.status
+
+    print(f"{Fore.GREEN}Found a combination of type annotations!")
+    logger.info(
+        f"Found a combination of type annotations after {search_result.number_of_checks} Pyright checks!"
+    )
+    return search_result.source_code_tree, search_result.status
+
+
+def luby(i: int) -> int:
+    """Returns the i-th term (1-indexed) of the Luby sequence: 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if i == (1 << k) - 1:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+
+def _perturbed_layer_order(
+    number_of_type_slots: int, rng: random.Random, strength: float
+) -> List[int]:
+    # Every layer moves at most `strength` times the number of layers from its original position
+    window = max(1.0, strength * number_of_type_slots)
+    return sorted(range(number_of_type_slots), key=lambda i: i + rng.uniform(0, window))
+
+
+def restarting_depth_first_search(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+    number_of_type_slots: int,
+    all_project_classes: Dict[str, str],
+    seed: int = 0,
+    restart_base_failures: int = 16,
+    perturbation_strength: float = 0.5,
+    nogood_store: NogoodStore | None = None,
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+    forward_checking: bool = False,
+    parallel_candidates: bool = False,
+) -> SearchResult:
+    """
+    Runs the depth-first search with a failure budget that grows with the Luby sequence. When a
+    run uses up its budget, the search restarts with a randomly perturbed layer order. The best
+    validated combination over all runs is kept in case no complete combination is found.
+    """
+    logger = logging.getLogger("main")
+    rng = random.Random(seed)
+    deadline = time.time() + timeout
+    best_source_code_tree = original_source_code_tree
+    best_number_of_accepted_annotations = 0
+    number_of_checks = 0
+
+    def result(status: SearchStatus) -> SearchResult:
+        return SearchResult(
+            status,
+            best_source_code_tree,
+            best_number_of_accepted_annotations,
+            number_of_checks,
+        )
+
+    restart = 1
+    while True:
+        layer_order = (
+            list(range(number_of_type_slots))
+            if restart == 1
+            else _perturbed_layer_order(
+                number_of_type_slots, rng, perturbation_strength
+            )
+        )
+        restart_search_tree = {
+            f"layer_{i}": search_tree[f"layer_{j}"] for i, j in enumerate(layer_order)
+        }
+        max_failures = luby(restart) * restart_base_failures
+        logger.info(f"Restart {restart} with a budget of {max_failures} failures")
+
+        search_result = depth_first_search(
+            restart_search_tree,
+            original_source_code_tree,
+            editor,
+            number_of_type_slots,
             all_project_classes,
-            current_file_path,
+            deadline,
+            max_failures,
+            nogood_store,
+            forward_checking=forward_checking,
+            parallel_candidates=parallel_candidates,
         )
-        modified_trees[layer_index] = tree_with_import
+        number_of_checks += search_result.number_of_checks
 
-        if is_unknown_annotation:
-            layer_specific_indices[layer_index] += 1
-            continue
+        if search_result.status == SearchStatus.COMPLETE:
+            print(f"{Fore.GREEN}Found a combination of type annotations!")
+            logger.info(
+                f"Found a combination of type annotations after {restart} restart(s) and {number_of_checks} Pyright checks!"
+            )
+            search_result.number_of_checks = number_of_checks
+            return search_result
 
-        if "." in type_annotation and "[" in type_annotation:
-            type_annotations_to_strip = list(
-                filter(None, re.split("\[|\]|,\s*", type_annotation))
+        if (
+            search_result.number_of_accepted_annotations
+            > best_number_of_accepted_annotations
+        ):
+            best_source_code_tree = search_result.source_code_tree
+            best_number_of_accepted_annotations = (
+                search_result.number_of_accepted_annotations
             )
-            for annotation in type_annotations_to_strip:
-                if "." in annotation and not "..." in annotation:
-                    annotation_stripped = annotation.rsplit(".", 1)[1]
-                    type_annotation = type_annotation.replace(
-                        annotation, annotation_stripped
-                    )
 
-        if "." in type_annotation and not "..." in type_annotation:
-            type_annotation = type_annotation.rsplit(".", 1)[1]
+        if search_result.status == SearchStatus.INTERRUPTED:
+            logger.info(
+                f"Interrupted after {restart} restart(s). Keeping the best partial combination with {best_number_of_accepted_annotations} type annotations..."
+            )
+            return result(SearchStatus.INTERRUPTED)
 
-        # Add type annotation to source code
-        modified_tree, modified_location = (
-            insert_return_annotation(
-                modified_trees[layer_index],
-                type_annotation,
-                type_slot["func_name"],
+        if search_result.status == SearchStatus.TIMEOUT:
+            print(
+                f"{Fore.RED}Timeout after {timeout:.0f} seconds. Keeping the best partial combination of type annotations..."
             )
-            if type_slot["param_name"] == "return"
-            else insert_parameter_annotation(
-                modified_trees[layer_index],
-                type_annotation,
-                type_slot["func_name"],
-                type_slot["param_name"],
+            logger.error(
+                f"Timeout after {timeout:.0f} seconds and {restart} restart(s). Keeping the best partial combination with {best_number_of_accepted_annotations} type annotations..."
+            )
+            return result(SearchStatus.TIMEOUT)
+
+        if search_result.status == SearchStatus.EXHAUSTED:
+            # The whole search tree has been searched, so restarting does not help
+            print(
+                f"{Fore.RED}No possible combination of type annotations found. Keeping the best partial combination..."
             )
+            logger.error(
+                f"No possible combination of type annotations found after {number_of_checks} Pyright checks. Keeping the best partial combination with {best_number_of_accepted_annotations} type annotations..."
+            )
+            return result(SearchStatus.EXHAUSTED)
+
+        restart += 1
+
+
+def restarting_depth_first_traversal(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+    number_of_type_slots: int,
+    all_project_classes: Dict[str, str],
+    seed: int = 0,
+    restart_base_failures: int = 16,
+    perturbation_strength: float = 0.5,
+    nogood_store: NogoodStore | None = None,
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+    forward_checking: bool = False,
+    parallel_candidates: bool = False,
+) -> Tuple[cst.Module, SearchStatus]:
+    search_result = restarting_depth_first_search(
+        search_tree,
+        original_source_code_tree,
+        editor,
+        number_of_type_slots,
+        all_project_classes,
+        seed,
+        restart_base_failures,
+        perturbation_strength,
+        nogood_store,
+        timeout,
+        forward_checking,
+        parallel_candidates,
+    )
+    if search_result.status == SearchStatus.INTERRUPTED:
+        raise KeyboardInterrupt
+    return search_result.source_code_tree, search_result.status
+
+
+# The empty annotation is added to every layer with a probability of 0, so it needs a floor to be scored
+MINIMUM_PREDICTION_PROBABILITY = 1e-6
+
+
+def _log_probability(probability: float) -> float:
+    return math.log(max(probability, MINIMUM_PREDICTION_PROBABILITY))
+
+
+def best_first_search(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+    number_of_type_slots: int,
+    all_project_classes: Dict[str, str],
+    beam_width: int = 10,
+    nogood_store: NogoodStore | None = None,
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+) -> SearchResult:
+    """
+    Searches the type annotation combinations in order of their joint Type4Py confidence score.
+
+    Partial assignments are kept in a priority queue ordered by the sum of the log probabilities of
+    the assigned type annotations plus the best possible log probabilities of the remaining layers.
+    A popped partial assignment is only verified by Pyright when it is popped, so the checks happen
+    in order of joint confidence. At most `beam_width` partial assignments are kept in the queue,
+    plus the assignment that leaves the next type slot of the last popped one unannotated.
+    """
+    logger = logging.getLogger("main")
+    layers = [search_tree[f"layer_{i}"] for i in range(number_of_type_slots)]
+
+    # Optimistic estimate of the score that can still be gained from layer i onwards
+    best_remaining_scores = [0.0] * (number_of_type_slots + 1)
+    for i in range(number_of_type_slots - 1, -1, -1):
+        best_layer_score = max(_log_probability(p) for _, p in layers[i]["predictions"])
+        best_remaining_scores[i] = best_remaining_scores[i + 1] + best_layer_score
+
+    # Queue entries: (-estimated score, -depth, tie breaker, score, parent tree, annotations)
+    # The annotation added last is unverified until the entry is popped
+    tie_breaker = 0
+    queue = [
+        (-best_remaining_scores[0], 0, tie_breaker, 0.0, original_source_code_tree, ())
+    ]
+    number_of_checks = 0
+    best_partial_tree = original_source_code_tree
+    best_number_of_accepted_annotations = 0
+
+    def result(status: SearchStatus) -> SearchResult:
+        return SearchResult(
+            status,
+            best_partial_tree,
+            best_number_of_accepted_annotations,
+            number_of_checks,
         )
-        editor.change_file(modified_tree.code, modified_location)
 
-        # On error, change pointers to try next type annotation
-        if editor.has_diagnostic_error():
-            layer_specific_indices[layer_index] += 1
-            while layer_specific_indices[layer_index] >= len(
-                search_tree[f"layer_{layer_index}"]["predictions"]
-            ):
-                layer_specific_indices[layer_index] = 0
-                layer_index -= 1
-                if layer_index < 0:
-                    break
-                layer_specific_indices[layer_index] += 1
-        else:
-            modified_trees[layer_index + 1] = modified_tree
-            modified_trees[layer_index + 2 :] = [None] * (
-                number_of_type_slots - (layer_index + 1)
+    start_time = time.time()
+    while queue:
+        if time.time() - start_time > timeout:
+            print(
+                f"{Fore.RED}Timeout after {timeout:.0f} seconds. Keeping the best partial combination of type annotations..."
+            )
+            logger.error(
+                f"Timeout after {timeout:.0f} seconds. Likely the beam is too wide. Keeping the best partial combination with {best_number_of_accepted_annotations} type annotations..."
             )
-            layer_index += 1
+            return result(SearchStatus.TIMEOUT)
 
-    if layer_index < 0:
-        print(f"{Fore.RED}No possible combination of type annotations found...")
-        logger.error("No possible combination of type annotations found...")
-        return original_source_code_tree
+        _, _, _, score, tree, annotations = heapq.heappop(queue)
+        depth = len(annotations)
+
+        if depth > 0:
+            layer_index = depth - 1
+            type_slot = layers[layer_index]
+            type_annotation = annotations[-1]
+            print(
+                f"{layer_index}: {type_slot['func_name']}-{type_slot['param_name']} -> {type_annotation}"
+            )
+
+            tree, is_unknown_annotation = _add_type_annotation_imports(
+                tree,
+                type_slot,
+                type_annotation,
+                editor,
+                all_project_classes,
+            )
+            if is_unknown_annotation:
+                continue
+
+            if nogood_store is not None:
+                assignment = {
+                    _layer_slot(layers[i]): annotations[i] for i in range(layer_index)
+                }
+                if nogood_store.is_pruned(
+                    assignment, _layer_slot(type_slot), type_annotation
+                ):
+                    continue
 
-    if layer_index == number_of_type_slots:
-        print(f"{Fore.GREEN}Found a combination of type annotations!")
-        logger.info("Found a combination of type annotations!")
+            tree, modified_location = _insert_type_annotation(
+                tree, type_slot, type_annotation
+            )
+            editor.change_file(tree.code, modified_location)
+            number_of_checks += 1
+            if editor.has_diagnostic_error():
+                if nogood_store is not None:
+                    nogood_store.learn(
+                        assignment,
+                        _layer_slot(type_slot),
+                        type_annotation,
+                        tree.code,
+                        editor.get_diagnostic_errors(),
+                    )
+                continue
+
+            number_of_accepted_annotations = sum(
+                annotation != "" for annotation in annotations
+            )
+            if number_of_accepted_annotations > best_number_of_accepted_annotations:
+                best_partial_tree = tree
+                best_number_of_accepted_annotations = number_of_accepted_annotations
 
-    return modified_trees[number_of_type_slots]
+        if depth == number_of_type_slots:
+            print(f"{Fore.GREEN}Found a combination of type annotations!")
+            logger.info(
+                f"Found a combination of type annotations after {number_of_checks} Pyright checks!"
+            )
+            best_partial_tree = tree
+            best_number_of_accepted_annotations = sum(
+                annotation != "" for annotation in annotations
+            )
+            return result(SearchStatus.COMPLETE)
+
+        empty_child = None
+        for type_annotation, probability in layers[depth]["predictions"]:
+            child_score = score + _log_probability(probability)
+            tie_breaker += 1
+            child = (
+                -(child_score + best_remaining_scores[depth + 1]),
+                -(depth + 1),
+                tie_breaker,
+                child_score,
+                tree,
+                annotations + (remove_quotes(type_annotation),),
+            )
+            if child[-1][-1] == "":
+                empty_child = child
+            heapq.heappush(queue, child)
+
+        if len(queue) > beam_width:
+            queue = heapq.nsmallest(beam_width, queue)
+            # The empty annotation has the lowest score, but without it the search cannot get past
+            # a layer in which no candidate is valid
+            if empty_child is not None and empty_child not in queue:
+                queue.append(empty_child)
+            heapq.heapify(queue)
+
+    print(
+        f"{Fore.RED}No possible combination of type annotations found. Keeping the best partial combination..."
+    )
+    logger.error(
+        f"No possible combination of type annotations found after {number_of_checks} Pyright checks. Keeping the best partial combination with {best_number_of_accepted_annotations} type annotations..."
+    )
+    return result(SearchStatus.EXHAUSTED)
+
+
+def best_first_traversal(
+    search_tree: Dict[str, Dict[str, Any]],
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+    number_of_type_slots: int,
+    all_project_classes: Dict[str, str],
+    beam_width: int = 10,
+    nogood_store: NogoodStore | None = None,
+    timeout: float = SEARCH_TIMEOUT_SECONDS,
+) -> Tuple[cst.Module, SearchStatus]:
+    search_result = best_first_search(
+        search_tree,
+        original_source_code_tree,
+        editor,
+        number_of_type_slots,
+        all_project_classes,
+        beam_width,
+        nogood_store,
+        timeout,
+    )
+    # Without a complete combination, the best partial combination is kept
+    return search_result.source_code_tree, search_result.status
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import os
+import signal
+from collections import deque
+from typing import Dict, List
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DIAGNOSTICS_TIMEOUT_SECONDS = 120
+# Reading the memory usage of the server is not free, so it is only done every so many checks
+MEMORY_CHECK_INTERVAL = 100
+LATENCY_WINDOW = 50
+# A server that does not respond is replaced this many times before the check fails
+MAX_RESTART_ATTEMPTS = 3
+SERVER_STOP_TIMEOUT_SECONDS = 10
+
+
+class PyrightTimeoutException(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+
+
+def _get_child_processes_from_proc() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The process name is between parentheses and may contain spaces
+                parent_pid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent_pid, []).append(int(entry))
+    return children
+
+
+def _get_process_tree_pids(pid: int) -> List[int]:
+    if psutil is not None:
+        try:
+            return [pid] + [
+                child.pid for child in psutil.Process(pid).children(recursive=True)
+            ]
+        except psutil.Error:
+            return [pid]
+    if not os.path.isdir("/proc"):
+        return [pid]
+    children = _get_child_processes_from_proc()
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        pids += children.get(pids[index], [])
+        index += 1
+    return pids
+
+
+def kill_process_tree(pid: int) -> None:
+    """Kills pyright-langserver together with the Node.js server it started."""
+    for process_pid in reversed(_get_process_tree_pids(pid)):
+        try:
+            os.kill(
+                process_pid,
+                signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM,
+            )
+        except OSError:
+            continue
+
+
+def get_process_tree_memory_mb(pid: int) -> float | None:
+    """
+    Returns the resident memory of a process and all its descendants, as pyright-langserver runs the
+    actual Node.js server in a child process. Returns None if the memory usage cannot be determined
+    on this platform.
+    """
+    if psutil is None and not os.path.isdir("/proc"):
+        return None
+    rss_bytes = 0
+    for process_pid in _get_process_tree_pids(pid):
+        if psutil is not None:
+            try:
+                rss_bytes += psutil.Process(process_pid).memory_info().rss
+            except psutil.Error:
+                continue
+            continue
+        try:
+            with open(f"/proc/{process_pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss_bytes += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return rss_bytes / (1024 * 1024)
+
+
+class ServerMonitor:
+    """
+    Watches the memory usage and the response latency of a pyright-langserver instance, so that the
+    editor can replace the server before it slows down a long run. A limit of None disables that check.
+    """
+
+    def __init__(
+        self,
+        max_memory_mb: float | None = None,
+        max_latency_seconds: float | None = None,
+        diagnostics_timeout: float = DIAGNOSTICS_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_memory_mb = max_memory_mb
+        self.max_latency_seconds = max_latency_seconds
+        self.diagnostics_timeout = diagnostics_timeout
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.number_of_checks = 0
+        self.number_of_restarts = 0
+
+    def copy(self) -> ServerMonitor:
+        """Returns a monitor with the same limits for another server."""
+        return ServerMonitor(
+            self.max_memory_mb, self.max_latency_seconds, self.diagnostics_timeout
+        )
+
+    def record_check(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.number_of_checks += 1
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.number_of_checks = 0
+        self.number_of_restarts += 1
+
+    def restart_reason(self, pid: int | None) -> str | None:
+        """Returns why the server should be restarted, or None if it is healthy."""
+        if (
+            self.max_latency_seconds is not None
+            and len(self.latencies) == LATENCY_WINDOW
+        ):
+            average_latency = sum(self.latencies) / len(self.latencies)
+            if average_latency > self.max_latency_seconds:
+                return f"average check latency of {average_latency:.2f} seconds"
+
+        if (
+            self.max_memory_mb is not None
+            and pid is not None
+            and self.number_of_checks > 0
+            and self.number_of_checks % MEMORY_CHECK_INTERVAL == 0
+        ):
+            memory_mb = get_process_tree_memory_mb(pid)
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                return f"memory usage of {memory_mb:.0f} MB"
+        return None
@@ -0,0 +1,361 @@
+from __future__ import annotations
+import ast
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set, Tuple
+import libcst as cst
+from libcst.metadata import CodeRange
+
+from diagnostics import errors_in_diagnostics, has_error_in_diagnostics
+from evaluation import gather_all_type_slots
+from fake_editor import SHADOW_DOCUMENT_PREFIX, FakeEditor
+from rule_based import FunctionLocationVisitor
+from slot_ordering import build_call_graph
+
+FunctionName = Tuple[str, ...]
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+@dataclass
+class ModuleSlice:
+    """A small module with the target function and the context it needs to be type checked."""
+
+    code: str
+    target: FunctionName
+    # The location of the target function in the slice
+    location: CodeRange
+    # The number of lines the target function moved up or down in the slice
+    line_offset: int
+
+
+def _first_line(node: ast.stmt) -> int:
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+
+def _contains_imports(node: ast.stmt) -> bool:
+    return any(isinstance(n, (ast.Import, ast.ImportFrom)) for n in ast.walk(node))
+
+
+def _assigns_attribute(node: ast.stmt, self_name: str) -> bool:
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, ast.AnnAssign):
+        targets = [node.target]
+    else:
+        return False
+    return any(
+        isinstance(n, ast.Attribute)
+        and isinstance(n.value, ast.Name)
+        and n.value.id == self_name
+        for target in targets
+        for n in ast.walk(target)
+    )
+
+
+class _ModuleSlicer:
+    """
+    Builds a slice of a module from the source lines of its statements: imports, module and class
+    level assignments (which include type aliases) and blocks with imports are kept, other functions
+    are reduced to their signature with a `...` body (`__init__` keeps its assignments to instance
+    attributes) and other statements are left out.
+    """
+
+    def __init__(self, python_code: str) -> None:
+        self.lines = python_code.splitlines(keepends=True)
+        if len(self.lines) > 0 and not self.lines[-1].endswith("\n"):
+            self.lines[-1] += "\n"
+        self.output: List[str] = []
+        self.target: FunctionName | None = None
+        self.target_first_line = 0
+        self.slice_first_line = 0
+
+    def _emit_lines(self, first_line: int, last_line: int) -> None:
+        self.output += self.lines[first_line - 1 : last_line]
+
+    def _is_target(self, node: ast.stmt, start_line: int, end_line: int) -> bool:
+        return _first_line(node) <= start_line and node.end_lineno >= end_line
+
+    def _body_shares_line(self, node: ast.stmt) -> bool:
+        """Whether the body starts on the last line of the signature, like `def f(a,\n b): return a`."""
+        first_statement = node.body[0]
+        line = self.lines[_first_line(first_statement) - 1].encode("utf-8")
+        # The column offsets of ast are in bytes
+        return line[: first_statement.col_offset].strip() != b""
+
+    def _indentation(self, node: ast.stmt) -> str:
+        line = self.lines[_first_line(node) - 1]
+        return line[: len(line) - len(line.lstrip())]
+
+    def _emit_function_stub(self, node: ast.stmt) -> None:
+        if self._body_shares_line(node):
+            # Cutting the signature off its body would not parse, and such functions are short
+            self._emit_lines(_first_line(node), node.end_lineno)
+            return
+        self._emit_lines(_first_line(node), _first_line(node.body[0]) - 1)
+        number_of_lines = len(self.output)
+        if node.name == "__init__" and len(node.args.args) > 0:
+            # The assignments to instance attributes declare their types for the other methods
+            self_name = node.args.args[0].arg
+            last_line = 0
+            for statement in node.body:
+                # Statements that share a line with an emitted one are already emitted
+                if _assigns_attribute(statement, self_name) and (
+                    _first_line(statement) > last_line
+                ):
+                    self._emit_lines(_first_line(statement), statement.end_lineno)
+                    last_line = statement.end_lineno
+        if len(self.output) == number_of_lines:
+            self.output.append(self._indentation(node.body[0]) + "...\n")
+
+    def emit_body(
+        self,
+        body: List[ast.stmt],
+        names: FunctionName,
+        start_line: int,
+        end_line: int,
+    ) -> None:
+        number_of_lines = len(self.output)
+        for node in body:
+            if isinstance(node, FUNCTION_NODES):
+                if self.target is None and self._is_target(node, start_line, end_line):
+                    self.target = names + (node.name,)
+                    self.target_first_line = _first_line(node)
+                    self.slice_first_line = len(self.output) + 1
+                    self._emit_lines(_first_line(node), node.end_lineno)
+                else:
+                    self._emit_function_stub(node)
+            elif isinstance(node, ast.ClassDef):
+                if self._body_shares_line(node):
+                    self._emit_lines(_first_line(node), node.end_lineno)
+                    continue
+                self._emit_lines(_first_line(node), _first_line(node.body[0]) - 1)
+                self.emit_body(node.body, names + (node.name,), start_line, end_line)
+            elif isinstance(
+                node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)
+            ) or (isinstance(node, (ast.If, ast.Try)) and _contains_imports(node)):
+                self._emit_lines(_first_line(node), node.end_lineno)
+
+        # A class body needs at least one statement
+        if len(self.output) == number_of_lines and len(names) > 0:
+            self.output.append(self._indentation(body[0]) + "...\n")
+
+
+def build_module_slice(
+    python_code: str, modified_location: CodeRange
+) -> ModuleSlice | None:
+    """
+    Extracts the function (or method) around the modified location into a slice of the module.
+    Returns None if the location is not inside a function, so that the full module is checked.
+    """
+    try:
+        module = ast.parse(python_code)
+    except SyntaxError:
+        return None
+    slicer = _ModuleSlicer(python_code)
+    slicer.emit_body(
+        module.body, (), modified_location.start.line, modified_location.end.line
+    )
+    if slicer.target is None:
+        return None
+
+    line_offset = slicer.slice_first_line - slicer.target_first_line
+    location = CodeRange(
+        (modified_location.start.line + line_offset, modified_location.start.column),
+        (modified_location.end.line + line_offset, modified_location.end.column),
+    )
+    return ModuleSlice("".join(slicer.output), slicer.target, location, line_offset)
+
+
+def _find_function_location(
+    python_code: str, function: FunctionName
+) -> CodeRange | None:
+    visitor = FunctionLocationVisitor()
+    cst.MetadataWrapper(cst.parse_module(python_code)).visit(visitor)
+    return visitor.locations.get(function)
+
+
+class SliceEditor:
+    """
+    Checks the type annotations of a function against a slice of the module instead of the full
+    module, so that the time per check depends on the size of the function rather than the module.
+    Errors that the slice itself causes (e.g. names defined by left out statements) are found by
+    checking the slice of the original code once per function, and are ignored like start errors.
+    Changes without a location are checked on the full module.
+    """
+
+    def __init__(self, editor: FakeEditor, original_python_code: str) -> None:
+        self.editor = editor
+        self.original_python_code = original_python_code
+        directory, file_name = editor.edit_document.uri.rsplit("/", 1)
+        self.slice_uri = f"{directory}/{SHADOW_DOCUMENT_PREFIX}slice__{file_name}"
+        self.slice_start_errors: Dict[FunctionName, Set[str]] = {}
+        self.module_slice: ModuleSlice | None = None
+        self.slice_diagnostics: List[Dict] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.editor, name)
+
+    def _get_slice_start_errors(self, function: FunctionName) -> Set[str]:
+        start_errors = set()
+        location = _find_function_location(self.original_python_code, function)
+        if location is None:
+            return start_errors
+        original_slice = build_module_slice(self.original_python_code, location)
+        if original_slice is None:
+            return start_errors
+        diagnostics = self.editor.check_document(self.slice_uri, original_slice.code)
+        has_error_in_diagnostics(diagnostics, None, start_errors, at_start=True)
+        return start_errors
+
+    def change_file(
+        self, new_python_code: str, modified_location: CodeRange | None
+    ) -> None:
+        self.module_slice = (
+            build_module_slice(new_python_code, modified_location)
+            if modified_location is not None
+            else None
+        )
+        if self.module_slice is None:
+            self.editor.change_file(new_python_code, modified_location)
+            return
+
+        if self.module_slice.target not in self.slice_start_errors:
+            self.slice_start_errors[
+                self.module_slice.target
+            ] = self._get_slice_start_errors(self.module_slice.target)
+        self.slice_diagnostics = self.editor.check_document(
+            self.slice_uri, self.module_slice.code
+        )
+
+    def has_diagnostic_error(self, at_start: bool = False) -> bool:
+        if self.module_slice is None:
+            return self.editor.has_diagnostic_error(at_start)
+        return has_error_in_diagnostics(
+            self.slice_diagnostics,
+            self.module_slice.location,
+            self.editor.start_errors
+            | self.slice_start_errors[self.module_slice.target],
+            at_start,
+        )
+
+    def get_diagnostic_errors(self) -> List[Dict] | None:
+        if self.module_slice is None:
+            return self.editor.get_diagnostic_errors()
+        errors = errors_in_diagnostics(
+            self.slice_diagnostics,
+            self.module_slice.location,
+            self.editor.start_errors
+            | self.slice_start_errors[self.module_slice.target],
+        )
+        # The ranges are moved from the slice back to the module
+        return [
+            {
+                **error,
+                "range": {
+                    position: {
+                        **error["range"][position],
+                        "line": error["range"][position]["line"]
+                        - self.module_slice.line_offset,
+                    }
+                    for position in ("start", "end")
+                },
+            }
+            for error in errors
+        ]
+
+
+class _FunctionRestorer(cst.CSTTransformer):
+    """Replaces functions by their original version, which undoes their type annotations."""
+
+    def __init__(self, original_functions: Dict[FunctionName, cst.FunctionDef]) -> None:
+        self.original_functions = original_functions
+        self.stack: List[str] = []
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> bool:
+        self.stack.append(node.name.value)
+        return True
+
+    def leave_ClassDef(
+        self, original_node: cst.ClassDef, updated_node: cst.ClassDef
+    ) -> cst.ClassDef:
+        self.stack.pop()
+        return updated_node
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        self.stack.append(node.name.value)
+        return False
+
+    def leave_FunctionDef(
+        self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef
+    ) -> cst.FunctionDef:
+        function = tuple(self.stack)
+        self.stack.pop()
+        return self.original_functions.get(function, updated_node)
+
+
+class _FunctionCollector(cst.CSTVisitor):
+    def __init__(self) -> None:
+        self.stack: List[str] = []
+        self.functions: Dict[FunctionName, cst.FunctionDef] = {}
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> bool:
+        self.stack.append(node.name.value)
+        return True
+
+    def leave_ClassDef(self, node: cst.ClassDef) -> None:
+        self.stack.pop()
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        self.functions[tuple(self.stack) + (node.name.value,)] = node
+        return False
+
+
+def verify_full_module(
+    type_annotated_source_code_tree: cst.Module,
+    original_source_code_tree: cst.Module,
+    editor: FakeEditor,
+) -> cst.Module:
+    """
+    A slice does not show the errors that a type annotation causes in other functions, like its
+    callers, so the result of a sliced search is verified once on the full module. Errors are blamed
+    on the annotated functions they are in or that they call, whose type annotations are undone,
+    until the full module has no errors anymore.
+    """
+    original_type_slots = gather_all_type_slots(original_source_code_tree)
+    collector = _FunctionCollector()
+    original_source_code_tree.visit(collector)
+    call_graph = build_call_graph(original_source_code_tree)
+
+    source_code_tree = type_annotated_source_code_tree
+    while True:
+        annotated_functions = {
+            slot[:-1]
+            for slot, annotation in gather_all_type_slots(source_code_tree).items()
+            if annotation != original_type_slots.get(slot)
+        } & set(collector.functions)
+        if len(annotated_functions) == 0:
+            return source_code_tree
+
+        editor.change_file(source_code_tree.code, None)
+        visitor = FunctionLocationVisitor()
+        cst.MetadataWrapper(source_code_tree).visit(visitor)
+        blamed_functions = set()
+        for function, location in visitor.locations.items():
+            if not editor.has_diagnostic_error_at(location):
+                continue
+            blamed = (
+                {function} | call_graph.get(function, set())
+            ) & annotated_functions
+            # An error that cannot be attributed undoes all type annotations
+            blamed_functions |= blamed if len(blamed) > 0 else annotated_functions
+        if len(blamed_functions) == 0:
+            return source_code_tree
+
+        source_code_tree = source_code_tree.visit(
+            _FunctionRestorer(
+                {
+                    function: collector.functions[function]
+                    for function in blamed_functions
+                }
+            )
+        )
@@ -0,0 +1,117 @@
+from typing import Callable, Dict, List, Set, Tuple
+import libcst as cst
+
+from annotations import CallGraphVisitor
+from constants import TypeSlot, Predictions
+
+FunctionName = Tuple[str, ...]
+
+
+def build_call_graph(
+    source_code_tree: cst.Module,
+) -> Dict[FunctionName, Set[FunctionName]]:
+    """
+    Returns a cheap static call graph of the module, mapping each function to the functions of
+    the module it calls. Calls are resolved by name only, so methods with the same name are all
+    considered to be called. Calling a class is considered to call its `__init__` method.
+    """
+    visitor = CallGraphVisitor()
+    source_code_tree.visit(visitor)
+
+    functions_by_name: Dict[str, Set[FunctionName]] = {}
+    for function in visitor.called_names:
+        functions_by_name.setdefault(function[-1], set()).add(function)
+        if function[-1] == "__init__" and len(function) > 1:
+            functions_by_name.setdefault(function[-2], set()).add(function)
+
+    call_graph = {}
+    for function, called_names in visitor.called_names.items():
+        call_graph[function] = set()
+        for name in called_names:
+            call_graph[function] |= functions_by_name.get(name, set())
+        call_graph[function].discard(function)
+    return call_graph
+
+
+def _group_slots_by_function(
+    search_tree_layers: Dict[TypeSlot, Predictions]
+) -> Dict[FunctionName, List[TypeSlot]]:
+    slots_per_function = {}
+    for slot in search_tree_layers:
+        slots_per_function.setdefault(slot[:-1], []).append(slot)
+    return slots_per_function
+
+
+def order_by_source(
+    search_tree_layers: Dict[TypeSlot, Predictions], source_code_tree: cst.Module
+) -> List[TypeSlot]:
+    # Type4Py's predictions are already sorted by the location of the functions
+    return list(search_tree_layers)
+
+
+def order_by_confidence(
+    search_tree_layers: Dict[TypeSlot, Predictions], source_code_tree: cst.Module
+) -> List[TypeSlot]:
+    def top_confidence(slot: TypeSlot) -> float:
+        predictions = search_tree_layers[slot]
+        return predictions[0][1] if len(predictions) > 0 else 0.0
+
+    # Least confident slots first, so that they fail early instead of after deep backtracking
+    return sorted(search_tree_layers, key=top_confidence)
+
+
+def order_by_call_graph(
+    search_tree_layers: Dict[TypeSlot, Predictions], source_code_tree: cst.Module
+) -> List[TypeSlot]:
+    call_graph = build_call_graph(source_code_tree)
+    slots_per_function = _group_slots_by_function(search_tree_layers)
+
+    number_of_callers = {function: 0 for function in call_graph}
+    for callees in call_graph.values():
+        for callee in callees:
+            number_of_callers[callee] += 1
+
+    # Callees come before their callers, starting from the most called functions
+    ordered_functions = []
+    visited = set()
+
+    def visit(function: FunctionName) -> None:
+        if function in visited:
+            return
+        visited.add(function)
+        for callee in sorted(
+            call_graph.get(function, set()),
+            key=lambda f: -number_of_callers.get(f, 0),
+        ):
+            visit(callee)
+        ordered_functions.append(function)
+
+    source_order = list(slots_per_function)
+    for function in sorted(source_order, key=lambda f: -number_of_callers.get(f, 0)):
+        visit(function)
+
+    return [
+        slot
+        for function in ordered_functions
+        for slot in slots_per_function.get(function, [])
+    ]
+
+
+SLOT_ORDERING_STRATEGIES: Dict[
+    str, Callable[[Dict[TypeSlot, Predictions], cst.Module], List[TypeSlot]]
+] = {
+    "source": order_by_source,
+    "confidence": order_by_confidence,
+    "call-graph": order_by_call_graph,
+}
+
+
+def order_search_tree_layers(
+    search_tree_layers: Dict[TypeSlot, Predictions],
+    source_code_tree: cst.Module,
+    strategy: str = "source",
+) -> Dict[TypeSlot, Predictions]:
+    ordered_slots = SLOT_ORDERING_STRATEGIES[strategy](
+        search_tree_layers, source_code_tree
+    )
+    return {slot: search_tree_layers[slot] for slot in ordered_slots}
@@ -0,0 +1,47 @@
+import libcst as cst
+from acceptance import AcceptanceStatistics, slot_name_pattern
+
+
+def test_slot_name_pattern():
+    assert slot_name_pattern(("Reader", "open", "_path")) == "path"
+    assert slot_name_pattern(("Reader", "get_lines", "return")) == "return:get"
+
+
+def test_acceptance_statistics_reorder_later_files():
+    acceptance_statistics = AcceptanceStatistics()
+    search_tree_layers = {("load", "path"): [["str", 0.7], ["Path", 0.2]]}
+    annotated_tree = cst.parse_module("def load(path: Path):\n    pass\n")
+    for _ in range(3):
+        acceptance_statistics.record_search_outcome(search_tree_layers, annotated_tree)
+
+    reordered_search_tree_layers = acceptance_statistics.reorder_predictions(
+        {
+            ("save", "path"): [["str", 0.7], ["Path", 0.2]],
+            ("save", "data"): [["str", 0.7], ["bytes", 0.2]],
+        }
+    )
+    assert [p[0] for p in reordered_search_tree_layers[("save", "path")]] == [
+        "Path",
+        "str",
+    ]
+    assert reordered_search_tree_layers[("save", "data")] == [
+        ["str", 0.7],
+        ["bytes", 0.2],
+    ]
+    assert (
+        round(sum(p[1] for p in reordered_search_tree_layers[("save", "path")]), 6)
+        == 0.9
+    )
+
+
+def test_acceptance_statistics_record_rejections_of_unannotated_slots():
+    acceptance_statistics = AcceptanceStatistics()
+    # The predictions of the search tree end with the empty candidate
+    search_tree_layers = {("load", "path"): [["str", 0.7], ["bytes", 0.2], ["", 0]]}
+    unannotated_tree = cst.parse_module("def load(path):\n    pass\n")
+    acceptance_statistics.record_search_outcome(search_tree_layers, unannotated_tree)
+
+    assert acceptance_statistics.statistics == {
+        ("path", "str"): [0, 1],
+        ("path", "bytes"): [0, 1],
+    }
@@ -1,5 +1,5 @@
 import libcst as cst
-from src.annotations import node_to_code
+from src.annotations import RuleBasedTypeSlotsVisitor, node_to_code
 
 
 def test_node_to_code_with_empty_module():
@@ -28,3 +28,45 @@ def test_node_to_code_with_function_def():
     )
     result = node_to_code(node)
     assert result == "def test(): pass"
+
+
+def test_rule_based_type_slots():
+    source_code = """
+from abc import abstractmethod
+
+class Shape:
+    def __init__(self, name, sides=4, scale=-1.5, label=b"x", visible=True):
+        self.name = name
+
+    @abstractmethod
+    def area(self):
+        ...
+
+    def draw(self, canvas=None):
+        if canvas is None:
+            return
+        canvas.add(self)
+
+    def describe(self):
+        \"\"\"Describes the shape.\"\"\"
+        raise NotImplementedError
+
+    def points(self):
+        def inner():
+            return 1
+        yield inner()
+
+    def size(self, unit="cm"):
+        return self.sides
+"""
+    visitor = RuleBasedTypeSlotsVisitor()
+    cst.parse_module(source_code).visit(visitor)
+    assert visitor.annotations == {
+        ("Shape", "__init__", "sides"): "int",
+        ("Shape", "__init__", "scale"): "float",
+        ("Shape", "__init__", "label"): "bytes",
+        ("Shape", "__init__", "visible"): "bool",
+        ("Shape", "__init__", "return"): "None",
+        ("Shape", "draw", "return"): "None",
+        ("Shape", "size", "unit"): "str",
+    }
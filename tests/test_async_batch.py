@@ -0,0 +1,135 @@
+import json
+import sys
+import pytest
+from libcst.metadata import CodeRange
+from async_batch import AsyncBatchVerifier
+from fake_editor import set_langserver_command_override
+from lsp_replay import get_replay_command
+from server_monitor import MAX_RESTART_ATTEMPTS, PyrightTimeoutException
+
+SOURCE_CODE = "def f(a):\n    return a\n"
+REJECTED_CODE = "def f(a: int):\n    return x\n"
+ACCEPTED_CODE = "def f(a: int):\n    return a\n"
+LOCATION = CodeRange((1, 0), (2, 12))
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """A recording in which only the rejected code has an error."""
+    path = tmp_path / "session-1.jsonl"
+    records = []
+    for version, (text, diagnostics) in enumerate(
+        [
+            (SOURCE_CODE, []),
+            (ACCEPTED_CODE, []),
+            (
+                REJECTED_CODE,
+                [
+                    {
+                        "severity": 1,
+                        "message": '"x" is not defined',
+                        "range": {
+                            "start": {"line": 1, "character": 11},
+                            "end": {"line": 1, "character": 12},
+                        },
+                    }
+                ],
+            ),
+        ],
+        start=1,
+    ):
+        uri = f"file:///project/module{version}.py"
+        document = {"uri": uri, "languageId": "python", "version": 1, "text": text}
+        records.append(
+            {
+                "time": 0.0,
+                "from": "client",
+                "message": {
+                    "jsonrpc": "2.0",
+                    "method": "textDocument/didOpen",
+                    "params": {"textDocument": document},
+                },
+            }
+        )
+        records.append(
+            {
+                "time": 0.0,
+                "from": "server",
+                "message": {
+                    "jsonrpc": "2.0",
+                    "method": "textDocument/publishDiagnostics",
+                    "params": {"uri": uri, "version": 1, "diagnostics": diagnostics},
+                },
+            }
+        )
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    yield str(path)
+    set_langserver_command_override(None)
+
+
+def test_async_batch_verifier_checks_a_batch_concurrently(recording):
+    set_langserver_command_override(get_replay_command(recording, latency=0))
+    verifier = AsyncBatchVerifier("file:///project", batch_size=2)
+    try:
+        verifier.open_file("/project/module.py", SOURCE_CODE)
+        verdicts = verifier.check_in_parallel(
+            [(ACCEPTED_CODE, LOCATION), (REJECTED_CODE, LOCATION)] * 2
+        )
+    finally:
+        verifier.stop()
+
+    assert verdicts == [False, True, False, True]
+    assert verifier.number_of_checks == 4
+    assert verifier.number_of_restarts == 0
+
+
+def test_async_batch_verifier_restarts_a_server_that_times_out(recording):
+    # Unknown code takes longer than the diagnostics timeout
+    set_langserver_command_override(get_replay_command(recording, latency=30))
+    verifier = AsyncBatchVerifier(
+        "file:///project", batch_size=2, diagnostics_timeout=0.5
+    )
+    try:
+        verifier.open_file("/project/module.py", SOURCE_CODE)
+        set_langserver_command_override(get_replay_command(recording, latency=0))
+        verdicts = verifier.check_in_parallel(
+            [(REJECTED_CODE, LOCATION), ("def f(a: str):\n    return a\n", LOCATION)]
+        )
+    finally:
+        verifier.stop()
+
+    assert verdicts == [True, False]
+    assert verifier.number_of_restarts == 1
+
+
+def test_async_batch_verifier_gives_up_on_servers_that_do_not_initialize(recording):
+    set_langserver_command_override(get_replay_command(recording, latency=0))
+    verifier = AsyncBatchVerifier(
+        "file:///project", batch_size=2, diagnostics_timeout=0.5
+    )
+    try:
+        # A server that never answers the initialize request
+        set_langserver_command_override(
+            [sys.executable, "-c", "import sys; sys.stdin.buffer.read()"]
+        )
+        with pytest.raises(PyrightTimeoutException):
+            verifier.restart_server("test")
+        assert verifier.number_of_restarts == MAX_RESTART_ATTEMPTS
+    finally:
+        set_langserver_command_override(get_replay_command(recording, latency=0))
+        verifier.restart_server("test")
+        verifier.stop()
+
+
+def test_async_batch_verifier_answers_with_the_workspace_configuration(recording):
+    set_langserver_command_override(get_replay_command(recording, latency=0))
+    configuration = {"python.analysis": {"diagnosticMode": "workspace"}}
+    verifier = AsyncBatchVerifier(
+        "file:///project", batch_size=2, workspace_configuration=configuration
+    )
+    try:
+        assert verifier._handle_configuration_request(
+            {"items": [{"section": "python.analysis"}, {"section": "python"}]}
+        ) == [configuration["python.analysis"], None]
+    finally:
+        verifier.stop()
@@ -0,0 +1,55 @@
+import pytest
+import libcst as cst
+from candidates import prefilter_candidates
+
+
+def test_prefilter_candidates_collapses_duplicates():
+    source_code_tree = cst.parse_module("def function(a): pass")
+    search_tree_layers = {
+        ("function", "a"): [["List[int]", 0.5], ["list[int]", 0.3], ["str", 0.2]]
+    }
+    filtered_layers, import_plans = prefilter_candidates(
+        search_tree_layers, source_code_tree, {}, "file.py"
+    )
+    assert filtered_layers == {("function", "a"): [["List[int]", 0.8], ["str", 0.2]]}
+    assert import_plans == {
+        ("function", "a"): {
+            "List[int]": [("List", "from typing import List")],
+            "str": [],
+        }
+    }
+
+
+def test_prefilter_candidates_drops_unusable_predictions():
+    source_code_tree = cst.parse_module("def function(a): pass")
+    search_tree_layers = {
+        ("function", "a"): [["'Foo'", 0.4], ["Bar", 0.3], ["int[", 0.2], ["int", 0.1]]
+    }
+    filtered_layers, _ = prefilter_candidates(
+        search_tree_layers, source_code_tree, {"Foo": "pkg/foo.py"}, "pkg/main.py"
+    )
+    assert filtered_layers == {("function", "a"): [["Foo", 0.4], ["int", 0.1]]}
+
+
+def test_prefilter_candidates_keeps_literals_and_classes_of_other_modules():
+    source_code_tree = cst.parse_module("def function(a): pass")
+    search_tree_layers = {
+        ("function", "a"): [
+            ["Literal['r']", 0.3],
+            ["Literal['w']", 0.2],
+            ["a.Config", 0.2],
+            ["Config", 0.1],
+            ["b.Config", 0.1],
+        ]
+    }
+    filtered_layers, _ = prefilter_candidates(
+        search_tree_layers, source_code_tree, {"Config": "pkg/a.py"}, "pkg/main.py"
+    )
+    assert filtered_layers == {
+        ("function", "a"): [
+            ["Literal[r]", 0.3],
+            ["Literal[w]", 0.2],
+            ["a.Config", pytest.approx(0.3)],
+            ["b.Config", 0.1],
+        ]
+    }
@@ -0,0 +1,60 @@
+import json
+import libcst as cst
+from checkpoints import (
+    SearchCheckpoint,
+    load_checkpoint,
+    save_checkpoint,
+    search_tree_signature,
+)
+from nogoods import NogoodStore
+
+
+SOURCE_CODE = """
+def helper(value):
+    return value
+
+def main(a):
+    return helper(a)
+"""
+
+
+def test_checkpoint_is_only_loaded_for_the_same_search_tree(tmp_path):
+    source_code_tree = cst.parse_module(SOURCE_CODE)
+    search_tree = {
+        "layer_0": {
+            "func_name": ("main",),
+            "param_name": "a",
+            "predictions": [["int", 0.8], ["", 0]],
+        }
+    }
+    signature = search_tree_signature(search_tree, source_code_tree)
+    checkpoint_file = str(tmp_path / "project" / "main.py.json")
+    save_checkpoint(checkpoint_file, SearchCheckpoint(signature, 1, [1, 0]))
+
+    assert load_checkpoint(checkpoint_file, signature) == SearchCheckpoint(
+        signature, 1, [1, 0]
+    )
+    search_tree["layer_0"]["predictions"][0] = ["str", 0.8]
+    other_signature = search_tree_signature(search_tree, source_code_tree)
+    assert load_checkpoint(checkpoint_file, other_signature) is None
+
+
+def test_nogoods_survive_a_checkpoint():
+    nogood_store = NogoodStore()
+    error = {
+        "severity": 1,
+        "message": "cannot be assigned to",
+        "range": {
+            "start": {"line": 5, "character": 11},
+            "end": {"line": 5, "character": 20},
+        },
+    }
+    nogood_store.learn(
+        {("helper", "return"): "int"}, ("main", "return"), "str", SOURCE_CODE, [error]
+    )
+
+    resumed_nogood_store = NogoodStore()
+    resumed_nogood_store.load_json(json.loads(json.dumps(nogood_store.to_json())))
+    assignment = {("helper", "return"): "int"}
+    assert resumed_nogood_store.is_pruned(assignment, ("main", "return"), "str")
+    assert not resumed_nogood_store.is_pruned(assignment, ("main", "return"), "int")
@@ -0,0 +1,42 @@
+from libcst.metadata import CodeRange
+from diagnostics import errors_in_diagnostics, has_error_in_diagnostics
+
+
+def diagnostic(message: str, line: int) -> dict:
+    return {
+        "message": message,
+        "range": {
+            "start": {"line": line, "character": 4},
+            "end": {"line": line, "character": 10},
+        },
+    }
+
+
+def test_has_error_in_diagnostics_only_in_modified_location():
+    modified_location = CodeRange((1, 0), (3, 20))
+    error = 'Expression of type "str" cannot be assigned to return type "int"'
+    assert has_error_in_diagnostics([diagnostic(error, 2)], modified_location, set())
+    assert not has_error_in_diagnostics(
+        [diagnostic(error, 5)], modified_location, set()
+    )
+    assert not has_error_in_diagnostics(
+        [diagnostic('"Unknown" is not defined', 2)], modified_location, set()
+    )
+
+
+def test_has_error_in_diagnostics_ignores_start_errors():
+    modified_location = CodeRange((1, 0), (3, 20))
+    start_errors = set()
+    diagnostics = [diagnostic('"foo" is not defined', 2)]
+    assert not has_error_in_diagnostics(diagnostics, None, start_errors, at_start=True)
+    assert start_errors == {'"foo" is not defined'}
+    assert not has_error_in_diagnostics(diagnostics, modified_location, start_errors)
+
+
+def test_errors_in_diagnostics_only_returns_errors_in_location():
+    error = '"foo" is not defined'
+    diagnostics = [diagnostic(error, line) for line in range(100, 0, -1)]
+    diagnostics.append(diagnostic("Import could not be resolved", 41))
+    errors = errors_in_diagnostics(diagnostics, CodeRange((40, 0), (42, 20)), set())
+    assert [error["range"]["start"]["line"] for error in errors] == [42, 41, 40]
+    assert errors_in_diagnostics(diagnostics, None, set()) == []
@@ -1,6 +1,10 @@
 import os
 import libcst as cst
-from evaluation import gather_all_type_slots, create_evaluation_csv_file
+from evaluation import (
+    calculate_evaluation_statistics,
+    create_evaluation_csv_file,
+    gather_all_type_slots,
+)
 
 
 def test_gather_all_type_slots():
@@ -25,3 +29,33 @@ def test_gather_all_type_slots_with_incomplete_type_annotations():
         ("function", "c"): "List[str]",
         ("function", "return"): "float",
     }
+
+
+def test_calculate_evaluation_statistics_pyright_checks_per_accepted_slot():
+    type_slots_groundtruth = {
+        ("function", "a"): None,
+        ("function", "b"): "int",
+        ("function", "return"): None,
+    }
+    type_slots_after_ml_search = {
+        ("function", "a"): "str",
+        ("function", "b"): "int",
+        ("function", "return"): "bool",
+    }
+    evaluation_statistics = calculate_evaluation_statistics(
+        "file.py",
+        type_slots_groundtruth,
+        type_slots_groundtruth,
+        type_slots_after_ml_search,
+        2,
+        True,
+        True,
+        0.0,
+        1.0,
+        1.0,
+        0,
+        0,
+        5,
+    )
+    assert evaluation_statistics["pyright_checks_ml_search_count"] == 5
+    assert evaluation_statistics["pyright_checks_per_accepted_ml_slot"] == 2.5
@@ -0,0 +1,40 @@
+import io
+import pytest
+from client.json_rpc_endpoint import JsonRpcEndpoint
+
+
+def read_messages(data: bytes) -> list:
+    endpoint = JsonRpcEndpoint(io.BytesIO(), io.BytesIO(data))
+    messages = []
+    while (message := endpoint.read_response()) is not None:
+        messages.append(message)
+    return messages
+
+
+def test_write_message_counts_bytes_and_reads_back():
+    stdin = io.BytesIO()
+    message = {"jsonrpc": "2.0", "method": "test", "params": {"text": "é ü 日本"}}
+    JsonRpcEndpoint(stdin, io.BytesIO()).write_message(message)
+
+    data = stdin.getvalue()
+    header, body = data.split(b"\r\n\r\n", 1)
+    assert header == b"Content-Length: %d" % len(body)
+    assert read_messages(data) == [message]
+
+
+def test_read_response_with_content_type_and_several_messages():
+    body = b'{"jsonrpc": "2.0", "id": 1, "result": null}'
+    data = (
+        b"Content-Length: %d\r\n" % len(body)
+        + b"Content-Type: application/vscode-jsonrpc; charset=utf-8\r\n\r\n"
+        + body
+        + b"content-length:%d\r\n\r\n" % len(body)
+        + body
+    )
+    assert read_messages(data) == [{"jsonrpc": "2.0", "id": 1, "result": None}] * 2
+
+
+def test_read_response_bad_and_truncated_messages():
+    with pytest.raises(RuntimeError):
+        read_messages(b"Content-Type: application/vscode-jsonrpc\r\n\r\n{}")
+    assert read_messages(b'Content-Length: 100\r\n\r\n{"id": 1}') == []
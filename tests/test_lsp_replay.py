@@ -0,0 +1,171 @@
+import io
+import json
+import subprocess
+import pytest
+from client.json_rpc_endpoint import JsonRpcEndpoint
+from lsp_replay import (
+    FakePyrightServer,
+    RecordedSession,
+    get_record_command,
+    get_replay_command,
+    load_recording,
+)
+
+URI = "file:///project/module.py"
+ERROR = {
+    "severity": 1,
+    "message": '"x" is not defined',
+    "range": {
+        "start": {"line": 1, "character": 4},
+        "end": {"line": 1, "character": 5},
+    },
+}
+
+
+def did_open(text: str) -> dict:
+    document = {"uri": URI, "languageId": "python", "version": 1, "text": text}
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didOpen",
+        "params": {"textDocument": document},
+    }
+
+
+def did_change(version: int, text: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didChange",
+        "params": {
+            "textDocument": {"uri": URI, "version": version},
+            "contentChanges": [{"text": text}],
+        },
+    }
+
+
+def publish(version: int | None, diagnostics: list) -> dict:
+    params = {"uri": URI, "diagnostics": diagnostics}
+    if version is not None:
+        params["version"] = version
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/publishDiagnostics",
+        "params": params,
+    }
+
+
+def encode(messages: list) -> bytes:
+    stream = io.BytesIO()
+    endpoint = JsonRpcEndpoint(stream, io.BytesIO())
+    for message in messages:
+        endpoint.write_message(message)
+    return stream.getvalue()
+
+
+def decode(data: bytes) -> list:
+    endpoint = JsonRpcEndpoint(io.BytesIO(), io.BytesIO(data))
+    messages = []
+    while (message := endpoint.read_response()) is not None:
+        messages.append(message)
+    return messages
+
+
+def write_recording(path, records: list) -> None:
+    with open(path, "w") as recording:
+        for time, sender, message in records:
+            recording.write(
+                json.dumps({"time": time, "from": sender, "message": message}) + "\n"
+            )
+
+
+def test_load_recording_matches_diagnostics_to_texts(tmp_path):
+    initialize_result = {"capabilities": {"textDocumentSync": 2}}
+    write_recording(
+        tmp_path / "session-1.jsonl",
+        [
+            (
+                0.0,
+                "client",
+                {"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}},
+            ),
+            (0.1, "server", {"jsonrpc": "2.0", "id": 0, "result": initialize_result}),
+            (0.2, "client", did_open("def f():\n    return 1\n")),
+            (0.3, "client", did_change(2, "def f():\n    x\n")),
+            # The diagnostics of version 1 arrive after version 2 was sent
+            (0.5, "server", publish(1, [])),
+            (0.9, "server", publish(2, [ERROR])),
+        ],
+    )
+
+    session = load_recording(str(tmp_path))
+
+    assert session.initialize_result == initialize_result
+    assert session.get_diagnostics("def f():\n    return 1\n") == (
+        [],
+        pytest.approx(0.3),
+    )
+    assert session.get_diagnostics("def f():\n    x\n") == ([ERROR], pytest.approx(0.6))
+    assert session.get_diagnostics("def g():\n    pass\n") is None
+    assert session.pushes_diagnostics
+
+
+def test_fake_server_replays_recorded_diagnostics():
+    session = RecordedSession()
+    session.add_diagnostics("def f():\n    x\n", [ERROR], 10.0)
+    server = FakePyrightServer(session, latency=0, latency_scale=0)
+    stdout = io.BytesIO()
+
+    server.serve(
+        io.BytesIO(
+            encode(
+                [
+                    {"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}},
+                    did_open("def f():\n    return 1\n"),
+                    did_change(2, "def f():\n    x\n"),
+                    {"jsonrpc": "2.0", "id": 1, "method": "shutdown"},
+                    {"jsonrpc": "2.0", "method": "exit"},
+                ]
+            )
+        ),
+        stdout,
+    )
+
+    messages = decode(stdout.getvalue())
+    assert messages[0]["result"] == {"capabilities": {"textDocumentSync": 1}}
+    assert messages[1:] == [
+        publish(1, []),
+        publish(2, [ERROR]),
+        {"jsonrpc": "2.0", "id": 1, "result": None},
+    ]
+    assert server.number_of_replayed_checks == 1
+    assert server.number_of_missed_checks == 1
+
+
+def test_record_a_replayed_session_offline(tmp_path):
+    write_recording(
+        tmp_path / "original.jsonl",
+        [
+            (0.0, "client", did_open("def f():\n    x\n")),
+            (0.0, "server", publish(1, [ERROR])),
+        ],
+    )
+    output_directory = tmp_path / "recorded"
+    messages = [
+        {"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}},
+        did_open("def f():\n    x\n"),
+        {"jsonrpc": "2.0", "id": 1, "method": "shutdown"},
+        {"jsonrpc": "2.0", "method": "exit"},
+    ]
+
+    # Record the fake server, so the recorder is tested without Node and Pyright
+    command = get_record_command(
+        str(output_directory),
+        get_replay_command(str(tmp_path / "original.jsonl"), latency=0),
+    )
+    result = subprocess.run(
+        command, input=encode(messages), capture_output=True, timeout=30
+    )
+
+    assert [m.get("id") for m in decode(result.stdout)] == [0, None, 1]
+    session = load_recording(str(output_directory))
+    assert session.get_diagnostics("def f():\n    x\n")[0] == [ERROR]
+    assert session.initialize_result == {"capabilities": {"textDocumentSync": 1}}
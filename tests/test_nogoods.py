@@ -0,0 +1,109 @@
+import threading
+from nogoods import NogoodStore
+
+
+SOURCE_CODE = """
+class Reader:
+    def __init__(self, path):
+        self.path = path
+
+def helper(value):
+    return value
+
+def main(a, b, reader):
+    c = helper(a)
+    print(reader.path)
+    return c
+
+def unrelated(c):
+    return c
+"""
+
+
+def error_at(line: int, start: int, end: int) -> dict:
+    return {
+        "severity": 1,
+        "message": "cannot be assigned to",
+        "range": {
+            "start": {"line": line, "character": start},
+            "end": {"line": line, "character": end},
+        },
+    }
+
+
+def test_nogood_store_only_keeps_the_slots_that_the_errors_depend_on():
+    nogood_store = NogoodStore()
+    assignment = {
+        ("Reader", "__init__", "path"): "str",
+        ("helper", "value"): "int",
+        ("helper", "return"): "int",
+        ("unrelated", "c"): "str",
+        ("main", "a"): "str",
+        ("main", "b"): "str",
+    }
+    # The error is in `return c`, whose type comes from `helper(a)`
+    nogood = nogood_store.learn(
+        assignment, ("main", "return"), "str", SOURCE_CODE, [error_at(11, 11, 12)]
+    )
+    assert (
+        nogood
+        == {
+            ("helper", "value"): "int",
+            ("helper", "return"): "int",
+            ("main", "a"): "str",
+            ("main", "return"): "str",
+        }.items()
+    )
+
+    # The error is in `print(reader.path)`, whose type is declared by `__init__`
+    nogood = nogood_store.learn(
+        assignment, ("main", "reader"), "Reader", SOURCE_CODE, [error_at(10, 10, 21)]
+    )
+    assert (
+        nogood
+        == {
+            ("Reader", "__init__", "path"): "str",
+            ("main", "reader"): "Reader",
+        }.items()
+    )
+
+
+def test_nogood_store_does_not_learn_unknown_errors():
+    nogood_store = NogoodStore()
+    slot = ("main", "return")
+    assert nogood_store.learn({}, slot, "str", SOURCE_CODE, None) is None
+    # An error outside of the functions cannot be attributed to type slots
+    assert nogood_store.learn({}, slot, "str", SOURCE_CODE, [error_at(1, 0, 5)]) is None
+    assert not nogood_store.is_pruned({}, slot, "str")
+
+
+def test_nogood_store_prunes_known_conflicts():
+    nogood_store = NogoodStore()
+    assignment = {("helper", "return"): "int", ("unrelated", "c"): "str"}
+    nogood_store.learn(
+        assignment, ("main", "return"), "str", SOURCE_CODE, [error_at(11, 11, 12)]
+    )
+
+    assignment[("unrelated", "c")] = "bytes"
+    assert nogood_store.is_pruned(assignment, ("main", "return"), "str")
+    assignment[("helper", "return")] = "str"
+    assert not nogood_store.is_pruned(assignment, ("main", "return"), "str")
+    assert nogood_store.number_of_pruned_checks == 1
+
+
+def test_nogood_store_counts_pruned_checks_from_several_threads():
+    nogood_store = NogoodStore()
+    nogood_store.learn(
+        {}, ("main", "a"), "str", "def main(a):\n    return a\n", [error_at(1, 11, 12)]
+    )
+
+    def check():
+        for _ in range(1000):
+            nogood_store.is_pruned({}, ("main", "a"), "str")
+
+    threads = [threading.Thread(target=check) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert nogood_store.number_of_pruned_checks == 4000
@@ -0,0 +1,21 @@
+import libcst as cst
+from phases import apply_phase_result, collect_phase_result
+
+
+def test_collect_and_apply_phase_result():
+    source_code_tree = cst.parse_module("def function(a, b): pass")
+    annotated_source_code_tree = cst.parse_module(
+        "from typing import List\ndef function(a: List[int], b) -> None: pass"
+    )
+    phase_result = collect_phase_result(source_code_tree, annotated_source_code_tree)
+    assert phase_result == {
+        "annotations": [
+            [["function", "a"], "List[int]"],
+            [["function", "return"], "None"],
+        ],
+        "statements": ["from typing import List"],
+    }
+    assert (
+        apply_phase_result(source_code_tree, phase_result).code
+        == annotated_source_code_tree.code
+    )
@@ -0,0 +1,46 @@
+import libcst as cst
+from rule_based import fill_rule_based_type_slots
+
+SOURCE_CODE = """def area(sides=4):
+    return sides
+
+
+def name(label="x"):
+    return label
+
+
+def main():
+    return area(4.0)
+"""
+CALLER_ERROR = {
+    "severity": 1,
+    "message": 'Argument of type "float" cannot be assigned to parameter "sides" of type "int"',
+    "range": {
+        "start": {"line": 9, "character": 16},
+        "end": {"line": 9, "character": 19},
+    },
+}
+
+
+class CallerEditor:
+    """Reports an error in the caller of `area` as long as `sides` is annotated as int."""
+
+    def __init__(self) -> None:
+        self.start_errors = set()
+        self.diagnostics = []
+
+    def change_file(self, new_python_code, modified_location) -> None:
+        self.diagnostics = [CALLER_ERROR] if "sides: int" in new_python_code else []
+
+    def get_new_errors(self) -> list:
+        return self.diagnostics
+
+
+def test_rule_based_annotations_that_break_a_caller_are_dropped():
+    source_code_tree, annotations = fill_rule_based_type_slots(
+        cst.parse_module(SOURCE_CODE), CallerEditor()
+    )
+
+    assert annotations == {("name", "label"): "str"}
+    assert "def area(sides=4):" in source_code_tree.code
+    assert 'def name(label: str="x"):' in source_code_tree.code
@@ -0,0 +1,67 @@
+import libcst as cst
+import pytest
+from searchtree import (
+    SearchStatus,
+    restarting_depth_first_search,
+    restarting_depth_first_traversal,
+)
+
+SOURCE_CODE = "def f(a, b):\n    return a\n"
+SEARCH_TREE = {
+    "layer_0": {
+        "func_name": ("f",),
+        "param_name": "a",
+        "predictions": [["int", 0.9], ["", 0]],
+    },
+    "layer_1": {
+        "func_name": ("f",),
+        "param_name": "b",
+        "predictions": [["int", 0.9], ["", 0]],
+    },
+}
+
+
+class InterruptingEditor:
+    """Rejects every type annotation of `b` and is interrupted at its third check."""
+
+    class edit_document:
+        uri = "file:///project/module.py"
+
+    def __init__(self) -> None:
+        self.number_of_checks = 0
+        self.code = ""
+
+    def change_file(self, new_python_code, modified_location) -> None:
+        self.number_of_checks += 1
+        if self.number_of_checks == 3:
+            raise KeyboardInterrupt
+        self.code = new_python_code
+
+    def has_diagnostic_error(self, at_start: bool = False) -> bool:
+        return "b: " in self.code
+
+
+def test_restarting_search_stops_when_interrupted():
+    # The first run stops after its single failure, the second run is interrupted
+    search_result = restarting_depth_first_search(
+        SEARCH_TREE,
+        cst.parse_module(SOURCE_CODE),
+        InterruptingEditor(),
+        2,
+        {},
+        restart_base_failures=1,
+    )
+
+    assert search_result.status == SearchStatus.INTERRUPTED
+    assert search_result.source_code_tree.code == "def f(a: int, b):\n    return a\n"
+    assert search_result.number_of_accepted_annotations == 1
+
+    with pytest.raises(KeyboardInterrupt):
+        restarting_depth_first_traversal(
+            SEARCH_TREE,
+            cst.parse_module(SOURCE_CODE),
+            InterruptingEditor(),
+            2,
+            {},
+            restart_base_failures=1,
+        )
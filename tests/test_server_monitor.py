@@ -0,0 +1,29 @@
+import os
+import pytest
+from server_monitor import LATENCY_WINDOW, ServerMonitor, get_process_tree_memory_mb
+
+
+def test_restart_reason_for_slow_checks():
+    monitor = ServerMonitor(max_latency_seconds=0.5)
+    for _ in range(LATENCY_WINDOW - 1):
+        monitor.record_check(1.0)
+    # The average latency only counts once the window is full
+    assert monitor.restart_reason(None) is None
+    monitor.record_check(1.0)
+    assert monitor.restart_reason(None) is not None
+
+    monitor.reset()
+    assert monitor.restart_reason(None) is None
+    assert monitor.number_of_restarts == 1
+
+
+def test_restart_reason_for_memory_usage():
+    memory_mb = get_process_tree_memory_mb(os.getpid())
+    if memory_mb is None:
+        pytest.skip("The memory usage cannot be read on this platform")
+    assert memory_mb > 0
+    monitor = ServerMonitor(max_memory_mb=memory_mb / 2)
+    monitor.record_check(0.1)
+    assert monitor.restart_reason(os.getpid()) is None
+    monitor.number_of_checks = 100
+    assert monitor.restart_reason(os.getpid()) is not None
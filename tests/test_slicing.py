@@ -0,0 +1,92 @@
+import ast
+import libcst as cst
+from libcst.metadata import CodeRange
+from rule_based import FunctionLocationVisitor
+from slicing import build_module_slice
+
+SOURCE_CODE = """import os
+from typing import List
+
+Paths = List[str]
+print("side effect")
+
+
+def helper(a,
+           b): return a
+
+
+@decorator
+def load(path):
+    return helper(path, os.sep)
+
+
+class Reader:
+    def __init__(self, path):
+        self.path = path
+        self.lines: List[str] = []
+        print(path)
+
+    def read(self):
+        lines = self.path.split()
+        return lines
+"""
+
+
+def get_location(source_code: str, function: tuple) -> CodeRange:
+    visitor = FunctionLocationVisitor()
+    cst.MetadataWrapper(cst.parse_module(source_code)).visit(visitor)
+    return visitor.locations[function]
+
+
+def test_module_slice_keeps_context_and_stubs_other_functions():
+    module_slice = build_module_slice(
+        SOURCE_CODE, get_location(SOURCE_CODE, ("Reader", "read"))
+    )
+
+    assert module_slice.target == ("Reader", "read")
+    assert module_slice.code == (
+        "import os\n"
+        "from typing import List\n"
+        "Paths = List[str]\n"
+        "def helper(a,\n"
+        "           b): return a\n"
+        "@decorator\n"
+        "def load(path):\n"
+        "    ...\n"
+        "class Reader:\n"
+        "    def __init__(self, path):\n"
+        "        self.path = path\n"
+        "        self.lines: List[str] = []\n"
+        "    def read(self):\n"
+        "        lines = self.path.split()\n"
+        "        return lines\n"
+    )
+    ast.parse(module_slice.code)
+
+
+def test_module_slice_maps_the_location_of_the_target():
+    location = get_location(SOURCE_CODE, ("load",))
+    module_slice = build_module_slice(SOURCE_CODE, location)
+
+    lines = module_slice.code.splitlines()
+    assert lines[module_slice.location.start.line - 1] == "def load(path):"
+    assert (
+        lines[module_slice.location.end.line - 1] == "    return helper(path, os.sep)"
+    )
+    assert module_slice.location.start.column == location.start.column
+    assert module_slice.location.end.column == location.end.column
+
+
+def test_module_slice_of_a_function_with_its_body_on_the_signature_line():
+    source_code = "def g(a,\n      b): return a\n\n\ndef f(a):\n    return g(a, a)\n"
+    module_slice = build_module_slice(source_code, get_location(source_code, ("f",)))
+
+    assert module_slice.code == (
+        "def g(a,\n      b): return a\ndef f(a):\n    return g(a, a)\n"
+    )
+    ast.parse(module_slice.code)
+
+
+def test_module_slice_outside_of_functions():
+    assert build_module_slice(SOURCE_CODE, CodeRange((4, 0), (4, 17))) is None
+    assert build_module_slice("def f(:\n", CodeRange((1, 0), (1, 8))) is None
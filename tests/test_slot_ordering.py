@@ -0,0 +1,48 @@
+import libcst as cst
+from slot_ordering import build_call_graph, order_search_tree_layers
+
+
+SOURCE_CODE = """
+def main(a):
+    return helper(a) + Parser().parse(a)
+
+class Parser:
+    def __init__(self):
+        pass
+
+    def parse(self, text):
+        return helper(text)
+
+def helper(value):
+    return value
+"""
+
+
+def test_build_call_graph():
+    call_graph = build_call_graph(cst.parse_module(SOURCE_CODE))
+    assert call_graph == {
+        ("main",): {("helper",), ("Parser", "__init__"), ("Parser", "parse")},
+        ("Parser", "__init__"): set(),
+        ("Parser", "parse"): {("helper",)},
+        ("helper",): set(),
+    }
+
+
+def test_order_search_tree_layers_by_call_graph():
+    search_tree_layers = {
+        ("main", "a"): [["int", 0.9]],
+        ("main", "return"): [["int", 0.9]],
+        ("Parser", "parse", "text"): [["str", 0.5]],
+        ("helper", "value"): [["int", 0.4]],
+        ("helper", "return"): [["int", 0.8]],
+    }
+    ordered_layers = order_search_tree_layers(
+        search_tree_layers, cst.parse_module(SOURCE_CODE), "call-graph"
+    )
+    assert list(ordered_layers) == [
+        ("helper", "value"),
+        ("helper", "return"),
+        ("Parser", "parse", "text"),
+        ("main", "a"),
+        ("main", "return"),
+    ]